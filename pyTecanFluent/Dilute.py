@@ -13,6 +13,7 @@ import pandas as pd
 from pyTecanFluent import Utils
 from pyTecanFluent import Fluent
 from pyTecanFluent import Labware
+from pyTecanFluent import Runtime
 
 # functions
 def get_desc():
@@ -48,6 +49,12 @@ def parse_args(test_args=None, subparsers=None):
                          help='An excel or tab-delim file of concentrations')
     groupIO.add_argument('--prefix', type=str, default='TECAN_dilute',
                          help='Output file name prefix (default: %(default)s)')
+    groupIO.add_argument('--win', action='store_true', default=False,
+                         help='Write output files with Windows line breaks (CRLF)')
+    groupIO.add_argument('--runtime', action='store_true', default=False,
+                         help='Write an estimate of the robot run time (per stage & total)')
+    groupIO.add_argument('--time-model', type=str, default=None,
+                         help='JSON file of per-command times (seconds) for --runtime (default: the package time model)')
     
     ## concentration file
     conc = parser.add_argument_group('Concentation file')
@@ -149,18 +156,23 @@ def main(args=None):
     
     ## writing out worklist (gwl) file
     gwl_file = args.prefix + '.gwl'
-    gwl.write(gwl_file)
+    gwl.write(gwl_file, line_ending=Utils.line_ending(args.win))
+    if args.runtime:
+        runtime_file = os.path.splitext(gwl_file)[0] + '_runtime.txt'
+        Runtime.write_estimate(gwl, runtime_file, time_model=args.time_model,
+                               line_ending=Utils.line_ending(args.win))
+        Utils.file_written(runtime_file)
     
     # making labware table
     lw = Labware.labware()
     lw.add_gwl(gwl)
     lw_df = lw.table()
     lw_file = args.prefix + '_labware.txt'
-    lw_df.to_csv(lw_file, sep='\t', index=False)
+    Utils.write_table(lw_df, lw_file, line_ending=Utils.line_ending(args.win))
     
     # Writing conc. out table
     conc_file = args.prefix + '_conc.txt'
-    df_conc.round(2).to_csv(conc_file, sep='\t', index=False)
+    Utils.write_table(df_conc.round(2), conc_file, line_ending=Utils.line_ending(args.win))
 
     # status
     Utils.file_written(gwl_file)
@@ -415,18 +427,6 @@ def add_dest(df_conc, dest_name, dest_type,  dest_wells=96):
     # return
     return df_conc
 
-def reorder_384well(df, reorder_col):
-    """Reorder values so that the odd, then the even locations are
-    transferred. This is faster for a 384-well plate
-    df: pandas.DataFrame
-    reorder_col: column name to reorder
-    """
-    df['TECAN_sort_IS_EVEN'] = [x % 2 == 0 for x in df[reorder_col]]
-    df.sort_values(by=['TECAN_sort_IS_EVEN', reorder_col], inplace=True)
-    df = df.drop('TECAN_sort_IS_EVEN', 1)
-    df.index = range(df.shape[0])
-    return df
-
 def pip_dilutant(df_conc, gwl, src_labware_name, src_labware_type=None,
                  liq_cls='Water Free Single', reuse_tips=False):
     """Commands for aliquoting dilutant.
@@ -444,37 +444,26 @@ def pip_dilutant(df_conc, gwl, src_labware_name, src_labware_type=None,
         df_conc_tmp = df_conc.loc[x]
         if df_conc_tmp.shape[0] <= 0:
             continue
-        df_conc_tmp.reset_index(inplace=True)
         # for each sample, transfer aliquot via asp-disp
-        for i in range(df_conc_tmp.shape[0]):
-            # skipping no-volume
-            volume = round(df_conc_tmp.loc[i,'TECAN_dilutant_volume'], 2)
-            if volume <= 0.0:
-                continue        
-            # aspiration
-            asp = Fluent.Aspirate()
-            asp.RackLabel = src_labware_name
-            asp.RackType = src_labware_type
-            asp.Position = 1
-            asp.Volume = volume
-            asp.LiquidClass = liq_cls
-            gwl.add(asp)        
-            # dispensing
-            disp = Fluent.Dispense()
-            disp.RackLabel = df_conc_tmp.loc[i,'TECAN_dest_labware_name']
-            disp.RackType = df_conc_tmp.loc[i,'TECAN_dest_labware_type']        
-            disp.Position = df_conc_tmp.loc[i,'TECAN_dest_target_position']
-            disp.Volume = volume
-            disp.LiquidClass = liq_cls
-            gwl.add(disp)
-            # end
-            if reuse_tips is True:
-                gwl.add(Fluent.Flush())
-            else:
-                gwl.add(Fluent.Waste())
-        # waste
+        ## skipping no-volume
+        df_conc_tmp = df_conc_tmp.assign(TECAN_dilutant_volume =
+                                         df_conc_tmp['TECAN_dilutant_volume'].round(2))
+        df_conc_tmp = df_conc_tmp.loc[df_conc_tmp['TECAN_dilutant_volume'] > 0.0]
         if reuse_tips is True:
-            gwl.add(Fluent.Waste())        
+            n_tip_reuse = df_conc_tmp.shape[0]
+        else:
+            n_tip_reuse = 1
+        gwl.add_transfers(df_conc_tmp,
+                          src_labware_name=src_labware_name,
+                          src_labware_type=src_labware_type,
+                          src_target_position=1,
+                          dest_labware_name='TECAN_dest_labware_name',
+                          dest_labware_type='TECAN_dest_labware_type',
+                          dest_target_position='TECAN_dest_target_position',
+                          volume='TECAN_dilutant_volume',
+                          liq_cls=liq_cls,
+                          n_tip_reuse=n_tip_reuse,
+                          flush=reuse_tips)
     # adding break
     gwl.add(Fluent.Break())
 
@@ -484,30 +473,18 @@ def pip_samples(df_conc, gwl, liq_cls='Water Free Single'):
     gwl.add(Fluent.Comment('Samples'))
     
     # for each sample, transfer aliquot via asp-disp 
-    for i in range(df_conc.shape[0]):
-        # skipping no-volume
-        volume = round(df_conc.loc[i,'TECAN_sample_volume'], 2)
-        if volume <= 0:
-            continue        
-        # aspiration
-        asp = Fluent.Aspirate()
-        asp.RackLabel = df_conc.loc[i,'TECAN_labware_name']
-        asp.RackType = df_conc.loc[i,'TECAN_labware_type']
-        asp.Position = df_conc.loc[i,'TECAN_target_position']
-        asp.Volume = volume
-        asp.LiquidClass = liq_cls
-        gwl.add(asp)        
-        # dispensing
-        disp = Fluent.Dispense()
-        disp.RackLabel = df_conc.loc[i,'TECAN_dest_labware_name']
-        disp.RackType = df_conc.loc[i,'TECAN_dest_labware_type']        
-        disp.Position = df_conc.loc[i,'TECAN_dest_target_position']
-        disp.Volume = volume
-        disp.LiquidClass = liq_cls
-        gwl.add(disp)
-
-        # waste
-        gwl.add(Fluent.Waste())
+    ## skipping no-volume
+    df = df_conc.assign(TECAN_sample_volume = df_conc['TECAN_sample_volume'].round(2))
+    df = df.loc[df['TECAN_sample_volume'] > 0]
+    gwl.add_transfers(df,
+                      src_labware_name='TECAN_labware_name',
+                      src_labware_type='TECAN_labware_type',
+                      src_target_position='TECAN_target_position',
+                      dest_labware_name='TECAN_dest_labware_name',
+                      dest_labware_type='TECAN_dest_labware_type',
+                      dest_target_position='TECAN_dest_target_position',
+                      volume='TECAN_sample_volume',
+                      liq_cls=liq_cls)
 
 # main
 if __name__ == '__main__':
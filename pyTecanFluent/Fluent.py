@@ -5,10 +5,15 @@ import os
 import sys
 import re
 import json
+import bisect
+import operator
 import collections
 import pkg_resources
+from array import array
 import numpy as np
 import pandas as pd
+## package
+from pyTecanFluent import Labware
 
 
 #-- notes on gwl file format --#
@@ -23,35 +28,102 @@ def xstr(x):
     else:
         return x
 
+def compile_render(fields):
+    """Compiling a gwl line renderer for a command type.
+    fields : command object attributes, in gwl field order
+    Returns a function: command object => gwl line (None values are blank).
+    """
+    getter = operator.attrgetter(*fields)
+    def render(obj):
+        return ';'.join(['' if x is None else str(x) for x in getter(obj)])
+    return render
+
+def render_commands(commands, start=0, end=None, line_ending='\n'):
+    """Rendering a block of commands as gwl text (1 line per command).
+    commands : list of command objects or a `command_store`
+    start, end : slice of commands to render
+    line_ending : line break added to each command
+    """
+    if isinstance(commands, command_store):
+        lines = commands.render(start, end)
+    else:
+        lines = [x.cmd() for x in commands[start:end]]
+    if len(lines) == 0:
+        return ''
+    return line_ending.join(lines) + line_ending
+
+
+# shared (process-wide) database; loaded on first use
+_DATABASE = None
+_DB = None
+
+class frozendict(dict):
+    """Read-only dict used for the shared database tables
+    """
+    def _readonly(self, *args, **kwargs):
+        raise TypeError('Database tables are read-only')
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+def _freeze(x):
+    """Converting nested dicts/lists to read-only dicts/tuples
+    """
+    if isinstance(x, dict):
+        return frozendict({k:_freeze(v) for k,v in x.items()})
+    if isinstance(x, list):
+        return tuple(_freeze(v) for v in x)
+    return x
+
+def load_database():
+    """Loading the database JSON files just once per process.
+    All database objects share the same read-only tables.
+    Returns: dict of read-only tables (labware, tip_type, liquid_class, target_position)
+    """
+    global _DATABASE
+    if _DATABASE is not None:
+        return _DATABASE
+    database_dir = os.path.join(os.path.split(__file__)[0], 'database')
+    tables = {}
+    for x in ('labware', 'tip_type', 'liquid_class', 'target_position'):
+        f = os.path.join(database_dir, x + '.json')
+        with open(f) as inF:
+            tables[x] = json.load(inF)
+    # RackType stored with each labware entry (returned by db.get_labware)
+    for k,v in tables['labware'].items():
+        v['RackType'] = k
+    tables = {k:_freeze(v) for k,v in tables.items()}
+    tables['database_dir'] = database_dir
+    _DATABASE = tables
+    return _DATABASE
+
+def get_db():
+    """Getting the shared database object
+    """
+    global _DB
+    if _DB is None:
+        _DB = db()
+    return _DB
 
 class db(object):
     """Database of FluentControl labware, tip types, liquid classes, etc.
-    Database files are stored in JSON format
+    Database files are stored in JSON format.
+    The files are loaded just once per process (see `load_database`),
+    and the tables are read-only.
     """
     def __init__(self):
-        d = os.path.split(__file__)[0]
-        self.database_dir = os.path.join(d, 'database')
-        # labware
-        f = os.path.join(self.database_dir, 'labware.json')
-        with open(f) as inF:
-            self.labware = json.load(inF)
-        # tip type
-        f = os.path.join(self.database_dir, 'tip_type.json')
-        with open(f) as inF:
-            self.tip_type = json.load(inF)
-        # liquid class
-        f = os.path.join(self.database_dir, 'liquid_class.json')
-        with open(f) as inF:
-            self.liquid_class = json.load(inF)
+        tables = load_database()
+        self.database_dir = tables['database_dir']
+        self.labware = tables['labware']
+        self.tip_type = tables['tip_type']
+        self.liquid_class = tables['liquid_class']
+        self.target_position = tables['target_position']
 
     def RackTypes(self):
         return list(self.labware.keys())
             
     def get_labware(self, value):
         try:
-            d = self.labware[value]
-            d['RackType'] = value
-            return d
+            return self.labware[value]
         except KeyError:
             msg = 'Labware not in database: "{}"'
             raise KeyError(msg.format(value))
@@ -118,27 +190,333 @@ class db(object):
             raise KeyError(msg.format(value))            
         
         
+def _open_output(file_obj, line_ending=None):
+    """Opening output file (if file name provided).
+    If line_ending is provided, newlines are not translated on writing
+    (the line ending is written as-is).
+    """
+    if hasattr(file_obj, 'write'):
+        return file_obj
+    if line_ending is None:
+        return open(file_obj, 'w')
+    return open(file_obj, 'w', newline='')
+
+# numpy dtypes of the `command_store` array typecodes
+_ARRAY_DTYPES = {'b' : np.int8, 'i' : np.intc, 'd' : np.float64}
+
+class command_store(object):
+    """Columnar (struct-of-arrays) storage of gwl commands.
+    Used by `gwl(columnar=True)` in place of a list of command objects.
+    Asp/disp fields are stored as one typed array per field, with all
+    strings (eg., RackLabel, RackType, LiquidClass) interned in a single
+    string table. Waste, Flush, and Break commands are stored just by ID.
+    Other commands (eg., Comment, Reagent_distribution) are kept as objects.
+
+    The store acts like a (append-only) list of commands: iterating/indexing
+    returns newly created command objects, so editing these objects does
+    not alter the stored commands.
+    """
+    str_fields = ('RackLabel', 'RackID', 'RackType', 'TubeID',
+                  'LiquidClass', 'TipType', 'TipMask', 'ForceRackType')
+    # Volume value types (needed to write the same value as the object)
+    VOL_FLOAT = 0
+    VOL_INT = 1
+    VOL_NONE = 2
+    
+    def __init__(self):
+        self.strings = []
+        self._string_idx = {}
+        self.ID = array('b')
+        self.Position = array('i')
+        self.Volume = array('d')
+        self.VolumeType = array('b')
+        for x in self.str_fields:
+            setattr(self, x, array('i'))
+        self.objects = {}
+
+    def __len__(self):
+        return len(self.ID)
+
+    def __iter__(self):
+        for i in range(len(self.ID)):
+            yield self._command(i)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self.ID)
+        if i < 0 or i >= len(self.ID):
+            raise IndexError('Command index out of range')
+        return self._command(i)
+    
+    def intern(self, value):
+        """Getting the string table index for the value (-1 = None)
+        """
+        if value is None:
+            return -1
+        try:
+            return self._string_idx[value]
+        except KeyError:
+            self._string_idx[value] = len(self.strings)
+            self.strings.append(value)
+            return self._string_idx[value]
+
+    def string(self, idx):
+        """Getting the value for the string table index
+        """
+        if idx < 0:
+            return None
+        return self.strings[idx]
+        
+    def append(self, obj):
+        """Adding a command object to the store
+        """
+        if isinstance(obj, asp_disp):
+            self.ID.append(ord(obj._ID))
+            self.Position.append(obj.Position)
+            vol,vol_type = self._volume(obj.Volume)
+            self.Volume.append(vol)
+            self.VolumeType.append(vol_type)
+            for x in self.str_fields:
+                getattr(self, x).append(self.intern(getattr(obj, x)))
+            return None
+        # other commands
+        if isinstance(obj, (Waste, Flush, Break)):
+            self.ID.append(ord(obj.cmd()[0]))
+        else:
+            self.ID.append(0)
+            self.objects[len(self.ID) - 1] = obj
+        self.Position.append(0)
+        self.Volume.append(0.0)
+        self.VolumeType.append(self.VOL_NONE)
+        for x in self.str_fields:
+            getattr(self, x).append(-1)
+
+    def extend_transfers(self, asp, disp, waste, flush=False):
+        """Adding asp-disp transfers in bulk (see `gwl._append_transfers`)
+        asp, disp : dict of field => list of values (1 value per transfer)
+        waste : boolean array; add a Waste command after the transfer?
+        flush : add a Flush command after each transfer
+        """
+        n = len(waste)
+        # commands per transfer: [A, D, F, W]; unused slots are dropped
+        keep = np.ones((n, 4), dtype=bool)
+        keep[:,2] = flush is True
+        keep[:,3] = waste
+        keep = keep.ravel()
+        def _extend(arr, a, d, other):
+            x = np.empty((n, 4), dtype=_ARRAY_DTYPES[arr.typecode])
+            x[:,0] = a
+            x[:,1] = d
+            x[:,2:] = other
+            arr.frombytes(x.ravel()[keep].tobytes())
+        _extend(self.ID, ord('A'), ord('D'), [ord('F'), ord('W')])
+        _extend(self.Position, asp['Position'], disp['Position'], 0)
+        # volumes (same value types as the command objects)
+        vols,vol_types = self._volumes(asp['Volume'])
+        if disp['Volume'] is asp['Volume']:
+            d_vols,d_vol_types = vols,vol_types
+        else:
+            d_vols,d_vol_types = self._volumes(disp['Volume'])
+        _extend(self.Volume, vols, d_vols, 0.0)
+        _extend(self.VolumeType, vol_types, d_vol_types, self.VOL_NONE)
+        # strings
+        for x in self.str_fields:
+            a = self._intern_values(asp[x]) if x in asp else -1
+            d = self._intern_values(disp[x]) if x in disp else -1
+            _extend(getattr(self, x), a, d, -1)
+
+    def _intern_values(self, values):
+        """String table indexes for a list of values (see `intern`)
+        """
+        codes,uniques = pd.factorize(np.asarray(values, dtype=object))
+        idx = np.array([self.intern(x) for x in uniques] + [-1], dtype=np.int64)
+        return idx[codes]
+
+    def _volumes(self, values):
+        """Stored volumes & volume types for a list of volume values
+        """
+        vols = np.empty(len(values), dtype=object)
+        vols[:] = values
+        # volume type of each value type
+        codes,_ = pd.factorize(np.array(list(map(type, values)), dtype=object))
+        first = np.unique(codes, return_index=True)[1]
+        types = np.array([self._volume(vols[i])[1] for i in first], dtype=np.int64)[codes]
+        vols[types == self.VOL_NONE] = 0.0
+        return vols.astype(np.float64), types
+
+    def _volume(self, value):
+        """Stored volume & volume type for a volume value
+        """
+        if value is None:
+            return 0.0, self.VOL_NONE
+        elif isinstance(value, (int, np.integer)):
+            return value, self.VOL_INT
+        return float(value), self.VOL_FLOAT
+
+    def get_volume(self, i):
+        """Getting the volume of the command (same value type as added)
+        """
+        vol_type = self.VolumeType[i]
+        if vol_type == self.VOL_NONE:
+            return None
+        elif vol_type == self.VOL_INT:
+            return int(self.Volume[i])
+        return self.Volume[i]
+        
+    def render(self, start=0, end=None):
+        """Rendering commands as gwl lines without creating command objects.
+        The asp/disp lines are built from the field arrays in bulk.
+        """
+        start, end, _ = slice(start, end).indices(len(self.ID))
+        if end <= start:
+            return []
+        ID = np.frombuffer(self.ID, dtype=np.int8)[start:end]
+        lines = np.empty(end - start, dtype=object)
+        # other commands
+        for i in np.flatnonzero(ID == 0):
+            lines[i] = self.objects[start + i].cmd()
+        for x in set(ID.tolist()) - set([0, ord('A'), ord('D')]):
+            lines[ID == x] = chr(x) + ';'
+        # asp/disp commands
+        ad = np.flatnonzero((ID == ord('A')) | (ID == ord('D')))
+        if len(ad) == 0:
+            return lines.tolist()
+        idx = ad + start
+        # string table as rendered strings; index -1 (None) => blank
+        strs = np.array([str(x) for x in self.strings] + [''], dtype=object)
+        def _strs(field):
+            return strs[np.frombuffer(getattr(self, field), dtype=np.intc)[idx]]
+        def _nums(values):
+            x = np.empty(len(values), dtype=object)
+            x[:] = list(map(str, values.tolist()))
+            return x
+        vol_type = np.frombuffer(self.VolumeType, dtype=np.int8)[idx]
+        vols = np.frombuffer(self.Volume, dtype=np.float64)[idx]
+        vol = np.full(len(idx), '', dtype=object)
+        is_int = vol_type == self.VOL_INT
+        vol[is_int] = _nums(vols[is_int].astype(np.int64))
+        is_float = vol_type == self.VOL_FLOAT
+        vol[is_float] = _nums(vols[is_float])
+        x = np.where(ID[ad] == ord('A'), 'A;', 'D;').astype(object)
+        x = x + _strs('RackLabel') + ';' + _strs('RackID') + ';' + _strs('RackType')
+        x = x + ';' + _nums(np.frombuffer(self.Position, dtype=np.intc)[idx])
+        x = x + ';' + _strs('TubeID') + ';' + vol + ';' + _strs('LiquidClass')
+        x = x + ';' + _strs('TipType') + ';' + _strs('TipMask') + ';' + _strs('ForceRackType')
+        lines[ad] = x
+        return lines.tolist()
+
+    def _command(self, i):
+        """Creating the command object for the index
+        """
+        ID = self.ID[i]
+        if ID == 0:
+            return self.objects[i]
+        ID = chr(ID)
+        if ID == 'A':
+            obj = Aspirate()
+        elif ID == 'D':
+            obj = Dispense()
+        elif ID == 'W':
+            return Waste()
+        elif ID == 'F':
+            return Flush()
+        elif ID == 'B':
+            return Break()
+        else:
+            raise ValueError('Command ID not recognized: "{}"'.format(ID))
+        for x in self.str_fields:
+            setattr(obj, x, self.string(getattr(self, x)[i]))
+        obj.Position = self.Position[i]
+        obj.Volume = self.get_volume(i)
+        return obj
+
+        
+def _transfer_command(obj, fields, i):
+    """Setting the fields of an asp/disp command object to the i-th values
+    """
+    for k,v in fields.items():
+        setattr(obj, k, v[i])
+    return obj
+
+def _transfer_commands(asp, disp, waste, flush=False):
+    """Generating command objects for asp-disp transfers (see `gwl._append_transfers`)
+    """
+    for i in range(len(waste)):
+        yield _transfer_command(Aspirate(), asp, i)
+        yield _transfer_command(Dispense(), disp, i)
+        if flush is True:
+            yield Flush()
+        if waste[i]:
+            yield Waste()
+        
 class gwl(object):
-    """Class for storing gwl commands
+    """Class for storing gwl commands.
+    columnar : store commands in a `command_store` instead of a list of
+               command objects (much less memory for large worklists)
+    stream : output file name or file handle. If provided, commands are
+             written to the output (in chunks of `buffer_size` commands)
+             as they are added, instead of being stored.
+             Call `write()` to write out any remaining commands.
+    line_ending : line break used for streaming output (None = '\\n' with
+                  the platform default newline translation)
+    mca : use the 96-channel (MCA96) head for whole-plate transfers found
+          by `add_transfers` (see `MCA_transfer`)
+    MCA_TipTypes : tip types for the MCA96 head (default: all MCA96 tips)
+    Labware & tip usage is tallied as commands are added (see `labware`).
     """
-    def __init__(self, TipTypes=None):
-        self.db = db()
+    def __init__(self, TipTypes=None, columnar=False, stream=None, buffer_size=1000,
+                 line_ending=None, mca=False, MCA_TipTypes=None):
+        self.db = get_db()
         self.TipTypes = TipTypes
         self.last_asp = None
-        self.commands = []
+        # MCA96 head
+        self.mca = mca
+        if MCA_TipTypes is None:
+            MCA_TipTypes = [x for x in self.db.tip_type if x.startswith('MCA96')]
+        self.MCA_TipTypes = MCA_TipTypes
+        self.mca_commands = []
+        self._clear(columnar)
+        # per-RackType flags (from the database)
+        self._is_tube = {}
+        # streaming output
+        self.buffer_size = buffer_size
+        self._buffer = []
+        self._outF = None
+        self._line_ending = line_ending
+        if stream is not None:
+            self._outF = _open_output(stream, line_ending)
+
+    def _clear(self, columnar=False):
+        """Removing all commands (and resetting labware/tip tallies & indexes)
+        """
+        if columnar is True:
+            self.commands = command_store()
+        else:
+            self.commands = []
+        # labware & tip usage (MCA96 commands are kept)
+        self.labware = Labware.labware()
+        for x in self.mca_commands:
+            self.labware.add_command(x, self.db)
+        # asp/disp indexes: RackType => RackLabels; RackLabel => command offsets
+        self._n_commands = 0
+        self._RackType_labels = {}
+        self._RackLabel_offsets = {}
 
     def add(self, obj, default_liq_cls='Water Free Single'):
         """Adding gwl commands ('obj') to list of commands.
         A TipType will be added, but this is just used for counting tips later on
+        MCA96 commands (`MCA_transfer`) are not written to the gwl file
+        (see `add_mca`).
         """
+        if isinstance(obj, MCA_transfer):
+            self.add_mca(obj)
+            return None
         # assertions
         ## check values for asp/disp commands
         if isinstance(obj, Aspirate) or isinstance(obj, Dispense):
-            assert obj.RackType is not None
-            # check that RackType is in database
-            labware = self.db.get_labware(obj.RackType)
+            assert obj.RackType is not None, 'RackType cannot be None'
             # check that tubes have target_position of 1 (only 1 position per tube)
-            if 'eppendorf' in set(labware['target_location']) and int(obj.Position) != 1:
+            if self.is_tube(obj.RackType) and int(obj.Position) != 1:
                 obj.Position = 1
                 
             # check that liquid class is in database (or use default)
@@ -153,46 +531,478 @@ class gwl(object):
             obj.TipType = self.set_TipType(obj.volume_per_aspirate())
         # dispense must have same liquid class as previous aspirate
         if isinstance(obj, Dispense):
-            assert self.last_asp is not None
+            assert self.last_asp is not None, 'Dispense without a preceding aspirate'
             obj.LiquidClass = self.last_asp.LiquidClass
                         
         # appending to list of commands
-        self.commands.append(obj)
+        self._append(obj)
 
-    def write(self, file_obj):
-        """Writing out gwl file.
-        Commands written in the order of addition
+    def _append(self, obj):
+        """Appending a command to the list of commands (or to the output buffer
+        if streaming) and tallying the labware & tips used.
+        """
+        self.labware.add_command(obj, self.db)
+        self._index(obj)
+        if self._outF is None:
+            self.commands.append(obj)
+        else:
+            self._buffer.append(obj.cmd())
+            if len(self._buffer) >= self.buffer_size:
+                self._flush()
+
+    def _append_transfers(self, asp, disp, waste, flush=False):
+        """Appending asp-disp transfers in bulk (see `add_transfers`).
+        The commands are the same as appending each command with `_append`:
+        [Aspirate, Dispense, (Flush), (Waste)] per transfer.
+        asp, disp : dict of field => list of values (1 value per transfer)
+        waste : boolean array; add a Waste command after the transfer?
+        flush : add a Flush command after each transfer
+        """
+        n = len(waste)
+        # command offsets of each transfer
+        size = 2 + int(flush) + waste.astype(np.int64)
+        start = self._n_commands + np.concatenate([[0], np.cumsum(size)[:-1]])
+        # labware & tips
+        self.labware.add_transfers(asp, disp, waste, self.db)
+        # indexes
+        labels = np.empty(2 * n, dtype=object)
+        labels[0::2] = asp['RackLabel']
+        labels[1::2] = disp['RackLabel']
+        types = np.empty(2 * n, dtype=object)
+        types[0::2] = asp['RackType']
+        types[1::2] = disp['RackType']
+        offsets = np.empty(2 * n, dtype=np.int64)
+        offsets[0::2] = start
+        offsets[1::2] = start + 1
+        for RackType,RackLabel in dict.fromkeys(zip(types, labels)):
+            try:
+                self._RackType_labels[RackType][RackLabel] = 1
+            except KeyError:
+                self._RackType_labels[RackType] = {RackLabel : 1}
+        # command offsets (not kept if streaming; see `RackLabel_offsets`)
+        for RackLabel,idx in pd.Series(offsets).groupby(labels, sort=False).indices.items():
+            if self._outF is not None:
+                break
+            try:
+                self._RackLabel_offsets[RackLabel].extend(offsets[idx].tolist())
+            except KeyError:
+                self._RackLabel_offsets[RackLabel] = array('i', offsets[idx].tolist())
+        self._n_commands += int(size.sum())
+        # commands
+        if self._outF is None and isinstance(self.commands, command_store):
+            self.commands.extend_transfers(asp, disp, waste, flush)
+        else:
+            for obj in _transfer_commands(asp, disp, waste, flush):
+                if self._outF is None:
+                    self.commands.append(obj)
+                else:
+                    self._buffer.append(obj.cmd())
+                    if len(self._buffer) >= self.buffer_size:
+                        self._flush()
+        self.last_asp = _transfer_command(Aspirate(), asp, n - 1)
+        
+    def _index(self, obj):
+        """Adding the command to the RackType/RackLabel indexes
+        """
+        if isinstance(obj, asp_disp):
+            try:
+                self._RackType_labels[obj.RackType][obj.RackLabel] = 1
+            except KeyError:
+                self._RackType_labels[obj.RackType] = {obj.RackLabel : 1}
+            if self._outF is None:
+                try:
+                    self._RackLabel_offsets[obj.RackLabel].append(self._n_commands)
+                except KeyError:
+                    self._RackLabel_offsets[obj.RackLabel] = array('i', [self._n_commands])
+        self._n_commands += 1
+
+    def is_tube(self, RackType):
+        """Is the labware type a tube (only 1 position)? Cached per RackType.
+        Raises a KeyError if the RackType is not in the database.
         """
         try:
-            outF = open(file_obj, 'w')
-        except IOError:
-            outF = file_obj
-            
-        for x in self.commands:
-            outF.write(x.cmd() + '\n')
+            return self._is_tube[RackType]
+        except KeyError:
+            labware = self.db.get_labware(RackType)
+            self._is_tube[RackType] = 'eppendorf' in set(labware['target_location'])
+            return self._is_tube[RackType]
+
+    def _flush(self):
+        """Writing buffered commands to the output stream
+        """
+        if len(self._buffer) > 0:
+            line_ending = self._line_ending or '\n'
+            self._outF.write(line_ending.join(self._buffer) + line_ending)
+        self._buffer = []
+
+    def add_transfers(self, df, src_labware_name, src_labware_type,
+                      src_target_position, dest_labware_name,
+                      dest_labware_type, dest_target_position, volume,
+                      liq_cls='Water Free Single', n_tip_reuse=1, flush=False,
+                      n_channels=None):
+        """Adding asp-disp commands for all transfers (rows) in a pandas dataframe.
+        Each labware/position/volume/liquid class parameter can either be
+        a column name in `df` or a single value used for all transfers.
+        Labware types, liquid classes, and tip types are checked just once
+        per unique value (instead of once per transfer).
+        n_tip_reuse : tip is sent to waste after every n-th transfer (and the last)
+        flush : add a Flush command after each transfer
+        n_channels : if provided, transfers are "stamped" with parallel FCA
+                     channels: transfers in column-aligned wells of the source
+                     & destination plates are added as blocks of up to
+                     n_channels transfers (see `schedule_channels`); other
+                     transfers are added individually.
+                     Only for single-tip transfers (n_tip_reuse=1; no flush).
+        """
+        if n_channels is not None and (n_tip_reuse != 1 or flush is True):
+            msg = 'Channel stamping requires n_tip_reuse=1 and flush=False'
+            raise ValueError(msg)
+        n = df.shape[0]
+        if n <= 0:
+            return None
+        def _values(x):
+            if isinstance(x, str) and x in df.columns:
+                return df[x].tolist()
+            return [x] * n
+        src_names = _values(src_labware_name)
+        src_types = _values(src_labware_type)
+        src_pos = _values(src_target_position)
+        dest_names = _values(dest_labware_name)
+        dest_types = _values(dest_labware_type)
+        dest_pos = _values(dest_target_position)
+        volumes = _values(volume)
+        liq_clss = _values(liq_cls)
+
+        # checking labware & liquid classes
+        is_tube = {}
+        for RackType in set(src_types) | set(dest_types):
+            assert RackType is not None
+            # tubes have only 1 position
+            is_tube[RackType] = self.is_tube(RackType)
+        for x in set(liq_clss):
+            self.db.get_liquid_class(x)
+        # tip types for each volume + source labware type
+        tip_types = self.set_TipTypes(volumes, src_types)
+
+        # adding commands in bulk (no MCA96 stamps or channel blocks)
+        if self.mca is not True and n_channels is None:
+            asp = {'RackLabel' : src_names,
+                   'RackType' : src_types,
+                   'Position' : [1 if is_tube[x] else int(y) for x,y in zip(src_types, src_pos)],
+                   'Volume' : volumes,
+                   'LiquidClass' : liq_clss,
+                   'TipType' : tip_types.tolist()}
+            disp = {'RackLabel' : dest_names,
+                    'RackType' : dest_types,
+                    'Position' : [1 if is_tube[x] else int(y) for x,y in zip(dest_types, dest_pos)],
+                    'Volume' : volumes,
+                    'LiquidClass' : liq_clss}
+            waste = np.arange(1, n + 1) % n_tip_reuse == 0
+            waste[-1] = True
+            self._append_transfers(asp, disp, waste, flush)
+            return None
+        pairs = []
+        for i in range(n):
+            # aspiration
+            asp = Aspirate()
+            asp.RackLabel = src_names[i]
+            asp.RackType = src_types[i]
+            asp.Position = 1 if is_tube[src_types[i]] else src_pos[i]
+            asp.Volume = volumes[i]
+            asp.LiquidClass = liq_clss[i]
+            asp.TipType = tip_types[i]
+            # dispensing
+            disp = Dispense()
+            disp.RackLabel = dest_names[i]
+            disp.RackType = dest_types[i]
+            disp.Position = 1 if is_tube[dest_types[i]] else dest_pos[i]
+            disp.Volume = volumes[i]
+            disp.LiquidClass = liq_clss[i]
+            pairs.append((asp, disp))
+        self.last_asp = asp
+        # transfers can be reordered if no well is both a source & destination
+        sources = set([(x.RackLabel, x.Position) for x,y in pairs])
+        dests = set([(y.RackLabel, y.Position) for x,y in pairs])
+        reorder = len(sources & dests) == 0
+        # whole-plate MCA96 stamps
+        if self.mca is True and reorder is True:
+            pairs = self._add_mca_stamps(pairs)
+            n = len(pairs)
+        # channel blocks
+        if n_channels is not None and reorder is True:
+            self._add_channel_blocks(pairs, n_channels)
+            return None
+        for i,(asp,disp) in enumerate(pairs):
+            self._append(asp)
+            self._append(disp)
+            # tip flush/waste
+            if flush is True:
+                self._append(Flush())
+            if (i + 1) % n_tip_reuse == 0 or i + 1 == n:
+                self._append(Waste())
+
+    def _add_mca_stamps(self, pairs):
+        """Adding MCA96 commands for all whole-plate transfers (see `_mca_stamps`).
+        pairs : list of (asp, disp) pairs
+        Returns: list of (asp, disp) pairs not transferred with the MCA96 head
+        """
+        stamped = set()
+        for idx,quadrant in _mca_stamps(pairs, self.db):
+            asp,disp = pairs[idx[0]]
+            try:
+                TipType = self.set_MCA_TipType(asp.Volume)
+            except ValueError:
+                # volume too large for the MCA96 tips
+                continue
+            mca = MCA_transfer()
+            mca.SrcRackLabel = asp.RackLabel
+            mca.SrcRackType = asp.RackType
+            mca.DestRackLabel = disp.RackLabel
+            mca.DestRackType = disp.RackType
+            mca.DestQuadrant = quadrant
+            mca.Volume = asp.Volume
+            mca.LiquidClass = asp.LiquidClass
+            mca.TipType = TipType
+            self.add_mca(mca)
+            stamped.update(idx)
+        return [x for i,x in enumerate(pairs) if i not in stamped]
+
+    def add_mca(self, obj):
+        """Adding an MCA96 command (`MCA_transfer`).
+        FluentControl worklists do not support the MCA96 head, so MCA96
+        commands are stored in `mca_commands` (see `mca_table`), and a comment
+        is added to the gwl commands to mark when the MCA96 step is conducted.
+        """
+        assert obj.SrcRackType is not None, 'SrcRackType cannot be None'
+        assert obj.DestRackType is not None, 'DestRackType cannot be None'
+        if self.LiquidClass_exists(obj.LiquidClass) is False:
+            msg = 'Liquid class does not exist: "{}"'
+            raise KeyError(msg.format(obj.LiquidClass))
+        if obj.DestQuadrant not in (1, 2, 3, 4):
+            msg = 'DestQuadrant must be 1-4, not: {}'
+            raise ValueError(msg.format(obj.DestQuadrant))
+        if obj.TipType is None:
+            obj.TipType = self.set_MCA_TipType(obj.Volume)
+        self.mca_commands.append(obj)
+        self.labware.add_command(obj, self.db)
+        msg = 'MCA96 step {}: {} => {} (quadrant {})'
+        self._append(Comment(msg.format(len(self.mca_commands), obj.SrcRackLabel,
+                                        obj.DestRackLabel, obj.DestQuadrant)))
+
+    def mca_table(self):
+        """Creating pandas dataframe of the MCA96 commands (in order of addition)
+        """
+        cols = ['Step'] + MCA_transfer.key_order
+        df = [[i + 1] + [getattr(x, y) for y in MCA_transfer.key_order]
+              for i,x in enumerate(self.mca_commands)]
+        return pd.DataFrame(df, columns=cols)
+
+    def _add_channel_blocks(self, pairs, n_channels):
+        """Adding single-tip transfers as blocks of parallel FCA channels
+        (see `schedule_channels`).
+        pairs : list of (asp, disp) pairs
+        Returns: number of parallel blocks (>1 transfer)
+        """
+        n_blocks = 0
+        for block in _channel_blocks(pairs, n_channels, self.db):
+            if len(block) > 1:
+                n_blocks += 1
+                for channel,(asp,disp) in block.items():
+                    asp.TipMask = disp.TipMask = 1 << channel
+            channels = sorted(block.keys())
+            for x in channels:
+                self._append(block[x][0])
+            for x in channels:
+                self._append(block[x][1])
+            self._append(Waste())
+        return n_blocks
+        
+    def optimize_multi_disp(self, n_multi_disp=6, reagent_distribution=False,
+                            disp_frac=0.9):
+        """Peephole optimization of the commands: rewriting runs of single
+        asp-disp transfers from the same source (eg., water from a trough)
+        into 1-asp-multi-disp blocks, which removes most tip pickups and
+        trips to the source.
+        A run is "A;D;[W;]" repeated, with the same source (labware, position &
+        liquid class) and the same asp & disp volume, ending with "W;".
+        Constraints:
+          * the liquid class must be a "Free" (no contact) "Single" class
+            with a "Multi" version in the database (used for the rewrite)
+          * the volume per aspirate must be < the max TipType DTH volume
+        n_multi_disp : max number of dispenses per aspirate
+        reagent_distribution : rewrite as a "R;" command if all dispenses of
+                               the run are the same volume into different
+                               wells of the same labware (the excess volume
+                               of "R;" commands is set by the liquid class)
+        disp_frac : aspirate volume = total dispense volume * (2 - disp_frac),
+                    as for `multi_disp`, so the last dispense of each
+                    aspirate does not depend on emptying the tip
+        Returns: number of runs rewritten
+        """
+        if self._outF is not None:
+            raise ValueError('Commands cannot be optimized when streaming')
+        if len(self._DTH_ladder) == 0:
+            raise ValueError('TipTypes must be set to optimize commands')
+        max_volume = self._DTH_ladder[-1]
+        commands = list(self.commands)
+        # rewriting runs
+        new_commands = []
+        n_runs = 0
+        i = 0
+        while i < len(commands):
+            end,pairs = _single_source_run(commands, i)
+            cmds = None
+            if len(pairs) > 1:
+                cmds = _multi_disp_run(pairs, max_volume, n_multi_disp,
+                                       reagent_distribution, self.db,
+                                       disp_frac=disp_frac)
+            if cmds is None:
+                new_commands.append(commands[i])
+                i += 1
+                continue
+            new_commands += cmds
+            n_runs += 1
+            i = end
+        self._rebuild(new_commands)
+        return n_runs
+
+    def schedule_channels(self, n_channels=8):
+        """Scheduling single-tip transfers for parallel FCA channels.
+        Runs of "A;D;W;" transfers (1 tip per transfer) are packed into blocks
+        of up to `n_channels` transfers that can be conducted simultaneously
+        by the FCA arm (channels spaced at 9 mm). Each transfer of a block is
+        assigned a TipMask (channel), and the block is written as all
+        aspirates, then all dispenses, then 1 waste ("W;").
+        Channel compatibility:
+          * 96-well plates (9 mm pitch): 1 row per channel (same column)
+          * 384-well plates (4.5 mm pitch): every other row (same column)
+          * troughs: any channel
+          * other labware (eg., tubes): no parallel transfers
+        Transfers in a block share the same source & destination labware,
+        liquid class, and TipType. Transfers are only reordered within a run
+        without any well being both a source & a destination.
+        n_channels : number of FCA channels
+        Returns: number of parallel blocks (>1 transfer)
+        """
+        if self._outF is not None:
+            raise ValueError('Commands cannot be scheduled when streaming')
+        commands = list(self.commands)
+        # scheduling runs
+        new_commands = []
+        n_blocks = 0
+        i = 0
+        while i < len(commands):
+            end,transfers = _single_tip_run(commands, i)
+            if len(transfers) < 2:
+                new_commands.append(commands[i])
+                i += 1
+                continue
+            new_commands.append(transfers)
+            i = end
+        # re-adding commands
+        self._clear(isinstance(self.commands, command_store))
+        for x in new_commands:
+            if isinstance(x, list):
+                n_blocks += self._add_channel_blocks(x, n_channels)
+            else:
+                self._append(x)
+        return n_blocks
+
+    def _rebuild(self, commands):
+        """Replacing all commands (re-tallies labware/tips & re-indexes)
+        """
+        # tip types are set before clearing (the commands are kept on errors)
+        tip_types = []
+        for obj in commands:
+            if isinstance(obj, Aspirate):
+                tip_types.append(self.set_TipType(obj.Volume, obj.RackType))
+            elif isinstance(obj, Reagent_distribution):
+                tip_types.append(self.set_TipType(obj.volume_per_aspirate()))
+        tip_types = iter(tip_types)
+        self._clear(isinstance(self.commands, command_store))
+        for obj in commands:
+            if isinstance(obj, (Aspirate, Reagent_distribution)):
+                obj.TipType = next(tip_types)
+            self._append(obj)
+
+    def write(self, file_obj=None, line_ending=None):
+        """Writing out gwl file.
+        Commands written in the order of addition.
+        line_ending : line break for each command (eg., '\\r\\n' for windows).
+                      None = '\\n' with the platform default newline translation.
+        If streaming, the remaining buffered commands are written
+        and the output stream is closed (`file_obj` & `line_ending` are not used).
+        """
+        if self._outF is not None:
+            self._flush()
+            self._outF.close()
+            return None
+        
+        outF = _open_output(file_obj, line_ending)
+        for i in range(0, len(self.commands), self.buffer_size):
+            outF.write(render_commands(self.commands, i, i + self.buffer_size,
+                                       line_ending=line_ending or '\n'))
         outF.close()
         
     def set_TipType(self, volume, racktype=None):
         """Setting which tip will be used.
-        Tip selection based on dynamic tip handling (DTH) volume specified in the database
+        Tip selection based on dynamic tip handling (DTH) volume specified in the database.
+        The DTH ladder is pre-computed when TipTypes is set (see `TipTypes`).
         """
         volume = float(volume)
 
         # check if racktype has min-volume tip
         ## if yes, set volume to that, which sets tip type
         if racktype is not None:
-            tip_sizes = self.db.get_labware_allowed_tips(racktype)
-            if tip_sizes is not None and min(tip_sizes) > volume:
-                volume = min(tip_sizes) * 0.75    # WARNING: 0.75 is a hack!
+            min_tip = self._min_tip_volumes.get(racktype)
+            if min_tip is not None and min_tip > volume:
+                volume = min_tip * 0.75    # WARNING: 0.75 is a hack!
 
         # setting tip type
         assert self.TipTypes is not None
-        func = lambda x: (x[1]['DTH'],x[0])
-        for k,v in sorted(self.TipTypes.items(), key=func):
-            if v['DTH'] - volume > 0:
-                return k            
-        msg = 'No TipType DTH value greater than {}'
-        raise ValueError(msg.format(volume))
+        i = bisect.bisect_right(self._DTH_ladder, volume)
+        if i >= len(self._DTH_ladder) or volume != volume:
+            msg = 'No TipType DTH value greater than {}'
+            raise ValueError(msg.format(volume))
+        return self._TipType_ladder[i]
+
+    def set_MCA_TipType(self, volume):
+        """Setting which MCA96 tip will be used (smallest tip with a
+        DTH volume greater than `volume`).
+        """
+        volume = float(volume)
+        ladder = sorted([(self.db.get_tip_DTH_volume(x), x) for x in self.MCA_TipTypes])
+        i = bisect.bisect_right([x[0] for x in ladder], volume)
+        if i >= len(ladder) or volume != volume:
+            msg = 'No MCA96 TipType DTH value greater than {}'
+            raise ValueError(msg.format(volume))
+        return ladder[i][1]
+
+    def set_TipTypes(self, volumes, racktypes=None):
+        """Setting which tip will be used for each volume (array form of `set_TipType`).
+        volumes : array-like of volumes
+        racktypes : array-like of RackTypes (same length as volumes), a single RackType, or None
+        Returns: numpy array of TipTypes
+        """
+        volumes = np.asarray(volumes, dtype=float)
+        assert self.TipTypes is not None
+
+        # min-volume tips for racktypes
+        if racktypes is not None:
+            if isinstance(racktypes, str):
+                racktypes = [racktypes] * len(volumes)
+            codes,uniques = pd.factorize(np.asarray(racktypes, dtype=object))
+            min_tips = np.array([self._min_tip_volumes.get(x, np.nan) for x in uniques] + [np.nan],
+                                dtype=float)[codes]
+            volumes = np.where(min_tips > volumes, min_tips * 0.75, volumes)
+
+        # setting tip types
+        idx = np.searchsorted(self._DTH_ladder, volumes, side='right')
+        bad = (idx >= len(self._DTH_ladder)) | np.isnan(volumes)
+        if bad.any():
+            msg = 'No TipType DTH value greater than {}'
+            raise ValueError(msg.format(volumes[bad][0]))
+        return np.array(self._TipType_ladder, dtype=object)[idx]
             
     def TipType_exists(self, volume, warn=False):
         """Does TipType exist?
@@ -217,17 +1027,20 @@ class gwl(object):
     def RackType_count(self, RackType):
         """Counting labware with same RackType (different RackLabel, same RackType)
         """
-        cnt = {}
-        for x in self.commands:
-            # getting possible target locations for RackType
-            try:
-                cmd_RackLabel = x.RackLabel
-                cmd_RackType = x.RackType
-            except AttributeError:
-                continue
-            if RackType == cmd_RackType:
-                cnt[cmd_RackLabel] = 1
-        return len(cnt.keys())
+        return len(self._RackType_labels.get(RackType, {}))
+
+    def RackLabels(self, RackType):
+        """RackLabels (in order of addition) of asp/disp commands with the RackType
+        """
+        return list(self._RackType_labels.get(RackType, {}).keys())
+
+    def RackLabel_offsets(self, RackLabel):
+        """Offsets (in the list of commands) of all asp/disp commands with the RackLabel.
+        The offsets are not indexed when streaming (flat memory use).
+        """
+        if self._outF is not None:
+            raise ValueError('Command offsets are not indexed when streaming')
+        return list(self._RackLabel_offsets.get(RackLabel, []))
                 
     def LiquidClass_exists(self, liquid_class, warn=False):
         """Check that liquid class exists in the database.
@@ -257,6 +1070,17 @@ class gwl(object):
         else:
             types = [x for x in types if x is not None]  
             self._TipTypes = {x:self.db.get_tip_type(x) for x in types}
+        # tip selection ladder (TipTypes ordered by DTH volume)
+        func = lambda x: (x[1]['DTH'],x[0])
+        ladder = sorted((self._TipTypes or {}).items(), key=func)
+        self._TipType_ladder = [k for k,v in ladder]
+        self._DTH_ladder = [v['DTH'] for k,v in ladder]
+        # min-volume tip for each labware type (if any)
+        self._min_tip_volumes = {}
+        for RackType,v in self.db.labware.items():
+            tip_sizes = v.get('allowed_tips')
+            if tip_sizes is not None:
+                self._min_tip_volumes[RackType] = min(tip_sizes)
                 
 class asp_disp(object):
     """Commands for aliquoting mastermix
@@ -272,12 +1096,18 @@ class asp_disp(object):
     TipMask
     ForceRackType
     """
+    field_order = ['_ID',
+                   'RackLabel', 'RackID', 'RackType',
+                   'Position', 'TubeID', 'Volume',
+                   'LiquidClass', 'TipType', 'TipMask',
+                   'ForceRackType']
+    _render = staticmethod(compile_render(field_order))
+    
     def __init__(self, RackLabel=None, RackID=None, RackType=None,
                  Position=1, TubeID=None, Volume=None,
                  LiquidClass = 'Water Free Single', TipType=None,
                  TipMask=None, ForceRack=None):
         self._ID = ''
-        self.db = db()
         # aspirate parameters
         self.RackLabel = RackLabel
         self.RackID = RackID
@@ -289,24 +1119,16 @@ class asp_disp(object):
         self.TipType = TipType        # doesn't actually work!
         self.TipMask = TipMask
         self.ForceRackType = ForceRack
-        self.field_order = ['_ID',
-                            'RackLabel', 'RackID', 'RackType',
-                            'Position', 'TubeID', 'Volume',
-                            'LiquidClass', 'TipType', 'TipMask',
-                            'ForceRackType']
         
     def cmd(self):
         # assertions
         assert self.RackLabel is not None, 'RackLabel cannot be None'
         assert self.RackType is not None, 'RackType cannot be None'
-        # list of values in correct order
-        vals = [getattr(self, x) for x in self.field_order]
-        # None to blank string
-        vals = [xstr(x) for x in vals]
-        # convert all to strings
-        vals = [str(x) for x in vals]
-        # return
-        return ';'.join(vals)
+        return self._render(self)
+
+    @property
+    def db(self):
+        return get_db()
 
     @property
     def Position(self):
@@ -402,9 +1224,7 @@ class multi_disp(object):
     Volume = How much volume per dispense?
     LiquidClass = Which liquid class to use? Default: 'Water Free Multi'
     NoOfMultiDisp = How many multi-dispenses?
-    Labware_tracker = Labware object that tracks what labware is needed
-    Returns
-    * string of commands
+    Use `add` to add the commands to a gwl object.
     """
 
     def __init__(self):
@@ -426,70 +1246,77 @@ class multi_disp(object):
         self.NoOfMultiDisp = 2
 
     def add(self, gwl, disp_frac):
-        # volume as iterable
-        if hasattr(self.Volume, '__iter__'):
-            self.Volumes = self.Volume
-        else:
-            self.Volumes = [self.Volume] * len(self.DestPositions)
-                    
-        # each multi-disp
-        sample_cnt = 0
-        while 1:
-            # single-asp
+        """Adding the asp-multi-disp commands to the gwl object.
+        Dispenses are grouped in order (0-volume dispenses are skipped) into
+        aspirations of up to NoOfMultiDisp dispenses, with the aspirate
+        volume less than the max TipType DTH volume of the gwl object.
+        The groups are found with cumulative sums over the volume array, and
+        the commands are added in bulk (labware, liquid class, and tip type
+        checks are done once per value).
+        disp_frac : aspirate volume = total dispense volume * (2 - disp_frac)
+        Returns: number of aspirations
+        """
+        n = len(self.DestPositions)
+        volumes = np.round(np.broadcast_to(np.asarray(self.Volume, dtype=float), (n,)), 2)
+        self.Volumes = volumes
+        keep = np.flatnonzero(volumes > 0)
+        if len(keep) == 0:
+            return 0
+        # grouping dispenses into aspirations
+        asp_factor = 1 - disp_frac + 1
+        max_volume = np.inf
+        if len(gwl._DTH_ladder) > 0:
+            max_volume = gwl._DTH_ladder[-1] / asp_factor
+        cumsum = np.cumsum(volumes[keep])
+        starts = []
+        start = 0
+        while start < len(keep):
+            base = cumsum[start - 1] if start > 0 else 0.0
+            end = np.searchsorted(cumsum, base + max_volume, side='left')
+            end = max(min(end, start + int(self.NoOfMultiDisp), len(keep)), start + 1)
+            starts.append(start)
+            start = end
+        starts = np.array(starts)
+        ends = np.r_[starts[1:], len(keep)]
+        totals = np.add.reduceat(volumes[keep], starts)
+        asp_volumes = [round(x * asp_factor, 2) for x in totals]
+
+        # checks (once per value)
+        def _values(x):
+            if isinstance(x, (list, tuple, np.ndarray, pd.Series)):
+                return list(x)
+            return [x] * n
+        dest_labels = _values(self.DestRackLabel)
+        dest_types = _values(self.DestRackType)
+        liq_cls = self.LiquidClass
+        if gwl.LiquidClass_exists(liq_cls) is False:
+            liq_cls = 'Water Free Single'
+        src_pos = 1 if gwl.is_tube(self.SrcRackType) else self.SrcPosition
+        is_tube = {x:gwl.is_tube(x) for x in set([dest_types[i] for i in keep])}
+        tip_types = gwl.set_TipTypes(asp_volumes, self.SrcRackType)
+
+        # adding commands
+        for i,(start,end) in enumerate(zip(starts, ends)):
             asp = Aspirate()
-            # determining total volume for this asp            
-            dispenses_tmp = 0
-            sample_cnt_tmp = sample_cnt
-            total_asp_volume = 0
-            while 1:
-                sample_cnt_tmp += 1
-                # Total samples reached
-                if sample_cnt_tmp > len(self.DestPositions):
-                    break
-                # Number of multi-disp reached
-                if dispenses_tmp >= self.NoOfMultiDisp:
-                    sample_cnt_tmp -= 1 
-                    break
-                # Skipping 0-volumes
-                if self.Volumes[sample_cnt_tmp-1] <= 0:
-                    continue
-                disp_volume = round(self.Volumes[sample_cnt_tmp-1], 2)
-                if disp_volume > 0:
-                    total_asp_volume += disp_volume
-                    dispenses_tmp += 1
-            # loading dispenses
-            dispenses = []
-            while 1:
-                sample_cnt += 1
-                # Total samples reached
-                if sample_cnt > len(self.DestPositions):
-                    break
-                # Number of multi-disp reached
-                if len(dispenses) >= self.NoOfMultiDisp:
-                    sample_cnt -= 1 
-                    break
-                # Skipping 0-volumes
-                if self.Volumes[sample_cnt-1] <= 0:
-                    continue 
+            asp.RackLabel = self.SrcRackLabel
+            asp.RackID = self.SrcRackID
+            asp.RackType = self.SrcRackType
+            asp.Position = src_pos
+            asp.Volume = asp_volumes[i]
+            asp.LiquidClass = liq_cls
+            asp.TipType = tip_types[i]
+            gwl._append(asp)
+            for j in keep[start:end]:
                 disp = Dispense()
-                disp.RackLabel = self.DestRackLabel[sample_cnt-1]
-                disp.RackType = self.DestRackType[sample_cnt-1]
-                disp.Position = self.DestPositions[sample_cnt-1]
-                disp.Volume = round(self.Volumes[sample_cnt-1], 2)
-                disp.LiquidClass = self.LiquidClass
-                if disp.Volume > 0:
-                    dispenses.append(disp)
-            # break if no more dispenses
-            if len(dispenses) <= 0:
-                break
-            # adding asp-disp cycle
-            asp.Volume = round(sum([x.Volume for x in dispenses]) * (1-disp_frac+1), 2)
-
-            # appending to gwl-obj
-            gwl.add(asp)
-            for x in dispenses:
-                gwl.add(x)
-            gwl.add(Waste())                       
+                disp.RackLabel = dest_labels[j]
+                disp.RackType = dest_types[j]
+                disp.Position = 1 if is_tube[dest_types[j]] else self.DestPositions[j]
+                disp.Volume = volumes[j].item()
+                disp.LiquidClass = liq_cls
+                gwl._append(disp)
+            gwl._append(Waste())
+        gwl.last_asp = asp
+        return len(starts)
 
     @property
     def DestPositions(self):
@@ -542,6 +1369,14 @@ class Reagent_distribution(object):
 
     # Example: R;100ml_2;;Trough 100ml;1;1;96 Well Skirted PCR[003];;96 Well Skirted PCR;1;96;20;Water Free Multi;1;5;0
     """
+    key_order = ['_ID',
+                 'SrcRackLabel', 'SrcRackID', 'SrcRackType',
+                 'SrcPosStart', 'SrcPosEnd',
+                 'DestRackLabel', 'DestRackID', 'DestRackType',
+                 'DestPosStart', 'DestPosEnd',
+                 'Volume', 'LiquidClass', 'NoOfDiTiReuses',
+                 'NoOfMultiDisp', 'Direction', 'ExcludedDestWell']
+    _render = staticmethod(compile_render(key_order))
 
     def __init__(self, ):
         self._ID = 'R'
@@ -565,29 +1400,670 @@ class Reagent_distribution(object):
         self.Direction = 0
         self.ExcludedDestWell = None
         self.TipType = None      # just used for counting tips
-        self.key_order = ['_ID',
-                          'SrcRackLabel', 'SrcRackID', 'SrcRackType',
-                          'SrcPosStart', 'SrcPosEnd',
-                          'DestRackLabel', 'DestRackID', 'DestRackType',
-                          'DestPosStart', 'DestPosEnd',
-                          'Volume', 'LiquidClass', 'NoOfDiTiReuses',
-                          'NoOfMultiDisp', 'Direction', 'ExcludedDestWell']
 
     def cmd(self):
-        # list of values in correct order
-        vals = [getattr(self, x) for x in self.key_order]
-        # None to blank string
-        vals = [xstr(x) for x in vals]
-        # convert all to strings
-        vals = [str(x) for x in vals]
-        # return
-        return ';'.join(vals)
+        return self._render(self)
 
     def volume_per_aspirate(self):
         """Get the volume per aspiration for the multi-dispense
         """
         return self.Volume * self.NoOfMultiDisp
 
+    def dest_positions(self):
+        """Get the destination positions (DestPosStart-DestPosEnd, without
+        the ExcludedDestWell positions)
+        """
+        excluded = self.ExcludedDestWell
+        if excluded is None or excluded == '':
+            excluded = set()
+        else:
+            excluded = set([int(x) for x in str(excluded).split(';') if x != ''])
+        return [x for x in range(int(self.DestPosStart), int(self.DestPosEnd) + 1)
+                if x not in excluded]
+
+    def channel_counts(self, n_channels=8):
+        """Get the number of destination positions dispensed by each channel.
+        Plates: each channel dispenses to the rows at its position
+        (9 mm spacing; eg., 2 rows per channel for 384-well plates);
+        other labware: positions are dispensed by channels in turn.
+        Direction (left-to-right or right-to-left) just sets the order
+        of the dispenses, not the channel used.
+        Returns: numpy array (1 value per channel)
+        """
+        pos = np.array(self.dest_positions(), dtype=int) - 1
+        rows = _plate_rows(get_db().get_labware_wells(self.DestRackType))
+        if rows is None:
+            channel = pos % n_channels
+        else:
+            channel = (pos % rows) // (rows // 8) % n_channels
+        return np.bincount(channel, minlength=n_channels)
+
+    def aspirate_count(self, n_channels=8):
+        """Get the number of aspirations (each for up to NoOfMultiDisp dispenses)
+        """
+        counts = self.channel_counts(n_channels)
+        return int((-(-counts // int(self.NoOfMultiDisp))).sum())
+
+    def tip_count(self, n_channels=8):
+        """Get the number of tips used: per channel, 1 tip per
+        NoOfDiTiReuses aspirations of NoOfMultiDisp dispenses.
+        """
+        counts = self.channel_counts(n_channels)
+        n_asp = -(-counts // int(self.NoOfMultiDisp))
+        return int((-(-n_asp // int(self.NoOfDiTiReuses))).sum())
+
+class MCA_transfer(object):
+    """96-channel (MCA96) head transfer of a whole 96-well plate
+    ("stamp") into a 96-well plate or a quadrant of a 384-well plate.
+    NOTE: FluentControl gwl files do not include MCA96 commands, so the
+    commands are written as a table (see `gwl.mca_table`) for use by
+    a FluentControl method.
+
+    *Parameters*
+    SrcRackLabel
+    SrcRackType = 96-well plate
+    DestRackLabel
+    DestRackType = 96-well or 384-well plate
+    DestQuadrant = 384-well quadrant of the 1st (A1) source well: 1=A1, 2=A2, 3=B1, 4=B2
+                   (always 1 for 96-well destinations)
+    Volume = How much volume to asp/disp per well?
+    LiquidClass = Which liquid class to use?
+    TipType = MCA96 tip type (96 tips used per transfer)
+    """
+    key_order = ['SrcRackLabel', 'SrcRackType',
+                 'DestRackLabel', 'DestRackType', 'DestQuadrant',
+                 'Volume', 'LiquidClass', 'TipType']
+
+    def __init__(self):
+        self.SrcRackLabel = None
+        self.SrcRackType = None
+        self.DestRackLabel = None
+        self.DestRackType = None
+        self.DestQuadrant = 1
+        self.Volume = 1
+        self.LiquidClass = 'Water Free Single'
+        self.TipType = None
+
+# gwl file parsing & validation
+gwl_record = collections.namedtuple('gwl_record',
+                                    ['line_num', 'ID', 'values', 'error'])
+gwl_record.__doc__ = """A parsed gwl command line.
+line_num : line number in the gwl file (1-indexed)
+ID : command ID (A, D, R, W, F, C, or B)
+values : dict of field => value (str); eg., {'RackLabel' : 'Sample plate', ...}
+error : parsing error message (None if line parsed)
+"""
+
+def _single_source_run(commands, i):
+    """Finding a run of single asp-disp transfers from the same source,
+    starting at commands[i]. Run format: "A;D;[W;]" repeated, ending with "W;"
+    Returns: (end index of the run (exclusive), list of (asp, disp) pairs);
+    no pairs if no run found
+    """
+    pairs = []
+    end,n_pairs = i,0
+    key = None
+    j = i
+    while j + 1 < len(commands):
+        asp,disp = commands[j],commands[j+1]
+        if not isinstance(asp, Aspirate) or not isinstance(disp, Dispense):
+            break
+        asp_key = (asp.RackLabel, asp.RackID, asp.RackType, asp.Position,
+                   asp.TubeID, asp.LiquidClass, asp.TipMask)
+        if key is None:
+            key = asp_key
+        if asp_key != key or asp.Volume != disp.Volume:
+            break
+        pairs.append((asp, disp))
+        j += 2
+        # tip waste
+        while j < len(commands) and isinstance(commands[j], Waste):
+            j += 1
+            end,n_pairs = j,len(pairs)
+    return end, pairs[:n_pairs]
+
+def _single_tip_run(commands, i):
+    """Finding a run of single-tip transfers ("A;D;W;" repeated), starting
+    at commands[i]. The run ends before any transfer from/to a well that
+    is a destination/source of a prior transfer in the run (so that the
+    transfers of the run can be reordered).
+    Returns: (end index of the run (exclusive), list of (asp, disp) pairs)
+    """
+    pairs = []
+    sources = set()
+    dests = set()
+    j = i
+    while j + 2 < len(commands):
+        asp,disp,waste = commands[j:j+3]
+        if (not isinstance(asp, Aspirate) or not isinstance(disp, Dispense)
+            or not isinstance(waste, Waste)):
+            break
+        if asp.TipMask is not None or disp.TipMask is not None:
+            break
+        src = (asp.RackLabel, asp.RackID, asp.Position)
+        dest = (disp.RackLabel, disp.RackID, disp.Position)
+        if src in dests or dest in sources:
+            break
+        sources.add(src)
+        dests.add(dest)
+        pairs.append((asp, disp))
+        j += 3
+    return j, pairs
+
+def _plate_rows(wells):
+    """Number of rows for a standard (2:3) plate with n-wells
+    (96 => 8 rows; 384 => 16 rows). None if not a standard plate.
+    """
+    rows = int(round((wells * 2 / 3.0) ** 0.5))
+    if rows < 8 or rows % 8 != 0 or rows * rows * 3 != wells * 2:
+        return None
+    return rows
+
+def _channel_access(cmd, n_channels, db):
+    """Which FCA channel(s) can access the labware position of the asp/disp?
+    Returns: (group, channel); all positions accessed in 1 parallel step
+    must have the same group. channel=None means that any channel can be used.
+    None is returned if the position cannot be accessed in parallel.
+    """
+    labware = db.get_labware(cmd.RackType)
+    if labware['wells'] == 1:
+        if any(['Trough' in x for x in labware['target_location']]):
+            return (cmd.RackLabel, cmd.RackID), None
+        return None
+    rows = _plate_rows(labware['wells'])
+    if rows is None:
+        return None
+    # number of rows per 9 mm (eg., 2 rows for 384-well plates)
+    step = rows // 8
+    row = (cmd.Position - 1) % rows
+    col = (cmd.Position - 1) // rows
+    channel = row // step
+    group = (cmd.RackLabel, cmd.RackID, col, row % step, channel // n_channels)
+    return group, channel % n_channels
+
+def _channel_blocks(transfers, n_channels, db):
+    """Packing single-tip transfers into blocks of parallel channels.
+    transfers : list of (asp, disp) pairs
+    Returns: list of blocks; block = {channel : (asp, disp)}
+    """
+    blocks = []
+    open_blocks = {}    # block key => [block index, ...]
+    for asp,disp in transfers:
+        src = _channel_access(asp, n_channels, db)
+        dest = _channel_access(disp, n_channels, db)
+        channel = None
+        if src is not None and dest is not None:
+            channel = dest[1] if src[1] is None else src[1]
+            if dest[1] is not None and dest[1] != channel:
+                src = None
+        # transfer cannot be conducted in parallel
+        if src is None or dest is None:
+            blocks.append({0 : (asp, disp)})
+            continue
+        # adding to the first open block with the channel available
+        key = (src[0], dest[0], asp.LiquidClass, asp.TipType)
+        idx = None
+        for x in open_blocks.get(key, []):
+            if channel is None:
+                free = [y for y in range(n_channels) if y not in blocks[x]]
+                if len(free) > 0:
+                    idx,channel = x,free[0]
+                    break
+            elif channel not in blocks[x]:
+                idx = x
+                break
+        if idx is None:
+            idx = len(blocks)
+            blocks.append({})
+            try:
+                open_blocks[key].append(idx)
+            except KeyError:
+                open_blocks[key] = [idx]
+            if channel is None:
+                channel = 0
+        blocks[idx][channel] = (asp, disp)
+        if len(blocks[idx]) >= n_channels:
+            open_blocks[key].remove(idx)
+    return blocks
+
+def _mca_quadrant(asp, disp, db):
+    """Which quadrant of the destination plate does the transfer map to for
+    a MCA96 stamp of the source plate (96 => 96 wells or 96 => 384 wells)?
+    Returns: quadrant (1-4); None if the transfer cannot be part of a stamp
+    """
+    if db.get_labware_wells(asp.RackType) != 96:
+        return None
+    dest_rows = _plate_rows(db.get_labware_wells(disp.RackType))
+    if dest_rows not in (8, 16):
+        return None
+    step = dest_rows // 8
+    src_pos,dest_pos = int(asp.Position) - 1, int(disp.Position) - 1
+    src_row,src_col = src_pos % 8, src_pos // 8
+    dest_row,dest_col = dest_pos % dest_rows, dest_pos // dest_rows
+    row,col = dest_row - src_row * step, dest_col - src_col * step
+    if not (0 <= row < step and 0 <= col < step):
+        return None
+    return 1 + col + 2 * row
+
+def _mca_stamps(pairs, db):
+    """Finding whole-plate (MCA96) transfers: all 96 wells of a source plate
+    transferred to the same wells of a 96-well plate (or to one quadrant
+    of a 384-well plate) with the same volume & liquid class.
+    pairs : list of (asp, disp) pairs
+    Returns: list of (pair indexes, quadrant) for each stamp
+    """
+    groups = collections.OrderedDict()
+    for i,(asp,disp) in enumerate(pairs):
+        quadrant = _mca_quadrant(asp, disp, db)
+        if quadrant is None:
+            continue
+        key = (asp.RackLabel, asp.RackID, asp.RackType,
+               disp.RackLabel, disp.RackID, disp.RackType,
+               quadrant, asp.Volume, asp.LiquidClass)
+        try:
+            groups[key].append(i)
+        except KeyError:
+            groups[key] = [i]
+    stamps = []
+    for key,idx in groups.items():
+        # 1st transfer of each source well (other transfers => FCA)
+        wells = collections.OrderedDict()
+        for i in idx:
+            wells.setdefault(int(pairs[i][0].Position), i)
+        if len(wells) == 96:
+            stamps.append((list(wells.values()), key[6]))
+    return stamps
+
+def _multi_liquid_class(liquid_class, db):
+    """Getting the multi-dispense version of a single-dispense "Free" liquid class
+    Returns: None if no multi-dispense liquid class
+    """
+    if 'Free' not in liquid_class or 'Single' not in liquid_class:
+        return None
+    liquid_class = liquid_class.replace('Single', 'Multi')
+    if liquid_class not in db.liquid_class:
+        return None
+    return liquid_class
+
+def _multi_disp_run(pairs, max_volume, n_multi_disp, reagent_distribution, db,
+                    disp_frac=1):
+    """Rewriting a run of single asp-disp transfers (list of (asp, disp) pairs)
+    from the same source into multi-dispense commands.
+    disp_frac : aspirate volume = total dispense volume * (2 - disp_frac)
+    Returns: list of commands (None if the run cannot be rewritten)
+    """
+    asp0 = pairs[0][0]
+    liq_cls = _multi_liquid_class(asp0.LiquidClass, db)
+    if liq_cls is None or n_multi_disp < 2:
+        return None
+    dispenses = [disp for asp,disp in pairs]
+    # volume per aspirate must be < max_volume (see `gwl.set_TipType`)
+    asp_factor = 1 - disp_frac + 1
+    if max([x.Volume for x in dispenses]) * asp_factor >= max_volume:
+        return None
+    # reagent distribution (same volume; different wells of 1 labware)
+    if reagent_distribution is True:
+        rd = _reagent_distribution_run(asp0, dispenses, liq_cls, max_volume,
+                                       n_multi_disp, db)
+        if rd is not None:
+            return [rd]
+    # 1-asp-multi-disp blocks
+    blocks = [[]]
+    volume = 0
+    for disp in dispenses:
+        if len(blocks[-1]) >= n_multi_disp or (volume + disp.Volume) * asp_factor >= max_volume:
+            blocks.append([])
+            volume = 0
+        blocks[-1].append(disp)
+        volume += disp.Volume
+    cmds = []
+    for block in blocks:
+        asp = Aspirate()
+        for x in ('RackLabel', 'RackID', 'RackType', 'Position',
+                  'TubeID', 'TipMask', 'ForceRackType'):
+            setattr(asp, x, getattr(asp0, x))
+        asp.Volume = round(sum([x.Volume for x in block]) * asp_factor, 2)
+        asp.LiquidClass = liq_cls
+        cmds.append(asp)
+        for disp in block:
+            disp.LiquidClass = liq_cls
+            cmds.append(disp)
+        cmds.append(Waste())
+    return cmds
+
+def _reagent_distribution_run(asp, dispenses, liq_cls, max_volume,
+                              n_multi_disp, db):
+    """Rewriting a run of single asp-disp transfers as a reagent distribution
+    Returns: Reagent_distribution (None if not possible)
+    """
+    disp0 = dispenses[0]
+    key = (disp0.RackLabel, disp0.RackID, disp0.RackType, disp0.Volume)
+    positions = set()
+    for disp in dispenses:
+        if (disp.RackLabel, disp.RackID, disp.RackType, disp.Volume) != key:
+            return None
+        positions.add(disp.Position)
+    if len(positions) < len(dispenses) or disp0.Volume <= 0:
+        return None
+    wells = db.get_labware_wells(disp0.RackType)
+    rd = Reagent_distribution()
+    rd.SrcRackLabel = asp.RackLabel
+    rd.SrcRackID = asp.RackID
+    rd.SrcRackType = asp.RackType
+    rd.SrcPosStart = asp.Position
+    rd.SrcPosEnd = asp.Position
+    rd.DestRackLabel = disp0.RackLabel
+    rd.DestRackID = disp0.RackID
+    rd.DestRackType = disp0.RackType
+    rd.DestPosStart = 1
+    rd.DestPosEnd = wells
+    rd.Volume = disp0.Volume
+    rd.LiquidClass = liq_cls
+    rd.NoOfDiTiReuses = 1
+    n_max = max_volume // disp0.Volume
+    if n_max * disp0.Volume >= max_volume:
+        n_max -= 1
+    rd.NoOfMultiDisp = int(min(n_multi_disp, n_max))
+    rd.Direction = 0
+    to_exclude = [x for x in range(1, wells + 1) if x not in positions]
+    rd.ExcludedDestWell = ';'.join([str(x) for x in to_exclude])
+    return rd
+
+def _open_input(file_obj):
+    """Opening input file (if file name provided).
+    Returns: (file handle or iterable of lines, was the file opened?)
+    """
+    if isinstance(file_obj, str) or hasattr(file_obj, '__fspath__'):
+        return open(file_obj, 'r'), True
+    return file_obj, False
+
+def parse_gwl(gwl_file):
+    """Parsing a gwl file into command records (see `gwl_record`).
+    The file is read line-by-line (records are yielded), so any size of
+    file can be parsed. Lines with format errors are yielded as records with
+    `error` set, so that all errors can be reported.
+    The last aspirate/dispense field (ForceRackType) is optional, so
+    10-field aspirate/dispense lines (eg., older gwl files) are accepted.
+    gwl_file : input file name, file handle, or iterable of lines
+    """
+    asp_disp_fields = asp_disp.field_order[1:]
+    R_fields = Reagent_distribution.key_order[1:]
+    inF, opened = _open_input(gwl_file)
+    try:
+        for i,line in enumerate(inF, 1):
+            line = line.rstrip('\r\n')
+            if line.strip() == '':
+                yield gwl_record(i, None, None, 'Empty lines not allowed in gwl files')
+                continue
+            fields = line.split(';')
+            ID = fields[0]
+            # checking fields
+            if ID == 'C':
+                yield gwl_record(i, ID, {'comment' : line[2:]}, None)
+            elif ID in ('A', 'D'):
+                if len(fields) - 1 not in (len(asp_disp_fields) - 1, len(asp_disp_fields)):
+                    msg = 'Aspirate/dispense commands must have {} or {} fields; found {}'
+                    msg = msg.format(len(asp_disp_fields), len(asp_disp_fields) + 1, len(fields))
+                    yield gwl_record(i, ID, None, msg)
+                    continue
+                # optional ForceRackType
+                fields += [''] * (len(asp_disp_fields) + 1 - len(fields))
+                yield gwl_record(i, ID, dict(zip(asp_disp_fields, fields[1:])), None)
+            elif ID == 'R':
+                # excluded wells are semicolon-separated, so the last field is optional
+                if len(fields) < len(R_fields):
+                    msg = 'Reagent distribution commands must have >={} fields; found {}'
+                    msg = msg.format(len(R_fields), len(fields))
+                    yield gwl_record(i, ID, None, msg)
+                    continue
+                values = dict(zip(R_fields[:-1], fields[1:len(R_fields)]))
+                values[R_fields[-1]] = ';'.join(fields[len(R_fields):])
+                yield gwl_record(i, ID, values, None)
+            elif ID in ('W', 'F', 'B'):
+                if len(fields) > 2 or (len(fields) == 2 and fields[1] != ''):
+                    msg = '"{};" commands cannot have any fields'.format(ID)
+                    yield gwl_record(i, ID, None, msg)
+                    continue
+                yield gwl_record(i, ID, {}, None)
+            else:
+                msg = '"{}" not a valid command ID'.format(ID)
+                yield gwl_record(i, ID, None, msg)
+    finally:
+        if opened:
+            inF.close()
+
+def validate_gwl(records, db=None):
+    """Semantic validation of parsed gwl commands (see `parse_gwl`).
+    Checks:
+      * parsing errors
+      * labware types, liquid classes, and tip types are in the database
+      * positions are within the number of wells of the labware
+      * each dispense follows an aspirate (with no waste/flush/break between)
+        with the same TipMask (ie., channel)
+      * the volume in the tip fits the tip type (and no more is dispensed
+        than aspirated)
+      * volumes fit the labware well capacity (including the total volume
+        dispensed into each well)
+    records : iterable of gwl_record objects
+    db : database object (default: the shared database)
+    Yields: (line_number, error_message)
+    Only the current tips and the volume per dispensed-into well are tracked,
+    so memory does not grow with the number of commands.
+    """
+    if db is None:
+        db = get_db()
+    # state
+    tips = {}            # TipMask => [TipType, asp_volume, disp_volume]; reset by W/F/B
+    well_volumes = {}
+    for rec in records:
+        if rec.error is not None:
+            yield rec.line_num, rec.error
+            continue
+        if rec.ID in ('W', 'F', 'B'):
+            tips = {}
+            continue
+        if rec.ID == 'R':
+            for msg in _validate_R(rec.values, db):
+                yield rec.line_num, msg
+            continue
+        if rec.ID not in ('A', 'D'):
+            continue
+        # aspirate/dispense
+        values = rec.values
+        errors = []
+        if values['RackLabel'] == '' and values['RackID'] == '':
+            errors.append('RackLabel or RackID must be provided')
+        Position = _to_number(values['Position'], 'Position', int, errors)
+        Volume = _to_number(values['Volume'], 'Volume', float, errors)
+        if Volume is not None and Volume < 0:
+            errors.append('Volume cannot be negative: {}'.format(values['Volume']))
+            Volume = None
+        labware = _check_labware(values['RackType'], Position, Volume, db, errors)
+        _check_liquid_class(values['LiquidClass'], db, errors)
+        # tip content
+        tip = tips.get(values['TipMask'])
+        if rec.ID == 'A':
+            if tip is None:
+                tip = tips[values['TipMask']] = [None, 0.0, 0.0]
+            if values['TipType'] != '':
+                if values['TipType'] in db.tip_type:
+                    tip[0] = values['TipType']
+                else:
+                    errors.append('TipType not in database: "{}"'.format(values['TipType']))
+            if Volume is not None:
+                tip[1] += Volume
+                if tip[0] is not None:
+                    max_volume = db.tip_type[tip[0]]['volume']
+                    if tip[1] - tip[2] > max_volume:
+                        msg = 'Volume in tip ({} ul) exceeds the tip capacity ({} ul) of "{}"'
+                        errors.append(msg.format(round(tip[1] - tip[2], 2),
+                                                 max_volume, tip[0]))
+        elif tip is None:
+            errors.append('Dispense without a preceding aspirate')
+        elif Volume is not None:
+            tip[2] += Volume
+            if tip[2] > tip[1] + 1e-6:
+                msg = 'Dispensed volume ({} ul) exceeds the aspirated volume ({} ul)'
+                errors.append(msg.format(round(tip[2], 2), round(tip[1], 2)))
+        # well content
+        if labware is not None and Position is not None and Volume is not None:
+            well = (values['RackLabel'], values['RackID'], Position)
+            well_volume = well_volumes.get(well, 0.0)
+            if rec.ID == 'A':
+                well_volumes[well] = max(well_volume - Volume, 0.0)
+            else:
+                well_volumes[well] = well_volume + Volume
+                max_volume = labware['max_volume']
+                if well_volume <= max_volume < well_volumes[well]:
+                    msg = 'Total volume dispensed into well {} ({} ul) exceeds the labware capacity ({} ul)'
+                    errors.append(msg.format(Position, round(well_volumes[well], 2), max_volume))
+        for msg in errors:
+            yield rec.line_num, msg
+
+def _validate_R(values, db):
+    """Validating a reagent distribution command.
+    Returns: list of error messages
+    """
+    errors = []
+    Volume = _to_number(values['Volume'], 'Volume', float, errors)
+    for x in ('Src', 'Dest'):
+        if values[x + 'RackLabel'] == '' and values[x + 'RackID'] == '':
+            errors.append('{}RackLabel or {}RackID must be provided'.format(x, x))
+        for y in ('PosStart', 'PosEnd'):
+            Position = _to_number(values[x + y], x + y, int, errors)
+            _check_labware(values[x + 'RackType'], Position, None, db, errors)
+    _check_labware(values['DestRackType'], None, Volume, db, errors)
+    _check_liquid_class(values['LiquidClass'], db, errors)
+    for x in ('NoOfDiTiReuses', 'NoOfMultiDisp', 'Direction'):
+        _to_number(values[x], x, int, errors)
+    # only reporting each error once
+    return list(collections.OrderedDict.fromkeys(errors))
+
+def _to_number(value, name, func, errors):
+    """Converting a gwl field value to a number (None if not possible)
+    """
+    try:
+        return func(value)
+    except ValueError:
+        errors.append('{} is not a valid number: "{}"'.format(name, value))
+        return None
+
+def _check_labware(RackType, Position, Volume, db, errors):
+    """Checking that the labware type is in the database, and that the
+    position & volume fit the labware.
+    Returns: labware info (None if no RackType or not in the database)
+    """
+    if RackType == '':
+        return None
+    try:
+        labware = db.labware[RackType]
+    except KeyError:
+        errors.append('Labware type not in database: "{}"'.format(RackType))
+        return None
+    if Position is not None and not 1 <= Position <= labware['wells']:
+        msg = 'Position {} is not within the {} wells of labware type "{}"'
+        errors.append(msg.format(Position, labware['wells'], RackType))
+    if Volume is not None and Volume > labware['max_volume']:
+        msg = 'Volume ({} ul) exceeds the max volume ({} ul) of labware type "{}"'
+        errors.append(msg.format(Volume, labware['max_volume'], RackType))
+    return labware
+
+def _check_liquid_class(LiquidClass, db, errors):
+    """Checking that the liquid class is in the database (if provided)
+    """
+    if LiquidClass != '' and LiquidClass not in db.liquid_class:
+        errors.append('Liquid class not in database: "{}"'.format(LiquidClass))
+
+
+def read_gwl(gwl_file, TipTypes=('FCA, 1000ul SBS', 'FCA, 200ul SBS',
+                                 'FCA, 50ul SBS', 'FCA, 10ul SBS'),
+             columnar=False):
+    """Loading a gwl file into a gwl object (see `parse_gwl`).
+    The commands are added via `gwl.add`, so each aspirate TipType is
+    re-derived from the volume (via `set_TipType`) and labware/tip usage
+    is tallied (eg., for `Labware.labware.add_gwl`).
+    Blank aspirate/dispense liquid classes are set to the default.
+    Labware types (RackType, SrcRackType & DestRackType) are required for
+    tallying labware, so lines with a blank labware type are rejected
+    (ValueError naming the line & field).
+    gwl_file : input file name, file handle, or iterable of lines
+    TipTypes : tip types used for setting the TipType of each aspirate
+    columnar : see `gwl`
+    Returns: gwl object
+    """
+    gwl_obj = gwl(TipTypes, columnar=columnar)
+    for rec in parse_gwl(gwl_file):
+        if rec.error is not None:
+            raise ValueError('Line {}: {}'.format(rec.line_num, rec.error))
+        try:
+            gwl_obj.add(_record2command(rec))
+        except (ValueError, KeyError, AssertionError) as e:
+            msg = e.args[0] if len(e.args) > 0 else type(e).__name__
+            raise ValueError('Line {}: {}'.format(rec.line_num, msg))
+    return gwl_obj
+
+def _record2command(rec):
+    """Converting a gwl_record to a command object
+    """
+    values = rec.values
+    # labware types are needed for the labware & tip tallies
+    if rec.ID in ('A', 'D'):
+        fields = ['RackType']
+    elif rec.ID == 'R':
+        fields = ['SrcRackType', 'DestRackType']
+    else:
+        fields = []
+    for x in fields:
+        if values[x] == '':
+            msg = '{} is blank; labware types are required to load a gwl file'
+            raise ValueError(msg.format(x))
+    if rec.ID == 'C':
+        return Comment(values['comment'])
+    elif rec.ID == 'W':
+        return Waste()
+    elif rec.ID == 'F':
+        return Flush()
+    elif rec.ID == 'B':
+        return Break()
+    elif rec.ID in ('A', 'D'):
+        obj = Aspirate() if rec.ID == 'A' else Dispense()
+        for x in ('RackLabel', 'RackID', 'RackType', 'TubeID',
+                  'TipType', 'TipMask', 'ForceRackType'):
+            setattr(obj, x, _blank2none(values[x]))
+        obj.Position = values['Position']
+        obj.Volume = _str2volume(values['Volume'])
+        if values['LiquidClass'] != '':
+            obj.LiquidClass = values['LiquidClass']
+        return obj
+    # reagent distribution
+    obj = Reagent_distribution()
+    for x in ('SrcRackLabel', 'SrcRackID', 'SrcRackType',
+              'DestRackLabel', 'DestRackID', 'DestRackType',
+              'LiquidClass', 'ExcludedDestWell'):
+        setattr(obj, x, _blank2none(values[x]))
+    for x in ('SrcPosStart', 'SrcPosEnd', 'DestPosStart', 'DestPosEnd',
+              'NoOfDiTiReuses', 'NoOfMultiDisp', 'Direction'):
+        setattr(obj, x, int(values[x]))
+    obj.Volume = _str2volume(values['Volume'])
+    return obj
+
+def _blank2none(x):
+    if x == '':
+        return None
+    return x
+
+def _str2volume(x):
+    """Converting a volume string to an int or float (None if blank),
+    so that the volume is written in the same format.
+    """
+    if x == '':
+        return None
+    try:
+        return int(x)
+    except ValueError:
+        return float(x)
+
+
 # main
 if __name__ == '__main__':
     pass
@@ -5,14 +5,16 @@ import os
 import sys
 import argparse
 import functools
-from itertools import product,cycle
+from itertools import product
 ## 3rd party
 import numpy as np
 import pandas as pd
 ## package
 from pyTecanFluent import Utils
+from pyTecanFluent import TipReuse
 from pyTecanFluent import Fluent
 from pyTecanFluent import Labware
+from pyTecanFluent import Runtime
 
 
 # functions
@@ -71,6 +73,12 @@ def parse_args(test_args=None, subparsers=None):
                          help='Which rows of the mapping file to use (eg., "all"=all rows; "1-48"=rows1-48; "1,3,5-6"=rows1+3+5+6), (default: %(default)s)')
     groupIO.add_argument('--prefix', type=str, default='TECAN_LITE',
                          help='Output file name prefix (default: %(default)s)')
+    groupIO.add_argument('--win', action='store_true', default=False,
+                         help='Write output files with Windows line breaks (CRLF)')
+    groupIO.add_argument('--runtime', action='store_true', default=False,
+                         help='Write an estimate of the robot run time (per stage & total)')
+    groupIO.add_argument('--time-model', type=str, default=None,
+                         help='JSON file of per-command times (seconds) for --runtime (default: the package time model)')
 
     ## Destination plate
     dest = parser.add_argument_group('Destination plate')
@@ -187,11 +195,16 @@ def main_tagmentation(df_map, args):
 
     ## writing out worklist (gwl) file
     gwl_file = args.prefix + '_tag.gwl'
-    gwl.write(gwl_file)
+    gwl.write(gwl_file, line_ending=Utils.line_ending(args.win))
+    if args.runtime:
+        runtime_file = os.path.splitext(gwl_file)[0] + '_runtime.txt'
+        Runtime.write_estimate(gwl, runtime_file, time_model=args.time_model,
+                               line_ending=Utils.line_ending(args.win))
+        Utils.file_written(runtime_file)
     
     # Report (total volumes; sample truncation; samples)
     report_file = args.prefix + '_tag_report.txt'
-    with open(report_file, 'w') as repFH:
+    with open(report_file, 'w', newline=Utils.line_ending(args.win)) as repFH:
         write_report(df_map, outFH=repFH,
                      mm_volume=args.tag_mm_volume,
                      error_perc=args.error_perc)
@@ -201,12 +214,12 @@ def main_tagmentation(df_map, args):
     lw.add_gwl(gwl)
     lw_df = lw.table()
     lw_file = args.prefix + '_tag_labware.txt'
-    lw_df.to_csv(lw_file, sep='\t', index=False)
+    Utils.write_table(lw_df, lw_file, line_ending=Utils.line_ending(args.win))
         
     # Mapping file with destinations
     df_file = args.prefix + '_tag_map.txt'
     df_map['TECAN_dest_target_position'] = df_map['TECAN_dest_target_position'].astype(int)
-    df_map.to_csv(df_file, sep='\t', index=False, na_rep='NA')
+    Utils.write_table(df_map, df_file, line_ending=Utils.line_ending(args.win), na_rep='NA')
     
     # status on files written
     Utils.file_written(gwl_file)
@@ -246,11 +259,16 @@ def main_PCR(df_map, args):
     
     ## writing out worklist (gwl) file
     gwl_file = args.prefix + '_pcr.gwl'
-    gwl.write(gwl_file)
+    gwl.write(gwl_file, line_ending=Utils.line_ending(args.win))
+    if args.runtime:
+        runtime_file = os.path.splitext(gwl_file)[0] + '_runtime.txt'
+        Runtime.write_estimate(gwl, runtime_file, time_model=args.time_model,
+                               line_ending=Utils.line_ending(args.win))
+        Utils.file_written(runtime_file)
     
     # Report (total volumes; sample truncation; samples)
     report_file = args.prefix + '_pcr_report.txt'
-    with open(report_file, 'w') as repFH:
+    with open(report_file, 'w', newline=Utils.line_ending(args.win)) as repFH:
         write_report(df_map, outFH=repFH,
                      mm_volume=args.pcr_mm_volume,
                      prm_volume=args.primer_volume,
@@ -261,15 +279,16 @@ def main_PCR(df_map, args):
     lw.add_gwl(gwl)
     lw_df = lw.table()
     lw_file = args.prefix + '_pcr_labware.txt'
-    lw_df.to_csv(lw_file, sep='\t', index=False)
+    Utils.write_table(lw_df, lw_file, line_ending=Utils.line_ending(args.win))
         
     # Mapping file with destinations
     df_file = args.prefix + '_pcr_map.txt'
     df_map['TECAN_dest_target_position'] = df_map['TECAN_dest_target_position'].astype(int)
-    df_map.to_csv(df_file, sep='\t', index=False, na_rep='NA')
+    Utils.write_table(df_map, df_file, line_ending=Utils.line_ending(args.win), na_rep='NA')
 
     # Plate map file for Bio-Rad PrimePCR software (designates: sampleID <--> wellID)
-    biorad_files = PrimerPCR_plate_map(df_map, prefix=args.prefix)
+    biorad_files = PrimerPCR_plate_map(df_map, prefix=args.prefix,
+                                       line_ending=Utils.line_ending(args.win))
     
     # status on files written
     Utils.file_written(gwl_file)
@@ -467,18 +486,6 @@ def add_dest(df_map, dest_labware, dest_type='384 Well Biorad PCR', dest_start=1
     # return
     return df_j
 
-def reorder_384well(df, reorder_col):
-    """Reorder values so that the odd, then the even locations are
-    transferred. This is faster for a 384-well plate
-    df: pandas.DataFrame
-    reorder_col: column name to reorder
-    """
-    df['TECAN_sort_IS_EVEN'] = [x % 2 == 0 for x in df[reorder_col]]
-    df.sort_values(by=['TECAN_sort_IS_EVEN', reorder_col], inplace=True)
-    df = df.drop('TECAN_sort_IS_EVEN', 1)
-    df.index = range(df.shape[0])
-    return df
-
 def pip_mastermix(df_map, gwl,  mm_labware_type='25ml_1 waste',
                   mm_volume=13.1, n_tip_reuse=6,
                   liq_cls='MasterMix Free Single'):
@@ -497,80 +504,42 @@ def pip_mastermix(df_map, gwl,  mm_labware_type='25ml_1 waste',
 
     # copying df
     df = df_map.copy()
-    x = cycle(range(8))
-    df['CHANNEL_ORDER'] = [next(x) for y in range(df.shape[0])]
-    x = cycle(range(n_tip_reuse))
-    df['TIP_BATCH'] = Utils.tip_batch(df['CHANNEL_ORDER'], n_tip_reuse)
+    x = TipReuse.channel_batches(df.shape[0], n_tip_reuse)
+    df['CHANNEL_ORDER'],df['TIP_BATCH'] = x
     df.sort_values(by=['TIP_BATCH',
                        'CHANNEL_ORDER',
                        'TECAN_dest_target_position'], inplace=True)
     df.reset_index(inplace=True)
     
     # for each Sample-PCR, write out asp/dispense commands
-    for i in range(df.shape[0]):
-        # aspiration
-        asp = Fluent.Aspirate()
-        asp.RackLabel = 'Mastermix[{0:0>3}]'.format(1)
-        asp.RackType = mm_labware_type
-        asp.Position = 1
-        asp.Volume = mm_volume
-        asp.LiquidClass = liq_cls
-        gwl.add(asp)
-
-        # dispensing
-        disp = Fluent.Dispense()
-        disp.RackLabel = df.loc[i,'TECAN_dest_labware_name']
-        disp.RackType = df.loc[i,'TECAN_dest_labware_type']
-        disp.Position = df.loc[i,'TECAN_dest_target_position']
-        disp.Volume = mm_volume
-        disp.LiquidClass = liq_cls
-        gwl.add(disp)
-
-        # tip waste
-        if (i + 1) % n_tip_reuse == 0 or i + 1 == df.shape[0]:
-            gwl.add(Fluent.Waste())
+    gwl.add_transfers(df,
+                      src_labware_name='Mastermix[{0:0>3}]'.format(1),
+                      src_labware_type=mm_labware_type,
+                      src_target_position=1,
+                      dest_labware_name='TECAN_dest_labware_name',
+                      dest_labware_type='TECAN_dest_labware_type',
+                      dest_target_position='TECAN_dest_target_position',
+                      volume=mm_volume,
+                      liq_cls=liq_cls,
+                      n_tip_reuse=n_tip_reuse)
             
     # adding break
     gwl.add(Fluent.Break())
 
-def pip_primer(i, gwl, df_map, primer_labware_name, 
-               primer_labware_type, primer_target_position,
-               primer_volume, liq_cls):
-    """Pipetting a single primer
-    """
-    # aspiration
-    asp = Fluent.Aspirate()
-    asp.RackLabel = df_map.loc[i, primer_labware_name]
-    asp.RackType = df_map.loc[i, primer_labware_type]
-    asp.Position = df_map.loc[i, primer_target_position]
-    asp.Volume = primer_volume
-    asp.LiquidClass = liq_cls
-    gwl.add(asp)
-
-    # dispensing
-    disp = Fluent.Dispense()
-    disp.RackLabel = df_map.loc[i,'TECAN_dest_labware_name']
-    disp.RackType = df_map.loc[i,'TECAN_dest_labware_type']
-    disp.Position = df_map.loc[i,'TECAN_dest_target_position']
-    disp.Volume = primer_volume
-    asp.LiquidClass = liq_cls
-    gwl.add(disp)
-
-    # waste
-    gwl.add(Fluent.Waste())
-    
 def pip_primers(df_map, gwl, prm_volume=0, liq_cls='Water Free Single'):
     """Commands for aliquoting primers
     """
     gwl.add(Fluent.Comment('Primers'))    
-    for i in range(df_map.shape[0]):
-        if prm_volume <= 0:
-            continue
-        pip_primer(i, gwl, df_map,
-                   'TECAN_primer_labware_name', 
-                   'TECAN_primer_labware_type',
-                   'TECAN_primer_target_position',
-                   prm_volume, liq_cls)
+    if prm_volume > 0:
+        gwl.add_transfers(df_map,
+                          src_labware_name='TECAN_primer_labware_name',
+                          src_labware_type='TECAN_primer_labware_type',
+                          src_target_position='TECAN_primer_target_position',
+                          dest_labware_name='TECAN_dest_labware_name',
+                          dest_labware_type='TECAN_dest_labware_type',
+                          dest_target_position='TECAN_dest_target_position',
+                          volume=prm_volume,
+                          liq_cls=liq_cls)
         
     # adding break
     gwl.add(Fluent.Break())
@@ -580,35 +549,21 @@ def pip_samples(df_map, gwl, sample_volume, liq_cls='Water Free Single'):
     """
     gwl.add(Fluent.Comment('Samples'))
     # for each Sample-PCR, write out asp/dispense commands
-    for i in range(df_map.shape[0]):
-        if sample_volume <= 0:
-            continue
-        
-        # aspiration
-        asp = Fluent.Aspirate()
-        asp.RackLabel = df_map.loc[i,'TECAN_sample_labware_name']
-        asp.RackType = df_map.loc[i,'TECAN_sample_labware_type']
-        asp.Position = df_map.loc[i,'TECAN_sample_target_position']
-        asp.Volume = sample_volume
-        asp.LiquidClass = liq_cls
-        gwl.add(asp)
-
-        # dispensing
-        disp = Fluent.Dispense()
-        disp.RackLabel = df_map.loc[i,'TECAN_dest_labware_name']
-        disp.RackType = df_map.loc[i,'TECAN_dest_labware_type']
-        disp.Position = df_map.loc[i,'TECAN_dest_target_position']
-        disp.Volume = sample_volume
-        disp.LiquidClass = liq_cls
-        gwl.add(disp)
-
-        # waste
-        gwl.add(Fluent.Waste())
+    if sample_volume > 0:
+        gwl.add_transfers(df_map,
+                          src_labware_name='TECAN_sample_labware_name',
+                          src_labware_type='TECAN_sample_labware_type',
+                          src_target_position='TECAN_sample_target_position',
+                          dest_labware_name='TECAN_dest_labware_name',
+                          dest_labware_type='TECAN_dest_labware_type',
+                          dest_target_position='TECAN_dest_target_position',
+                          volume=sample_volume,
+                          liq_cls=liq_cls)
         
     # adding break
     gwl.add(Fluent.Break())
 
-def PrimerPCR_plate_map(df_map, prefix='PrimerPCR', sep=','):
+def PrimerPCR_plate_map(df_map, prefix='PrimerPCR', sep=',', line_ending=None):
     """Create a PrimerPCR plate map table.
     This table is imported by PrimerPCR to designate: sampleID <--> wellID
     Table columns: Row     Column  *Target Name    *Sample Name
@@ -616,6 +571,7 @@ def PrimerPCR_plate_map(df_map, prefix='PrimerPCR', sep=','):
       "Column" : plate column
       "*Target Name" : Not needed (NA)
       "*Sample Name" : Sample in well
+    line_ending : line break for the files (see `Utils.line_ending`)
     Return: list of pandas dataframes (1 dataframe per file)
     """
     # Plate import file for Bio-Rad PrimePCR software
@@ -626,11 +582,13 @@ def PrimerPCR_plate_map(df_map, prefix='PrimerPCR', sep=','):
     if isinstance(df_biorad.index, pd.MultiIndex):
         for labware in df_biorad.index.get_level_values(0).unique():
             biorad_file = prefix + '_BIORAD-{}.txt'.format(labware.replace(' ', '_'))
-            df_biorad.loc[labware].to_csv(biorad_file, sep=sep, index=False, na_rep='')
+            Utils.write_table(df_biorad.loc[labware], biorad_file, sep=sep,
+                              line_ending=line_ending, na_rep='')
             biorad_files.append(biorad_file)
     else:
         biorad_file = prefix + '_BIORAD.txt'
-        df_biorad.to_csv(biorad_file, sep=sep, index=False, na_rep='')
+        Utils.write_table(df_biorad, biorad_file, sep=sep,
+                          line_ending=line_ending, na_rep='')
         biorad_files.append(biorad_file)
     
     return biorad_files
@@ -647,11 +605,10 @@ def map2biorad(df_map, positions):
     df_biorad = df_biorad[['SampleID', 'TECAN_dest_target_position']]
     df_biorad.columns = ['*Sample Name', 'TECAN_dest_target_position']
     lw_utils = Labware.utils()
-    f = functools.partial(lw_utils.position2well, wells = positions)
-    x = df_map['TECAN_dest_target_position'].apply(f)
-    x = pd.DataFrame([y for y in x], columns=['Row', 'Column'])
-    df_biorad['Row'] = x.iloc[:,0].tolist()
-    df_biorad['Column'] = x.iloc[:,1].tolist()
+    rows,cols = lw_utils.positions2wells(df_map['TECAN_dest_target_position'],
+                                         wells=positions)
+    df_biorad['Row'] = rows
+    df_biorad['Column'] = cols
 
     df_biorad['*Target Name'] = np.nan
     df_biorad = df_biorad[['Row', 'Column', '*Target Name', '*Sample Name']]
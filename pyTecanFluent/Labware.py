@@ -2,11 +2,8 @@ from __future__ import print_function
 
 # import
 ## batteries
-import os
 import sys
-import json
 import string
-import itertools
 import collections
 ## 3rd party
 import numpy as np
@@ -15,16 +12,95 @@ import pandas as pd
 from pyTecanFluent import Fluent
 
 
+# plate formats: number of wells => (rows, columns)
+PLATE_FORMATS = {6 : (2, 3), 12 : (3, 4), 24 : (4, 6), 48 : (6, 8),
+                 96 : (8, 12), 384 : (16, 24), 1536 : (32, 48)}
+# plate geometry cache: number of wells => geometry object
+_GEOMETRY = {}
+
+def get_geometry(wells):
+    """Getting the (cached) geometry for a plate format
+    wells : number of wells in the plate
+    """
+    try:
+        wells = int(wells)
+    except (TypeError, ValueError):
+        raise ValueError('Number of wells ({}) not recognized'.format(wells))
+    try:
+        return _GEOMETRY[wells]
+    except KeyError:
+        pass
+    _GEOMETRY[wells] = geometry(wells)
+    return _GEOMETRY[wells]
+
+def row_id(i):
+    """Row ID of the i-th (0-indexed) plate row: A-Z, then AA, AB, ...
+    """
+    if i < 26:
+        return string.ascii_uppercase[i]
+    return row_id(i // 26 - 1) + string.ascii_uppercase[i % 26]
+
+class geometry(object):
+    """Position <=> well index tables for a plate format.
+    Positions are column-wise (position 1 = A01, 2 = B01, ...).
+    wells : number of wells in the plate (see PLATE_FORMATS)
+    """
+    def __init__(self, wells):
+        try:
+            self.n_rows,self.n_cols = PLATE_FORMATS[wells]
+        except KeyError:
+            raise ValueError('Number of wells ({}) not recognized'.format(wells))
+        self.wells = wells
+        # position - 1 => row ID, column number & well ID
+        idx = np.arange(wells)
+        self.row_ids = np.array([row_id(i) for i in range(self.n_rows)], dtype=object)
+        self.rows = self.row_ids[idx % self.n_rows]
+        self.cols = idx // self.n_rows + 1
+        self.well_ids = np.array(['{0}{1:0>2}'.format(r, c) for r,c in
+                                  zip(self.rows, self.cols)], dtype=object)
+        # row ID => row index
+        self._row_idx = {x:i for i,x in enumerate(self.row_ids)}
+
+    def position2well(self, positions):
+        """Converting positions to wells
+        positions : position or array of positions
+        Return: (row IDs, column numbers) arrays
+        """
+        pos = np.asarray(positions)
+        try:
+            idx = pos.astype(np.int64)
+        except (TypeError, ValueError):
+            idx = np.zeros(pos.shape, dtype=np.int64)
+        bad = (idx != pos) | (idx < 1) | (idx > self.wells)
+        if bad.any():
+            msg = 'Cannot find well for position: {}'
+            raise KeyError(msg.format(pos[bad].ravel()[0]))
+        idx = idx - 1
+        return self.rows[idx], self.cols[idx]
+
+    def well2position(self, wells):
+        """Converting well IDs (eg., "A01" or "A1") to positions
+        wells : well ID or array of well IDs
+        Return: array of positions
+        """
+        wells = np.asarray(wells, dtype=object)
+        x = pd.Series(wells.ravel()).astype(str)
+        x = x.str.extract(r'^([A-Z]+)0*([0-9]+)$')
+        rows = x[0].map(self._row_idx).values
+        cols = pd.to_numeric(x[1]).values
+        bad = np.isnan(rows) | np.isnan(cols) | (cols < 1) | (cols > self.n_cols)
+        if bad.any():
+            msg = 'Cannot find well "{}"'
+            raise KeyError(msg.format(wells.ravel()[bad][0]))
+        pos = (cols - 1) * self.n_rows + rows + 1
+        return pos.astype(np.int64).reshape(wells.shape)
+
 class utils(object):
     """Utility functions for labware
     """
 
     def __init__(self):
-        # target position
-        d = os.path.join(os.path.split(__file__)[0],  'database')
-        f = os.path.join(d, 'labware.json')
-        with open(f) as inF:
-            self.labware = json.load(inF)
+        self.labware = Fluent.get_db().labware
 
     def get_wells(self, RackType):
         """Getting wells of RackType
@@ -36,34 +112,21 @@ class utils(object):
         except KeyError:
             return None
         return wells
+
+    def _RackType_wells(self, RackType):
+        try:
+            return self.labware[RackType]['wells']
+        except KeyError:
+            msg = 'No wells found for RackType: "{}"'
+            raise KeyError(msg.format(RackType))
             
     def position2well(self, position, wells=96, just_row=False, just_col=False):
         """Convert position to well
         Note: assuming column-wise ordering
         Return: list with row & column IDs => [row,column]
         """
-        # making plate index
-        wells = int(wells)
-        if wells == 96:
-            nrows = 8
-            ncols = 12
-        elif wells == 384:
-            nrows = 16
-            ncols = 24
-        else:
-            msg = 'Number of wells ({}) not recognized'
-            raise ValueError(msg.format(wells))
-    
-        rows = list(string.ascii_uppercase[:nrows])
-        cols = [x + 1 for x in range(ncols)]
-        # position : [row, col]
-        pos_idx = {i+1:x for i,x in enumerate(itertools.product(cols, rows))}
-        # getting row-col
-        try:
-            col,row = pos_idx[position]
-        except KeyError:
-            msg = 'Cannot find well for position: {}'
-            raise KeyError(msg.format(position))
+        rows,cols = get_geometry(wells).position2well(position)
+        row,col = str(rows), int(cols)
         if just_row == True:
             return row
         elif just_col == True:
@@ -71,6 +134,14 @@ class utils(object):
         else:
             return [row,col]
 
+    def positions2wells(self, positions, wells=96):
+        """Vectorized position2well
+        positions : array of positions (eg., a table column)
+        wells : number of wells in the plate
+        Return: (row IDs, column numbers) arrays
+        """
+        return get_geometry(wells).position2well(np.asarray(positions))
+
     def well2position(self, well, wells=96, RackType=None):
         """well ID to column-wise position (opposite of position2well)
         """
@@ -81,64 +152,128 @@ class utils(object):
             pass
         # if RackType provided, selecting wells from database
         if RackType is not None:
-            try:
-                wells = self.labware[RackType]['wells']
-            except KeyError:
-                msg = 'No wells found for RackType: "{}"'
-                raise KeyError(msg.format(RackType))
-        # well --> position index
-        wells = int(wells)
-        if wells == 96:
-            nrows = 8
-            ncols = 12
-        elif wells == 384:
-            nrows = 16
-            ncols = 24
+            wells = self._RackType_wells(RackType)
+        return int(get_geometry(wells).well2position(well))
+
+    def wells2positions(self, well_ids, wells=96, RackTypes=None):
+        """Vectorized well2position
+        well_ids : array of well IDs and/or positions (eg., a table column)
+        wells : number of wells in the plate
+        RackTypes : RackType (or array of RackTypes) used for the number of wells
+        Return: array of positions
+        """
+        well_ids = np.asarray(well_ids, dtype=object)
+        pos = pd.to_numeric(pd.Series(well_ids), errors='coerce').values
+        is_pos = ~np.isnan(pos)
+        pos = np.where(is_pos, pos, 0).astype(np.int64)
+        if is_pos.all():
+            return pos
+        # number of wells per well ID
+        if RackTypes is None:
+            n_wells = np.full(len(well_ids), int(wells))
         else:
-            raise ValueError('Number of wells ({}) not recognized'.format(wells))    
-        rows = list(string.ascii_uppercase[:nrows])
-        cols = [x + 1 for x in range(ncols)]
-        well_idx = {'{0}{1:0>2}'.format(x[1], x[0]):i+1 for i,x in enumerate(itertools.product(cols, rows))}
-        # getting position
-        try:
-            position = well_idx[well]
-        except KeyError:
-            try:
-                # adding zero-padding
-                position = well_idx[well[0] + '0' + well[1:]]
-            except KeyError:
-                msg = 'Cannot find well "{}"'
-                raise KeyError(msg.format(well))
-        # return 
-        return position
+            RackTypes = np.broadcast_to(np.asarray(RackTypes, dtype=object),
+                                        well_ids.shape)
+            n_wells = np.zeros(len(well_ids), dtype=np.int64)
+            for RackType in pd.unique(RackTypes[~is_pos]):
+                idx = RackTypes == RackType
+                n_wells[idx] = self._RackType_wells(RackType)
+        # converting per plate format
+        for n in np.unique(n_wells[~is_pos]):
+            idx = (~is_pos) & (n_wells == n)
+            pos[idx] = get_geometry(n).well2position(well_ids[idx])
+        return pos
     
 class labware(object):
     """Class for summarizing labware in a gwl object.
     Note: tip boxes are considered separate from other labware
+    n_channels : number of FCA channels (used for Reagent_distribution tip counts)
     """
-    def __init__(self):
+    def __init__(self, n_channels=8):
+        self.n_channels = n_channels
         self.tip_count = {}
         self.tip_boxes = {}
         self.labware = {} 
         self.labware_order = {}
+        self._TipType = None
+        self._channel_TipTypes = {}
+        self._reagent_distributions = []
         # target position
-        d = os.path.join(os.path.split(__file__)[0],  'database')
-        f = os.path.join(d, 'target_position.json')
-        with open(f) as inF:
-            self.target_position = json.load(inF)
+        self.target_position = Fluent.get_db().target_position
                 
     def add_gwl(self, gwl):
         """Adding labware from gwl object to labware object.
+        The labware & tips are tallied by the gwl object as commands are
+        added (see `add_command`), so the gwl commands are not re-read.
         Note: this can be used to sum up labware from multiple gwl objects.
+        Reagent_distribution tips are re-counted if the gwl object tallies
+        tips with a different number of channels.
         """
+        lw = gwl.labware
         # counting tips
-        self._count_tips(gwl.commands)
+        for TipType,count in lw.tip_count.items():
+            try:
+                self.tip_count[TipType] += count
+            except KeyError:
+                self.tip_count[TipType] = count
+        for cmd in lw._reagent_distributions:
+            if lw.n_channels != self.n_channels:
+                self.tip_count[cmd.TipType] += (cmd.tip_count(self.n_channels) -
+                                                cmd.tip_count(lw.n_channels))
+            self._reagent_distributions.append(cmd)
         # adding labware 
-        for cmd in gwl.commands:
-            self._add_labware(cmd, gwl)
+        for RackLabel in sorted(lw.labware_order, key=lw.labware_order.get):
+            self.labware[RackLabel] = lw.labware[RackLabel]
+            try:
+                _ = self.labware_order[RackLabel]
+            except KeyError:
+                self.labware_order[RackLabel] = len(self.labware_order.keys())
         # summing up tip boxes        
         self._add_tip_boxes(gwl)
 
+    def add_command(self, cmd, db=None):
+        """Adding labware & tip usage of a single gwl command to self.
+        Used by gwl objects to tally labware as commands are added.
+        """
+        if db is None:
+            db = Fluent.get_db()
+        self._count_tip(cmd)
+        self._add_labware(cmd, db)
+
+    def add_transfers(self, asp, disp, waste, db=None):
+        """Adding labware & tip usage of asp-disp transfers in bulk.
+        Same as `add_command` for each [Aspirate, Dispense, (Waste)].
+        asp, disp : dict of field => list of values (1 value per transfer)
+        waste : boolean array; Waste command after the transfer?
+        """
+        if db is None:
+            db = Fluent.get_db()
+        # labware (in order of first use)
+        labels = np.empty(2 * len(waste), dtype=object)
+        labels[0::2] = asp['RackLabel']
+        labels[1::2] = disp['RackLabel']
+        types = np.empty(2 * len(waste), dtype=object)
+        types[0::2] = asp['RackType']
+        types[1::2] = disp['RackType']
+        for RackLabel,RackType in dict(zip(labels, types)).items():
+            self.labware[RackLabel] = db.get_labware(RackType)
+            try:
+                _ = self.labware_order[RackLabel]
+            except KeyError:
+                self.labware_order[RackLabel] = len(self.labware_order.keys())
+        # tips: 1 per waste (tip type of the last aspirate)
+        TipTypes = np.asarray(asp['TipType'], dtype=object)[waste].tolist()
+        if len(TipTypes) > 0 and len(self._channel_TipTypes) > 0:
+            TipTypes = list(self._channel_TipTypes.values()) + TipTypes[1:]
+            self._channel_TipTypes = {}
+        for TipType,count in collections.Counter(TipTypes).items():
+            try:
+                self.tip_count[TipType] += count
+            except KeyError:
+                self.tip_count[TipType] = count
+        if len(waste) > 0:
+            self._TipType = asp['TipType'][-1]
+
     def table(self):
         """Creating pandas dataframe of labware
         columns: labware_name, labware_type,target_location,target_position
@@ -303,17 +438,17 @@ class labware(object):
                 return target[0], loc_tracker[target[0]]                           
         return None
 
-    def _add_labware(self, cmd, gwl):
+    def _add_labware(self, cmd, db):
         """Adding labware (no tip boxes) to self
         """
-        if isinstance(cmd, Fluent.Reagent_distribution):
+        if isinstance(cmd, (Fluent.Reagent_distribution, Fluent.MCA_transfer)):
             assert cmd.SrcRackLabel is not None
             assert cmd.DestRackLabel is not None
             assert cmd.SrcRackType is not None
             assert cmd.DestRackType is not None
             # labware info
-            self.labware[cmd.SrcRackLabel] = gwl.db.get_labware(cmd.SrcRackType)
-            self.labware[cmd.DestRackLabel] = gwl.db.get_labware(cmd.DestRackType)
+            self.labware[cmd.SrcRackLabel] = db.get_labware(cmd.SrcRackType)
+            self.labware[cmd.DestRackLabel] = db.get_labware(cmd.DestRackType)
             # labware order in the gwl object
             try:
                 _ = self.labware_order[cmd.SrcRackLabel]
@@ -333,7 +468,7 @@ class labware(object):
             except AttributeError:
                 return None
             # labware info
-            self.labware[RackLabel] = gwl.db.get_labware(RackType)
+            self.labware[RackLabel] = db.get_labware(RackType)
             # labware order in the gwl
             try:
                 _ = self.labware_order[RackLabel]
@@ -353,7 +488,7 @@ class labware(object):
                 msg = '"wells" key not found for labware: "{}"'
                 raise KeyError(msg.format(tip_box))
             # number of tip boxes for the well
-            n_boxes = int(round(count / wells + 0.5,0))
+            n_boxes = int(np.ceil(count / float(wells)))
             for i in range(n_boxes):
                 tip_box_label = '{0}[{1:0>3}]'.format(tip_box, i + 1)
                 self.tip_boxes[tip_box_label] = [i, gwl.db.get_labware(tip_box)]
@@ -364,27 +499,51 @@ class labware(object):
         of Asp-Waste found.
         All Asp commands lacking a TipType will be skipped
         """
-        TipType = None
+        self._TipType = None
+        self._channel_TipTypes = {}
+        self._reagent_distributions = []
         for cmd in commands:
-            if isinstance(cmd, Fluent.Waste):
-                # adding tip to count
+            self._count_tip(cmd)
+
+    def _count_tip(self, cmd):
+        """Counting tip usage of a single gwl command.
+        The TipType of the last aspirate is used for the next waste command.
+        If aspirates have a TipMask (ie., parallel channels), 1 tip is counted
+        per TipMask used since the last waste.
+        """
+        if isinstance(cmd, Fluent.Waste):
+            # adding tip(s) to count
+            TipTypes = list(self._channel_TipTypes.values()) or [self._TipType]
+            for TipType in TipTypes:
                 try:
                     self.tip_count[TipType] += 1
                 except KeyError:
                     self.tip_count[TipType] = 1
-            if isinstance(cmd, Fluent.Aspirate):
-                # getting tip type for aspirate
-                try:
-                    TipType = cmd.TipType
-                except AttributeError:
-                    TipType = None
-            if isinstance(cmd, Fluent.Reagent_distribution):
-                # all tips used
-                assert cmd.TipType is not None
-                try: 
-                    self.tip_count[cmd.TipType] += 8    # TODO: more precise
-                except KeyError:
-                    self.tip_count[cmd.TipType] = 8    # TODO: more precise
+            self._channel_TipTypes = {}
+        if isinstance(cmd, Fluent.Aspirate):
+            # getting tip type for aspirate
+            try:
+                self._TipType = cmd.TipType
+            except AttributeError:
+                self._TipType = None
+            if getattr(cmd, 'TipMask', None) is not None:
+                self._channel_TipTypes[cmd.TipMask] = self._TipType
+        if isinstance(cmd, Fluent.Reagent_distribution):
+            # tips used by each channel
+            assert cmd.TipType is not None
+            n_tips = cmd.tip_count(self.n_channels)
+            self._reagent_distributions.append(cmd)
+            try: 
+                self.tip_count[cmd.TipType] += n_tips
+            except KeyError:
+                self.tip_count[cmd.TipType] = n_tips
+        if isinstance(cmd, Fluent.MCA_transfer):
+            # 1 tip per channel
+            assert cmd.TipType is not None
+            try:
+                self.tip_count[cmd.TipType] += 96
+            except KeyError:
+                self.tip_count[cmd.TipType] = 96
                 
                     
 class worktable_tracker():
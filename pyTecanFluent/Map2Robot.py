@@ -6,14 +6,15 @@ import re
 import sys
 import argparse
 import functools
-from itertools import product,cycle
 ## 3rd party
 import numpy as np
 import pandas as pd
 ## package
 from pyTecanFluent import Utils
+from pyTecanFluent import TipReuse
 from pyTecanFluent import Fluent
 from pyTecanFluent import Labware
+from pyTecanFluent import Runtime
 
 
 # functions
@@ -55,6 +56,9 @@ def parse_args(test_args=None, subparsers=None):
     WATER:
     * If  mastermix + primer + sample = total_reaction_volume, then no water is aliquoted
     * If --water-in-mm, then water is skipped
+    * If --water-first, then water is added right after the mastermix (ie., into wells
+      without primers or samples), so tips are reused (--n-tip-reuse) or water is
+      multi-dispensed (--n-multi-disp > 1). The final well contents are unchanged.
 
     MISC NOTES:
     * By default, water is assumed to be in the mastermix, and a 25ml trough will be used to hold the mastermix
@@ -78,6 +82,12 @@ def parse_args(test_args=None, subparsers=None):
                          help='Which rows of the mapping file to use (eg., "all"=all rows; "1-48"=rows1-48; "1,3,5-6"=rows1+3+5+6), (default: %(default)s)')
     groupIO.add_argument('--prefix', type=str, default='TECAN_NGS_amplicon',
                          help='Output file name prefix (default: %(default)s)')
+    groupIO.add_argument('--win', action='store_true', default=False,
+                         help='Write output files with Windows line breaks (CRLF)')
+    groupIO.add_argument('--runtime', action='store_true', default=False,
+                         help='Write an estimate of the robot run time (per stage & total)')
+    groupIO.add_argument('--time-model', type=str, default=None,
+                         help='JSON file of per-command times (seconds) for --runtime (default: the package time model)')
 
     ## Destination plate
     dest = parser.add_argument_group('Destination plate')
@@ -87,7 +97,8 @@ def parse_args(test_args=None, subparsers=None):
                       choices=['96 Well Eppendorf TwinTec PCR',
                                'PCR Adapter 96 Well and 96 Well Eppendorf TwinTec PCR',
                                '384 Well Biorad PCR',
-                               'PCR Adapter 384 Well and 384 Well Biorad PCR'],
+                               'PCR Adapter 384 Well and 384 Well Biorad PCR',
+                               '1536 Well Greiner PCR'],
                       help='Destination labware type (default: %(default)s)')
     dest.add_argument('--dest-start', type=int, default=1,
                       help='Start well number on destination plate (default: %(default)s)')
@@ -127,6 +138,12 @@ def parse_args(test_args=None, subparsers=None):
                      help='Number of tip reuses for applicable reagents (default: %(default)s)')
     liq.add_argument('--n-multi-disp', type=int, default=1,
                      help='Number of tip reuses for applicable reagents (default: %(default)s)')
+    liq.add_argument('--stamp', action='store_true', default=False,
+                     help='Pipette primers & samples with 8 channels in parallel, where the source & destination wells are column-aligned')
+    liq.add_argument('--water-first', action='store_true', default=False,
+                     help='Add water before the primers & samples, with tip reuse or multi-dispense (see --n-tip-reuse & --n-multi-disp)')
+    liq.add_argument('--mca', action='store_true', default=False,
+                     help='Use the 96-channel (MCA96) head for whole-plate transfers (96-well plate => 96-well plate or 384-well quadrant)')
     
     # running test args
     if test_args:
@@ -157,9 +174,9 @@ def main(args=None):
     # gwl construction
     TipTypes = ['FCA, 1000ul SBS', 'FCA, 200ul SBS',
                 'FCA, 50ul SBS', 'FCA, 10ul SBS']     
-    gwl = Fluent.gwl(TipTypes)
+    gwl = Fluent.gwl(TipTypes, columnar=True, mca=args.mca)
 
-    # Reordering dest if plate type is 384-well
+    # Reordering dest if plate type is 384-well or 1536-well
     df_map = Utils.reorder_384well(df_map, gwl,
                                    labware_name_col='TECAN_dest_labware_name',
                                    labware_type_col='TECAN_dest_labware_type',
@@ -175,39 +192,44 @@ def main(args=None):
                   n_multi_disp=args.n_multi_disp,
                   mm_one_source=args.mm_one_source)
 
-    ## primers
+    ## water (into clean wells)
     if args.prm_in_mm == True:
         args.prm_volume = 0
+    if args.water_first == True:
+        df_map = water(df_map, gwl, args,
+                       n_tip_reuse=args.n_tip_reuse,
+                       n_multi_disp=args.n_multi_disp)
+
+    ## primers
     if args.prm_volume > 0:
         pip_primers(df_map, gwl,
                     prm_volume=args.prm_volume,
-                    liq_cls=args.primer_liq)
+                    liq_cls=args.primer_liq,
+                    n_channels=8 if args.stamp else None)
     else:
         msg = 'WARNING: primers skipped; make sure that primers are added to the mastermix!'
         print(msg, file=sys.stderr)
 
     ## samples
-    pip_samples(df_map, gwl, liq_cls=args.sample_liq)
+    pip_samples(df_map, gwl, liq_cls=args.sample_liq,
+                n_channels=8 if args.stamp else None)
     
     ## water
-    df_map = calc_water_needed(df_map,
-                               pcr_volume=args.pcr_volume,
-                               mm_volume=args.mm_volume,
-                               prm_volume=args.prm_volume,
-                               water_in_mm=args.water_in_mm)
-    if sum(df_map['TECAN_water_rxn_volume']) > 0:
-        pip_water(df_map, gwl, liq_cls=args.water_liq)
-    else:
-        msg = 'WARNING: water skipped; make sure that water is added to the mastermix!'
-        print(msg, file=sys.stderr)
+    if args.water_first == False:
+        df_map = water(df_map, gwl, args)
     
     ## writing out worklist (gwl) file
     gwl_file = args.prefix + '.gwl'
-    gwl.write(gwl_file)
+    gwl.write(gwl_file, line_ending=Utils.line_ending(args.win))
+    if args.runtime:
+        runtime_file = os.path.splitext(gwl_file)[0] + '_runtime.txt'
+        Runtime.write_estimate(gwl, runtime_file, time_model=args.time_model,
+                               line_ending=Utils.line_ending(args.win))
+        Utils.file_written(runtime_file)
     
     # Report (total volumes; sample truncation; samples)
     report_file = args.prefix + '_report.txt'
-    with open(report_file, 'w') as repFH:
+    with open(report_file, 'w', newline=Utils.line_ending(args.win)) as repFH:
         write_report(df_map, outFH=repFH,
                      pcr_volume=args.pcr_volume,
                      mm_volume=args.mm_volume,
@@ -220,17 +242,18 @@ def main(args=None):
     lw.add_gwl(gwl)
     lw_df = lw.table()
     lw_file = args.prefix + '_labware.txt'
-    lw_df.to_csv(lw_file, sep='\t', index=False)
+    Utils.write_table(lw_df, lw_file, line_ending=Utils.line_ending(args.win))
         
     # Mapping file with destinations
     df_file = args.prefix + '_map.txt'
     df_map['TECAN_water_rxn_volume'] = df_map['TECAN_water_rxn_volume'].round(2)
     df_map['TECAN_dest_target_position'] = df_map['TECAN_dest_target_position'].astype(int)
     df_map['TECAN_pcr_rxn_rep'] = df_map['TECAN_pcr_rxn_rep'].astype(int)
-    df_map.to_csv(df_file, sep='\t', index=False, na_rep='NA')
+    Utils.write_table(df_map, df_file, line_ending=Utils.line_ending(args.win), na_rep='NA')
 
     # Plate map file for Bio-Rad PrimePCR software (designates: sampleID <--> wellID)
-    biorad_files = PrimerPCR_plate_map(df_map, prefix=args.prefix)
+    biorad_files = PrimerPCR_plate_map(df_map, prefix=args.prefix,
+                                       line_ending=Utils.line_ending(args.win))
     
     # status on files written
     Utils.file_written(gwl_file)
@@ -238,6 +261,12 @@ def main(args=None):
     Utils.file_written(report_file)
     [Utils.file_written(x) for x in biorad_files]
     Utils.file_written(df_file)
+
+    # MCA96 commands (if any)
+    mca_file = args.prefix + '_MCA.txt'
+    if len(gwl.mca_commands) > 0:
+        Utils.write_table(gwl.mca_table(), mca_file, line_ending=Utils.line_ending(args.win))
+        Utils.file_written(mca_file)
     
     # Return
     return (gwl_file, report_file, df_file, lw_file)
@@ -267,6 +296,13 @@ def check_args(args):
     ## primers
     assert args.prm_volume >= 0.0, 'Primer volume must be >= 0'
     assert args.pcr_volume > 0.0, 'PCR volume must be > 0'    
+    ## destination well capacity
+    max_volume = db.get_labware_max_volume(args.dest_type)
+    prm_volume = 0 if args.prm_in_mm else args.prm_volume
+    rxn_volume = max(args.pcr_volume, args.mm_volume + prm_volume)
+    if rxn_volume > max_volume:
+        msg = 'Total PCR volume ({} ul) > max well volume of the destination labware "{}" ({} ul)'
+        raise ValueError(msg.format(rxn_volume, args.dest_type, max_volume))
         
 def map2df(mapfile, row_select=None):
     """Loading a mapping file as a pandas dataframe
@@ -327,6 +363,13 @@ def check_df_map(df_map, args):
             print(msg, file=sys.stderr)
         if sv < 0:
             raise ValueError('Sample volume < 0')
+    ## destination well capacity (mastermix + primers + sample)
+    max_volume = Fluent.get_db().get_labware_max_volume(args.dest_type)
+    prm_volume = 0 if args.prm_in_mm else args.prm_volume
+    rxn_volume = args.mm_volume + prm_volume + df_map['TECAN_sample_rxn_volume'].max()
+    if rxn_volume > max_volume:
+        msg = 'Total PCR volume ({} ul) > max well volume of the destination labware "{}" ({} ul)'
+        raise ValueError(msg.format(round(rxn_volume, 2), args.dest_type, max_volume))
 
     # sampleID rename
     if '#SampleID' in df_map.columns.values:
@@ -369,36 +412,28 @@ def add_dest(df_map, dest_labware,
 
     # init destination df
     sample_col = df_map.columns[0]
-    cols = [sample_col, 'TECAN_pcr_rxn_rep',
-            'TECAN_dest_labware_name',
-            'TECAN_dest_labware_type', 
-            'TECAN_dest_target_position']    
-    ncol = len(cols)
     nrow = df_map.shape[0] * rxn_reps        # number of rxns
-    df_dest = pd.DataFrame(np.nan, index=range(nrow), columns=cols)
 
     # number of destination plates required
-    n_dest_plates = round(df_dest.shape[0] / positions + 0.5, 0)
+    n_dest_plates = round(nrow / positions + 0.5, 0)
     if n_dest_plates > 1:
         msg = ('WARNING: Not enough wells for the number of samples.' 
         ' Using multiple destination plates')
         print(msg, file=sys.stderr)
-        
     
-    # filling destination df
-    orig_dest_labware = dest_labware
-    for i,(sample,rep) in enumerate(product(df_map.iloc[:,0], range(rxn_reps))):
-        # dest location
-        dest_position = i + dest_start
-        dest_position = positions if dest_position % positions == 0 else dest_position % positions 
-
-        # destination plate name
-        if n_dest_plates > 1:
-            x = round((i + dest_start) / positions + 0.499, 0)        
-            dest_labware = '{} {}'.format(orig_dest_labware, int(x))
-
-        # adding values DF
-        df_dest.iloc[i] = [sample, rep+1, dest_labware, dest_type, dest_position]
+    # destination df (each sample x replicate)
+    ## dest location
+    idx = np.arange(nrow) + dest_start - 1
+    dest_position = idx % positions + 1
+    ## destination plate name
+    if n_dest_plates > 1:
+        plate = pd.Series(idx // positions + 1).astype(str)
+        dest_labware = (dest_labware + ' ' + plate).values
+    df_dest = pd.DataFrame({sample_col : np.repeat(df_map.iloc[:,0].values, rxn_reps),
+                            'TECAN_pcr_rxn_rep' : np.tile(np.arange(1.0, rxn_reps + 1), df_map.shape[0]),
+                            'TECAN_dest_labware_name' : dest_labware,
+                            'TECAN_dest_labware_type' : dest_type,
+                            'TECAN_dest_target_position' : dest_position.astype(float)})
 
     # df join (map + destination)
     df_j = pd.merge(df_map, df_dest, on=sample_col, how='inner')
@@ -408,18 +443,6 @@ def add_dest(df_map, dest_labware,
     # return
     return df_j
 
-def reorder_384well(df, reorder_col):
-    """Reorder values so that the odd, then the even locations are
-    transferred. This is faster for a 384-well plate
-    df: pandas.DataFrame
-    reorder_col: column name to reorder
-    """
-    df['TECAN_sort_IS_EVEN'] = [x % 2 == 0 for x in df[reorder_col]]
-    df.sort_values(by=['TECAN_sort_IS_EVEN', reorder_col], inplace=True)
-    df = df.drop('TECAN_sort_IS_EVEN', 1)
-    df.index = range(df.shape[0])
-    return df
-
 def pip_mastermix(df_map, gwl, mm_labware_type='25ml_1 waste',
                   mm_volume=13.1, n_tip_reuse=6, n_multi_disp=4,
                   liq_cls='MasterMix Free Multi', mm_one_source=False):
@@ -441,55 +464,42 @@ def pip_mastermix(df_map, gwl, mm_labware_type='25ml_1 waste',
     cols = ['TECAN_dest_labware_name', 'TECAN_dest_labware_type']
     df_f = df.loc[:,cols].drop_duplicates()
     df_f.reset_index(inplace=True)
-    func = lambda row: gwl.db.get_labware_wells(row['TECAN_dest_labware_type'])
-    df_f['wells'] = df_f.apply(func, axis=1)
+    df_f['wells'] = df_f['TECAN_dest_labware_type'].map(gwl.db.get_labware_wells)
 
     ## ordering df for proper tip reuse
     if n_multi_disp == 1:
-        x = cycle(range(8))
-        df['CHANNEL_ORDER'] = [next(x) for y in range(df.shape[0])]
-        x = cycle(range(n_tip_reuse))
-        df['TIP_BATCH'] = Utils.tip_batch(df['CHANNEL_ORDER'], n_tip_reuse)
+        x = TipReuse.channel_batches(df.shape[0], n_tip_reuse)
+        df['CHANNEL_ORDER'],df['TIP_BATCH'] = x
         df.sort_values(by=['TIP_BATCH',
                            'CHANNEL_ORDER',
                            'TECAN_dest_target_position'], inplace=True)
         df.reset_index(inplace=True)
         
     # dispense
+    dest_idx = df.groupby('TECAN_dest_labware_name', sort=False).indices
     for i in range(df_f.shape[0]):
         # all records for 1 plate
         RackLabel = df_f.loc[i,'TECAN_dest_labware_name']
-        df_tmp = df.loc[df['TECAN_dest_labware_name'] == RackLabel,]
+        df_tmp = df.iloc[dest_idx[RackLabel]]
         df_tmp.reset_index(inplace=True)
         # dispense single or with reagent distribution
         if n_multi_disp == 1:
             # creating asp-dispense
             liq_cls = re.sub('Multi', 'Single', liq_cls)
-            for ii in range(df_tmp.shape[0]):
-                # aspiration
-                asp = Fluent.Aspirate()
-                if mm_one_source == True:
-                    asp.RackLabel = 'Mastermix'
-                else:
-                    asp.RackLabel = 'Mastermix[{0:0>3}]'.format(i + 1)
-                asp.RackType = mm_labware_type
-                asp.Position = 1
-                asp.Volume = mm_volume
-                asp.LiquidClass = liq_cls
-                gwl.add(asp)
-
-                # dispensing
-                disp = Fluent.Dispense()
-                disp.RackLabel = df_tmp.loc[ii,'TECAN_dest_labware_name']
-                disp.RackType = df_tmp.loc[ii,'TECAN_dest_labware_type']
-                disp.Position = df_tmp.loc[ii,'TECAN_dest_target_position']
-                disp.Volume = mm_volume
-                disp.LiquidClass = liq_cls
-                gwl.add(disp)
-                
-                # waste
-                if (ii + 1) % n_tip_reuse == 0 or ii + 1 == df_tmp.shape[0]:
-                    gwl.add(Fluent.Waste())
+            if mm_one_source == True:
+                src_labware_name = 'Mastermix'
+            else:
+                src_labware_name = 'Mastermix[{0:0>3}]'.format(i + 1)
+            gwl.add_transfers(df_tmp,
+                              src_labware_name=src_labware_name,
+                              src_labware_type=mm_labware_type,
+                              src_target_position=1,
+                              dest_labware_name='TECAN_dest_labware_name',
+                              dest_labware_type='TECAN_dest_labware_type',
+                              dest_target_position='TECAN_dest_target_position',
+                              volume=mm_volume,
+                              liq_cls=liq_cls,
+                              n_tip_reuse=n_tip_reuse)
                 
         # using reagent distribution
         else:
@@ -525,77 +535,67 @@ def pip_mastermix(df_map, gwl, mm_labware_type='25ml_1 waste',
     gwl.add(Fluent.Break())
 
         
-def pip_primer(i, gwl, df_map, primer_labware_name, 
-               primer_labware_type, primer_target_position,
-               primer_volume, liq_cls):
-    """Pipetting a single primer
-    """
-    # aspiration
-    asp = Fluent.Aspirate()
-    asp.RackLabel = df_map.loc[i, primer_labware_name]
-    asp.RackType = df_map.loc[i, primer_labware_type]
-    asp.Position = df_map.loc[i, primer_target_position]
-    asp.Volume = primer_volume
-    asp.LiquidClass = liq_cls
-    gwl.add(asp)
-
-    # dispensing
-    disp = Fluent.Dispense()
-    disp.RackLabel = df_map.loc[i,'TECAN_dest_labware_name']
-    disp.RackType = df_map.loc[i,'TECAN_dest_labware_type']
-    disp.Position = df_map.loc[i,'TECAN_dest_target_position']
-    disp.Volume = primer_volume
-    asp.LiquidClass = liq_cls
-    gwl.add(disp)
-
-    # waste
-    gwl.add(Fluent.Waste())
-    
-def pip_primers(df_map, gwl, prm_volume=0, liq_cls='Water Free Single'):
+def pip_primers(df_map, gwl, prm_volume=0, liq_cls='Water Free Single',
+                n_channels=None):
     """Commands for aliquoting primers
+    n_channels : stamp column-aligned wells with n channels (see `Fluent.gwl.add_transfers`)
     """
     gwl.add(Fluent.Comment('Primers'))    
-    for i in range(df_map.shape[0]):
-        pip_primer(i, gwl, df_map,
-                   'TECAN_primer_labware_name', 
-                   'TECAN_primer_labware_type',
-                   'TECAN_primer_target_position',
-                   prm_volume, liq_cls)
+    gwl.add_transfers(df_map,
+                      src_labware_name='TECAN_primer_labware_name',
+                      src_labware_type='TECAN_primer_labware_type',
+                      src_target_position='TECAN_primer_target_position',
+                      dest_labware_name='TECAN_dest_labware_name',
+                      dest_labware_type='TECAN_dest_labware_type',
+                      dest_target_position='TECAN_dest_target_position',
+                      volume=prm_volume,
+                      liq_cls=liq_cls,
+                      n_channels=n_channels)
         
     # adding break
     gwl.add(Fluent.Break())
 
                 
-def pip_samples(df_map, gwl, liq_cls='Water Free Single'):
+def pip_samples(df_map, gwl, liq_cls='Water Free Single', n_channels=None):
     """Commands for aliquoting samples to each PCR rxn
+    n_channels : stamp column-aligned wells with n channels (see `Fluent.gwl.add_transfers`)
     """
     gwl.add(Fluent.Comment('Samples'))
     # for each Sample-PCR_rxn_rep, write out asp/dispense commands
-    for i in range(df_map.shape[0]):
-        # aspiration
-        asp = Fluent.Aspirate()
-        asp.RackLabel = df_map.loc[i,'TECAN_sample_labware_name']
-        asp.RackType = df_map.loc[i,'TECAN_sample_labware_type']
-        asp.Position = df_map.loc[i,'TECAN_sample_target_position']
-        asp.Volume = round(df_map.loc[i,'TECAN_sample_rxn_volume'], 1)
-        asp.LiquidClass = liq_cls
-        gwl.add(asp)
-
-        # dispensing
-        disp = Fluent.Dispense()
-        disp.RackLabel = df_map.loc[i,'TECAN_dest_labware_name']
-        disp.RackType = df_map.loc[i,'TECAN_dest_labware_type']
-        disp.Position = df_map.loc[i,'TECAN_dest_target_position']
-        disp.Volume = round(df_map.loc[i,'TECAN_sample_rxn_volume'], 1)
-        disp.LiquidClass = liq_cls
-        gwl.add(disp)
-
-        # waste
-        gwl.add(Fluent.Waste())
+    df = df_map.assign(TECAN_sample_rxn_volume = df_map['TECAN_sample_rxn_volume'].round(1))
+    gwl.add_transfers(df,
+                      src_labware_name='TECAN_sample_labware_name',
+                      src_labware_type='TECAN_sample_labware_type',
+                      src_target_position='TECAN_sample_target_position',
+                      dest_labware_name='TECAN_dest_labware_name',
+                      dest_labware_type='TECAN_dest_labware_type',
+                      dest_target_position='TECAN_dest_target_position',
+                      volume='TECAN_sample_rxn_volume',
+                      liq_cls=liq_cls,
+                      n_channels=n_channels)
         
     # adding break
     gwl.add(Fluent.Break())
 
+def water(df_map, gwl, args, n_tip_reuse=1, n_multi_disp=1):
+    """Calculating the water needed & adding the water commands (if any)
+    n_tip_reuse : number of tip reuses (see `pip_water`)
+    n_multi_disp : number of multi-dispenses (see `pip_water`)
+    Returns: df_map with the water volume column
+    """
+    df_map = calc_water_needed(df_map,
+                               pcr_volume=args.pcr_volume,
+                               mm_volume=args.mm_volume,
+                               prm_volume=args.prm_volume,
+                               water_in_mm=args.water_in_mm)
+    if sum(df_map['TECAN_water_rxn_volume']) > 0:
+        pip_water(df_map, gwl, liq_cls=args.water_liq,
+                  n_tip_reuse=n_tip_reuse, n_multi_disp=n_multi_disp)
+    else:
+        msg = 'WARNING: water skipped; make sure that water is added to the mastermix!'
+        print(msg, file=sys.stderr)
+    return df_map
+
 def calc_water_needed(df_map, pcr_volume=25.0, mm_volume=13.1,
                       prm_volume=2.0, water_in_mm=False):
     """Calculating the amount of water to reach full rxn volume
@@ -603,51 +603,60 @@ def calc_water_needed(df_map, pcr_volume=25.0, mm_volume=13.1,
     if water_in_mm == True:
         df_map['TECAN_water_rxn_volume'] = 0
     else:
-        water_volume = []
-        for i in range(df_map.shape[0]):
-            samp_volume = df_map.loc[i,'TECAN_sample_rxn_volume']
-            w_need = pcr_volume - (samp_volume + mm_volume + prm_volume)
-            if w_need <= 0:
-                w_need = 0
-                #assert w_need >= 0, 'Water volume is negative: {}'.format(w_need)
-            water_volume.append(w_need)
-        df_map['TECAN_water_rxn_volume'] = water_volume
+        samp_volume = df_map['TECAN_sample_rxn_volume']
+        w_need = pcr_volume - (samp_volume + mm_volume + prm_volume)
+        df_map['TECAN_water_rxn_volume'] = w_need.mask(w_need <= 0, 0)
     return df_map
         
-def pip_water(df_map, gwl, liq_cls='Water Free Single'):
-    """Commands for aliquoting water to each PCR rxn
+def pip_water(df_map, gwl, liq_cls='Water Free Single',
+              n_tip_reuse=1, n_multi_disp=1, disp_frac=0.9):
+    """Commands for aliquoting water to each PCR rxn.
+    Tips should only be reused (n_tip_reuse > 1 or n_multi_disp > 1) if the
+    destination wells do not contain primers or samples (eg., water added
+    just after the mastermix).
+    n_tip_reuse : number of tip reuses (single asp-disp; ordered by channel)
+    n_multi_disp : if > 1, 1-asp-multi-disp with up to n dispenses per aspiration
+    disp_frac : multi-dispense excess; aspirate volume = total dispense volume * (2 - disp_frac)
     """
     gwl.add(Fluent.Comment('Water'))
     
     # for each Sample-PCR_rxn_rep, write out asp/dispense commands
-    for i in range(df_map.shape[0]):
-        if df_map.loc[i,'TECAN_water_rxn_volume'] <= 0:
-            continue
-        # aspiration
-        asp = Fluent.Aspirate()
-        asp.RackLabel = '25ml_1[001]'
-        asp.RackType = '25ml_1 waste'
-        asp.Position = 1 
-        asp.Volume = round(df_map.loc[i,'TECAN_water_rxn_volume'], 1)
-        asp.LiquidClass = liq_cls
-        gwl.add(asp)
-
-        # dispensing
-        disp = Fluent.Dispense()
-        disp.RackLabel = df_map.loc[i,'TECAN_dest_labware_name']
-        disp.RackType = df_map.loc[i,'TECAN_dest_labware_type']
-        disp.Position = df_map.loc[i,'TECAN_dest_target_position']
-        disp.LiquidClass = liq_cls
-        disp.Volume = round(df_map.loc[i,'TECAN_water_rxn_volume'], 1)
-        gwl.add(disp)
-
-        ## waste
-        gwl.add(Fluent.Waste())
+    df = df_map.loc[df_map['TECAN_water_rxn_volume'] > 0]
+    df = df.assign(TECAN_water_rxn_volume = df['TECAN_water_rxn_volume'].round(1))
+    if n_multi_disp > 1:
+        md = Fluent.multi_disp()
+        md.SrcRackLabel = '25ml_1[001]'
+        md.SrcRackType = '25ml_1 waste'
+        md.SrcPosition = 1
+        md.DestRackLabel = df['TECAN_dest_labware_name'].tolist()
+        md.DestRackType = df['TECAN_dest_labware_type'].tolist()
+        md.DestPositions = df['TECAN_dest_target_position'].astype(int).tolist()
+        md.Volume = df['TECAN_water_rxn_volume'].values
+        md.LiquidClass = re.sub('Single', 'Multi', liq_cls)
+        md.NoOfMultiDisp = n_multi_disp
+        md.add(gwl, disp_frac=disp_frac)
+    else:
+        ## ordering df for proper tip reuse
+        if n_tip_reuse > 1 and df.shape[0] > 0:
+            df = df.reset_index(drop=True)
+            x = TipReuse.channel_batches(df.shape[0], n_tip_reuse)
+            order = np.lexsort((df['TECAN_dest_target_position'].values, x[0], x[1]))
+            df = df.iloc[order]
+        gwl.add_transfers(df,
+                          src_labware_name='25ml_1[001]',
+                          src_labware_type='25ml_1 waste',
+                          src_target_position=1,
+                          dest_labware_name='TECAN_dest_labware_name',
+                          dest_labware_type='TECAN_dest_labware_type',
+                          dest_target_position='TECAN_dest_target_position',
+                          volume='TECAN_water_rxn_volume',
+                          liq_cls=liq_cls,
+                          n_tip_reuse=n_tip_reuse)
         
     # adding break
     gwl.add(Fluent.Break())
 
-def PrimerPCR_plate_map(df_map, prefix='PrimerPCR', sep=','):
+def PrimerPCR_plate_map(df_map, prefix='PrimerPCR', sep=',', line_ending=None):
     """Create a PrimerPCR plate map table.
     This table is imported by PrimerPCR to designate: sampleID <--> wellID
     Table columns: Row     Column  *Target Name    *Sample Name
@@ -655,21 +664,25 @@ def PrimerPCR_plate_map(df_map, prefix='PrimerPCR', sep=','):
       "Column" : plate column
       "*Target Name" : Not needed (NA)
       "*Sample Name" : Sample in well
+    line_ending : line break for the files (see `Utils.line_ending`)
     Return: list of pandas dataframes (1 dataframe per file)
     """
     # Plate import file for Bio-Rad PrimePCR software
-    dest_pos_max = 96 if df_map['TECAN_dest_target_position'].max() <= 96 else 384
+    dest_pos_max = df_map['TECAN_dest_target_position'].max()
+    dest_pos_max = 96 if dest_pos_max <= 96 else (384 if dest_pos_max <= 384 else 1536)
     f = functools.partial(map2biorad, positions=dest_pos_max)
     df_biorad = df_map.groupby('TECAN_dest_labware_name').apply(f)
     biorad_files = []
     if isinstance(df_biorad.index, pd.MultiIndex):
         for labware in df_biorad.index.get_level_values(0).unique():
             biorad_file = prefix + '_BIORAD-{}.csv'.format(labware.replace(' ', '_'))
-            df_biorad.loc[labware].to_csv(biorad_file, sep=sep, index=False, na_rep='')
+            Utils.write_table(df_biorad.loc[labware], biorad_file, sep=sep,
+                              line_ending=line_ending, na_rep='')
             biorad_files.append(biorad_file)
     else:
         biorad_file = prefix + '_BIORAD.csv'
-        df_biorad.to_csv(biorad_file, sep=sep, index=False, na_rep='')
+        Utils.write_table(df_biorad, biorad_file, sep=sep,
+                          line_ending=line_ending, na_rep='')
         biorad_files.append(biorad_file)
     
     return biorad_files
@@ -686,11 +699,10 @@ def map2biorad(df_map, positions):
     df_biorad = df_biorad[['SampleID', 'TECAN_dest_target_position']]
     df_biorad.columns = ['*Sample Name', 'TECAN_dest_target_position']
     lw_utils = Labware.utils()
-    f = functools.partial(lw_utils.position2well, wells = positions)
-    x = df_map['TECAN_dest_target_position'].apply(f)
-    x = pd.DataFrame([y for y in x], columns=['Row', 'Column'])
-    df_biorad['Row'] = x.iloc[:,0].tolist()
-    df_biorad['Column'] = x.iloc[:,1].tolist()
+    rows,cols = lw_utils.positions2wells(df_map['TECAN_dest_target_position'],
+                                         wells=positions)
+    df_biorad['Row'] = rows
+    df_biorad['Column'] = cols
 
     df_biorad['*Target Name'] = np.nan
     df_biorad = df_biorad[['Row', 'Column', '*Target Name', '*Sample Name']]
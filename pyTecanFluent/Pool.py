@@ -13,6 +13,7 @@ import pandas as pd
 from pyTecanFluent import Utils
 from pyTecanFluent import Fluent
 from pyTecanFluent import Labware
+from pyTecanFluent import Runtime
 
 # functions
 def get_desc():
@@ -60,6 +61,12 @@ def parse_args(test_args=None, subparsers=None):
                          help='An excel or tab-delim file of samples to pool')
     groupIO.add_argument('--prefix', type=str, default='TECAN_pool',
                          help='Output file name prefix (default: %(default)s)')
+    groupIO.add_argument('--win', action='store_true', default=False,
+                         help='Write output files with Windows line breaks (CRLF)')
+    groupIO.add_argument('--runtime', action='store_true', default=False,
+                         help='Write an estimate of the robot run time (per stage & total)')
+    groupIO.add_argument('--time-model', type=str, default=None,
+                         help='JSON file of per-command times (seconds) for --runtime (default: the package time model)')
     groupIO.add_argument('--mapfile', type=str, 
                          help='A QIIME-formatted mapping file')
     
@@ -97,6 +104,8 @@ def parse_args(test_args=None, subparsers=None):
                          help='Per-sample volume to pool (default: %(default)s)')
     pooling.add_argument('--liq-cls', type=str, default='Water Free Single No-cLLD',
                          help='Liquid class for pooling (default: %(default)s)')
+    pooling.add_argument('--mca', action='store_true', default=False,
+                         help='Use the 96-channel (MCA96) head for whole-plate transfers (96-well plate => 96-well plate or 384-well quadrant)')
 #    pooling.add_argument('--new-tips',  action='store_true', default=False,
 #                        help='Use new tips between sample replicates? (default: %(default)s)')
 
@@ -161,7 +170,7 @@ def main(args=None):
     # gwl construction
     TipTypes = ['FCA, 1000ul SBS', 'FCA, 200ul SBS',
                 'FCA, 50ul SBS', 'FCA, 10ul SBS']     
-    gwl = Fluent.gwl(TipTypes)
+    gwl = Fluent.gwl(TipTypes, mca=args.mca)
     
     # Reordering src if plate type is 384-well
     df_samp = Utils.reorder_384well(df_samp, gwl,
@@ -185,24 +194,29 @@ def main(args=None):
     
     ## writing out worklist (gwl) file
     gwl_file = args.prefix + '.gwl'
-    gwl.write(gwl_file)
+    gwl.write(gwl_file, line_ending=Utils.line_ending(args.win))
+    if args.runtime:
+        runtime_file = os.path.splitext(gwl_file)[0] + '_runtime.txt'
+        Runtime.write_estimate(gwl, runtime_file, time_model=args.time_model,
+                               line_ending=Utils.line_ending(args.win))
+        Utils.file_written(runtime_file)
 
     # making labware table
     lw = Labware.labware()
     lw.add_gwl(gwl)
     lw_df = lw.table()
     lw_file = args.prefix + '_labware.txt'
-    lw_df.to_csv(lw_file, sep='\t', index=False)
+    Utils.write_table(lw_df, lw_file, line_ending=Utils.line_ending(args.win))
 
     # Writing out updated mapping table
     if df_map is not None:
         df_map = filter_map(df_map, df_samp, args.sample_col)
         map_file = args.prefix + '_map.txt'        
-        df_map.round(1).to_csv(map_file, sep='\t', index=False)
+        Utils.write_table(df_map.round(1), map_file, line_ending=Utils.line_ending(args.win))
     else:
         df_samp = filter_samp(df_samp, args.sample_col)
         samp_file = args.prefix + '_samples.txt'
-        df_samp.round(1).to_csv(samp_file, sep='\t', index=False)
+        Utils.write_table(df_samp.round(1), samp_file, line_ending=Utils.line_ending(args.win))
         
     # status
     Utils.file_written(gwl_file)
@@ -211,6 +225,12 @@ def main(args=None):
         Utils.file_written(map_file)
     else:
         Utils.file_written(samp_file)        
+
+    # MCA96 commands (if any)
+    mca_file = args.prefix + '_MCA.txt'
+    if len(gwl.mca_commands) > 0:
+        Utils.write_table(gwl.mca_table(), mca_file, line_ending=Utils.line_ending(args.win))
+        Utils.file_written(mca_file)
         
     # end
     if df_map is not None:
@@ -277,9 +297,8 @@ def sample2df(samplefile, sample_col, include_col,
     df.loc[:,include_col].apply(check_include_column)
     ## converting wells to positions
     lw_utils = Labware.utils()
-    f = lambda row: lw_utils.well2position(row[position_col],
-                                           RackType=row[labware_type_col])
-    df[position_col] = df.apply(f, axis=1)
+    df[position_col] = lw_utils.wells2positions(df[position_col],
+                                                RackTypes=df[labware_type_col])
 
     # selecting relevant columns
     df = df.loc[:,req_cols]
@@ -404,42 +423,32 @@ def pool_samples(df, gwl, sample_col, labware_name_col,
     gwl.add(Fluent.Comment('Sample pooling'))
     
     # for each Sample, generate asp/dispense commands
-    ## optional: keep tips among sample replicates
-    for sample in df[sample_col].unique():
-        df_sub = df.loc[df[sample_col] == sample]
-        df_sub.index = range(df_sub.shape[0])
-        for i in range(df_sub.shape[0]):
-            # aspiration
-            asp = Fluent.Aspirate()
-            asp.RackLabel = df_sub.loc[i, labware_name_col]
-            asp.RackType = df_sub.loc[i, labware_type_col]
-            asp.Position = df_sub.loc[i, position_col]
-            if volume_col.lower() == 'none':
-                asp.Volume = volume
-            else:
-                asp.Volume = df_sub.loc[i, volume_col]
-            if asp.Volume <= 0:
-                msg = 'WARNING: skipping sample because volume <= 0\n'
-                sys.stderr.write(msg)
-                continue
-            asp.LiquidClass = liq_cls
-            gwl.add(asp)
-
-            # dispensing
-            disp = Fluent.Dispense()
-            disp.RackLabel = df_sub.loc[i,'TECAN_dest_labware_name']
-            disp.RackType = df_sub.loc[i,'TECAN_dest_labware_type']
-            disp.Position = df_sub.loc[i,'TECAN_dest_target_position']
-            disp.Volume = asp.Volume
-            disp.LiquidClass = liq_cls
-            gwl.add(disp)
-
-            # tip to waste (each replicate)
-            gwl.add(Fluent.Waste())
+    ## sample replicates grouped together (in order of 1st appearance)
+    codes = pd.factorize(df[sample_col])[0]
+    idx = np.argsort(codes, kind='stable')
+    df = df.iloc[idx[codes[idx] >= 0]]
+    if volume_col.lower() == 'none':
+        df = df.assign(TECAN_pool_volume = volume)
+    else:
+        df = df.assign(TECAN_pool_volume = df[volume_col])
+    ## skipping zero volumes
+    x = df['TECAN_pool_volume'] <= 0
+    msg = 'WARNING: skipping sample because volume <= 0\n'
+    for i in range(x.sum()):
+        sys.stderr.write(msg)
+    gwl.add_transfers(df.loc[~x],
+                      src_labware_name=labware_name_col,
+                      src_labware_type=labware_type_col,
+                      src_target_position=position_col,
+                      dest_labware_name='TECAN_dest_labware_name',
+                      dest_labware_type='TECAN_dest_labware_type',
+                      dest_target_position='TECAN_dest_target_position',
+                      volume='TECAN_pool_volume',
+                      liq_cls=liq_cls)
                 
-        # tip to waste (between samples)
-        #if new_tips == False:            
-        #    gwl.add(Fluent.Waste())
+    # tip to waste (between samples)
+    #if new_tips == False:            
+    #    gwl.add(Fluent.Waste())
 
 
 def filter_samp(df_samp, sample_col):
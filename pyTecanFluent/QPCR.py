@@ -5,15 +5,16 @@ from __future__ import print_function
 import os
 import sys
 import argparse
-from itertools import product,cycle
-import string
+from itertools import product
 ## 3rd party
 import numpy as np
 import pandas as pd
 ## package
 from pyTecanFluent import Utils
+from pyTecanFluent import TipReuse
 from pyTecanFluent import Fluent
 from pyTecanFluent import Labware
+from pyTecanFluent import Runtime
 
 
 # functions
@@ -68,6 +69,12 @@ def parse_args(test_args=None, subparsers=None):
                          help='An Excel or CSV file with experimental setup')
     groupIO.add_argument('--prefix', type=str, default='TECAN_qPCR',
                          help='Output file name prefix (default: %(default)s)')
+    groupIO.add_argument('--win', action='store_true', default=False,
+                         help='Write output files with Windows line breaks (CRLF)')
+    groupIO.add_argument('--runtime', action='store_true', default=False,
+                         help='Write an estimate of the robot run time (per stage & total)')
+    groupIO.add_argument('--time-model', type=str, default=None,
+                         help='JSON file of per-command times (seconds) for --runtime (default: the package time model)')
     groupIO.add_argument('--format', type=str, default=None,
                          choices=[None, 'excel', 'csv', 'tsv'],
                          help='File format (excel, csv, or tsv). If not provided, the format is determined from the file extension (default: %(default)s)') 
@@ -126,16 +133,16 @@ def main(args=None):
     df_setup = check_rack_labels(df_setup)
     
     # Reordering dest for optimal pipetting
-    if n_wells == 384:
+    if n_wells in (384, 1536):
         df_setup = Utils.reorder_384well(df_setup, gwl,
                                        labware_name_col='dest_labware_name',
                                        labware_type_col='dest_labware_type',
                                        position_col='dest_target_position')
     elif n_wells == 96:
-        df_setup.sort(['dest_target_position'], inplace=True)
+        df_setup.sort_values(by=['dest_target_position'], inplace=True)
     else:
         msg = 'Labware type "{}" not recognized'
-        raise ValueError(msg.format(args.desttype))
+        raise ValueError(msg.format(args.dest_type))
     
     # Adding commands to gwl object
     pip_mastermixes(df_setup, gwl=gwl, 
@@ -154,18 +161,23 @@ def main(args=None):
 
     ## writing out worklist (gwl) file
     gwl_file = args.prefix + '.gwl'
-    gwl.write(gwl_file)
+    gwl.write(gwl_file, line_ending=Utils.line_ending(args.win))
+    if args.runtime:
+        runtime_file = os.path.splitext(gwl_file)[0] + '_runtime.txt'
+        Runtime.write_estimate(gwl, runtime_file, time_model=args.time_model,
+                               line_ending=Utils.line_ending(args.win))
+        Utils.file_written(runtime_file)
     
     # making labware table
     lw = Labware.labware()
     lw.add_gwl(gwl)
     lw_df = lw.table()
     lw_file = args.prefix + '_labware.txt'
-    lw_df.to_csv(lw_file, sep='\t', index=False)
+    Utils.write_table(lw_df, lw_file, line_ending=Utils.line_ending(args.win))
 
     # Creating report file
     report_file = args.prefix + '_report.txt'
-    with open(report_file, 'w') as repFH:        
+    with open(report_file, 'w', newline=Utils.line_ending(args.win)) as repFH:        
         MM_names = np.unique(df_setup['mm name'])
         for i,MM_name in enumerate(MM_names):
             df = df_setup.loc[df_setup['mm name'] == MM_name]        
@@ -274,24 +286,17 @@ def plate2robot_loc(row_val, col_val, n_wells):
     [args]
     row_val: string
     col_vol: string
-    plate_type: string; plate type to determine well location indexing
+    n_wells: int; number of wells in the plate (eg., 96, 384, or 1536)
     """    
     # index for converting row to numeric
-    idx = string.ascii_uppercase
-    idx = {x:i+1 for i,x in enumerate(idx)}    
+    geom = Labware.get_geometry(n_wells)
+    idx = {x:i+1 for i,x in enumerate(geom.row_ids)}
     row_val = idx[row_val]
 
     # getting location on plate
     msg = 'Destination location "{}" is out of range'
-    if n_wells == 96:
-        loc = (col_val - 1) * 8 + row_val
-        assert loc > 0 and loc <= 96, msg.format(loc)
-    elif n_wells == 384:
-        loc = (col_val - 1) * 16 + row_val
-        assert loc > 0 and loc <= 384, msg.format(loc)
-    else:
-        msg = 'Number of wells is not valid: "{}"'
-        raise ValueError(msg.format(plate_type))
+    loc = (col_val - 1) * geom.n_rows + row_val
+    assert loc > 0 and loc <= n_wells, msg.format(loc)
     return loc
 
 
@@ -308,18 +313,6 @@ def add_dest(df_setup, dest_labware_name, dest_labware_type, n_wells=96):
     func = lambda x: plate2robot_loc(x['row'], x['column'], n_wells=n_wells)
     df_setup['dest_target_position'] = df_setup.apply(func, 1)
 
-def reorder_384well(df, reorder_col):
-    """Reorder values so that the odd, then the even locations are
-    transferred. This is faster for a 384-well plate
-    df: pandas.DataFrame
-    reorder_col: column name to reorder
-    """
-    df['TECAN_sort_IS_EVEN'] = [x % 2 == 0 for x in df[reorder_col]]
-    df.sort_values(by=['TECAN_sort_IS_EVEN', reorder_col], inplace=True)
-    df = df.drop('TECAN_sort_IS_EVEN', 1)
-    df.index = range(df.shape[0])
-    return df
-
 def pip_mastermixes(df_setup, gwl, src_labware_type,
                     liq_cls='Mastermix Free Single',
                     n_tip_reuse=1):
@@ -351,10 +344,8 @@ def pip_mastermix(df_map, gwl, MM_name, src_labware_type,
     # df copy
     df = df_map.copy()
     ## ordering df for proper tip reuse
-    x = cycle(range(8))
-    df['CHANNEL_ORDER'] = [next(x) for y in range(df.shape[0])]
-    x = cycle(range(n_tip_reuse))
-    df['TIP_BATCH'] = Utils.tip_batch(df['CHANNEL_ORDER'], n_tip_reuse)
+    x = TipReuse.channel_batches(df.shape[0], n_tip_reuse)
+    df['CHANNEL_ORDER'],df['TIP_BATCH'] = x
     df.sort_values(by=['TIP_BATCH',
                        'CHANNEL_ORDER',
                        'dest_target_position'], inplace=True)
@@ -362,28 +353,16 @@ def pip_mastermix(df_map, gwl, MM_name, src_labware_type,
     
     # iterating mastermix records in setup table (single mastermix)
     gwl.add(Fluent.Comment('Mastermix: {}'.format(MM_name)))
-    for i in range(df.shape[0]):
-        # aspiration
-        asp = Fluent.Aspirate()
-        asp.RackLabel = '{0} MM[{1:0>3}]'.format(MM_name, 1)
-        asp.RackType = src_labware_type
-        asp.Position = 1
-        asp.Volume = df.loc[i,'mm volume']
-        asp.LiquidClass = liq_cls
-        gwl.add(asp)
-        
-        # dispensing
-        disp = Fluent.Dispense()
-        disp.RackLabel = df.loc[i,'dest_labware_name']
-        disp.RackType = df.loc[i,'dest_labware_type']
-        disp.Position = df.loc[i,'dest_target_position']
-        disp.Volume = df.loc[i,'mm volume']
-        asp.LiquidClass = liq_cls
-        gwl.add(disp)
-
-        # waste
-        if (i + 1) % n_tip_reuse == 0 or i + 1 == df.shape[0]:
-            gwl.add(Fluent.Waste())
+    gwl.add_transfers(df,
+                      src_labware_name='{0} MM[{1:0>3}]'.format(MM_name, 1),
+                      src_labware_type=src_labware_type,
+                      src_target_position=1,
+                      dest_labware_name='dest_labware_name',
+                      dest_labware_type='dest_labware_type',
+                      dest_target_position='dest_target_position',
+                      volume='mm volume',
+                      liq_cls=liq_cls,
+                      n_tip_reuse=n_tip_reuse)
                 
     # finish section
     gwl.add(Fluent.Break())
@@ -444,28 +423,15 @@ def pip_samples(df_setup, gwl, liq_cls='Water Contact Wet Single'):
         print(msg, file=sys.stderr)
     
     # for each Sample, create asp/dispense commands
-    for i in range(df.shape[0]):
-        # aspiration
-        asp = Fluent.Aspirate()
-        
-        asp.RackLabel = df.loc[i,'sample labware name']
-        asp.RackType = df.loc[i,'sample labware type']
-        asp.Position = df.loc[i, 'sample location']
-        asp.Volume = df.loc[i,'sample volume']
-        asp.LiquidClass = liq_cls
-        gwl.add(asp)
-        
-        # dispensing
-        disp = Fluent.Dispense()
-        disp.RackLabel = df.loc[i,'dest_labware_name']
-        disp.RackType = df.loc[i,'dest_labware_type']
-        disp.Position = df.loc[i,'dest_target_position']
-        disp.Volume = df.loc[i,'sample volume']
-        asp.LiquidClass = liq_cls
-        gwl.add(disp)
-        
-        # waste (no tip re-use)
-        gwl.add(Fluent.Waste())
+    gwl.add_transfers(df,
+                      src_labware_name='sample labware name',
+                      src_labware_type='sample labware type',
+                      src_target_position='sample location',
+                      dest_labware_name='dest_labware_name',
+                      dest_labware_type='dest_labware_type',
+                      dest_target_position='dest_target_position',
+                      volume='sample volume',
+                      liq_cls=liq_cls)
         
     gwl.add(Fluent.Break())
 
@@ -486,32 +452,19 @@ def pip_water(df_setup, gwl, src_labware_type,
         print(msg, file=sys.stderr)
     
     # for each Sample, create asp/dispense commands
-    for i in range(df.shape[0]):
-        if df.loc[i,'water volume'] <= 0:
-            msg = 'WARNING: skipping water asp/disp for sample (volue <= 0)'
-            print(msg, file=sys.stderr)
-            continue
-        
-        # aspiration
-        asp = Fluent.Aspirate()
-        asp.RackLabel = 'Water source[{0:0>3}]'.format(1)        
-        asp.RackType = src_labware_type
-        asp.Position = 1
-        asp.Volume = df.loc[i,'water volume']
-        asp.LiquidClass = liq_cls
-        gwl.add(asp)
-        
-        # dispensing
-        disp = Fluent.Dispense()
-        disp.RackLabel = df.loc[i,'dest_labware_name']
-        disp.RackType = df.loc[i,'dest_labware_type']
-        disp.Position = df.loc[i,'dest_target_position']
-        disp.Volume = df.loc[i,'water volume']
-        asp.LiquidClass = liq_cls
-        gwl.add(disp)
-        
-        # waste (no tip re-use)
-        gwl.add(Fluent.Waste())
+    x = df['water volume'] <= 0
+    msg = 'WARNING: skipping water asp/disp for sample (volue <= 0)'
+    for i in range(x.sum()):
+        print(msg, file=sys.stderr)
+    gwl.add_transfers(df.loc[~x],
+                      src_labware_name='Water source[{0:0>3}]'.format(1),
+                      src_labware_type=src_labware_type,
+                      src_target_position=1,
+                      dest_labware_name='dest_labware_name',
+                      dest_labware_type='dest_labware_type',
+                      dest_target_position='dest_target_position',
+                      volume='water volume',
+                      liq_cls=liq_cls)
         
     gwl.add(Fluent.Break())
 
@@ -0,0 +1,245 @@
+from __future__ import print_function
+
+# import
+## batteries
+import os
+import sys
+import json
+import collections
+## 3rd party
+import pandas as pd
+## package
+from pyTecanFluent import Fluent
+from pyTecanFluent import Labware
+from pyTecanFluent import Utils
+
+
+# functions
+def load_time_model(time_model=None):
+    """Loading the per-command time model (seconds).
+    The default model is "time_model.json" in the package database.
+    time_model : None (default model), JSON file name, or dict;
+                 values in a file/dict replace the defaults
+    Returns: dict
+    """
+    db = Fluent.get_db()
+    with open(os.path.join(db.database_dir, 'time_model.json')) as inF:
+        model = json.load(inF)
+    if time_model is None:
+        return model
+    if not isinstance(time_model, dict):
+        with open(time_model) as inF:
+            time_model = json.load(inF)
+    for k,v in time_model.items():
+        if k not in model:
+            msg = 'Time model parameter not recognized: "{}"'
+            raise KeyError(msg.format(k))
+        if isinstance(model[k], dict):
+            model[k] = dict(model[k], **v)
+        else:
+            model[k] = v
+    return model
+
+def format_time(seconds):
+    """Formatting seconds as H:MM:SS
+    """
+    seconds = int(round(seconds))
+    return '{}:{:0>2}:{:0>2}'.format(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+def estimate(gwl, time_model=None):
+    """Estimating the robot run time of a worklist.
+    Stages are delimited by comment commands (eg., "C;Samples").
+    Time per command (see `load_time_model`):
+      * aspirate/dispense : by liquid class (1st word of the liquid class
+                            name that is in the model; else "default")
+                            + time per ul
+      * tip pickup & eject : per tip; parallel channels (TipMask) are
+                             picked up/ejected together
+      * arm travel : between labware (RackLabels) & target locations
+                     (as in the `Labware.labware` table)
+      * multi-dispense : overhead per extra dispense per aspirate
+      * MCA96 steps : per "MCA96 step" comment (see `Fluent.gwl.add_mca`)
+    gwl : gwl object or gwl file (see `Fluent.read_gwl`)
+    time_model : see `load_time_model`
+    Returns: pandas dataframe (1 row per stage + a "Total" row)
+    """
+    if not isinstance(gwl, Fluent.gwl):
+        gwl = Fluent.read_gwl(gwl)
+    if gwl._outF is not None:
+        raise ValueError('Run time cannot be estimated for a streamed gwl')
+    model = load_time_model(time_model)
+    estimator = _estimator(model, _target_locations(gwl))
+    for cmd in gwl.commands:
+        estimator.add(cmd)
+    # table
+    cols = ['stage', 'commands', 'tips', 'aspirates', 'dispenses', 'seconds']
+    df = pd.DataFrame([[k] + v for k,v in estimator.stages.items()], columns=cols)
+    total = ['Total'] + [df[x].sum() for x in cols[1:]]
+    df = pd.concat([df, pd.DataFrame([total], columns=cols)], ignore_index=True)
+    df['seconds'] = df['seconds'].round(1)
+    df['time'] = df['seconds'].apply(format_time)
+    return df
+
+def write_estimate(gwl, file_name, time_model=None, line_ending=None):
+    """Writing the run time estimate table (see `estimate`) and
+    the total run time (to STDERR)
+    Returns: pandas dataframe
+    """
+    df = estimate(gwl, time_model=time_model)
+    Utils.write_table(df, file_name, line_ending=line_ending)
+    msg = 'Estimated run time: {}'
+    print(msg.format(df['time'].iloc[-1]), file=sys.stderr)
+    return df
+
+def _target_locations(gwl):
+    """Target location of each labware (RackLabel) & the tip boxes
+    Returns: dict; RackLabel or ("_tips", TipType) => target_location
+    """
+    lw = Labware.labware()
+    lw.add_gwl(gwl)
+    df = lw.table()
+    if df.shape[0] == 0:
+        return {}
+    locs = dict(zip(df['labware_name'], df['target_location']))
+    # tip boxes (location of the 1st tip box of each tip type)
+    for TipType in lw.tip_count:
+        if TipType is None:
+            continue
+        label = '{0}[{1:0>3}]'.format(gwl.db.get_tip_box(TipType), 1)
+        if label in lw.tip_boxes:
+            locs['_tips', TipType] = lw.tip_boxes[label][1]['target_location'][0]
+    return locs
+
+class _estimator(object):
+    """Tallying the time of gwl commands per stage
+    """
+    def __init__(self, model, locations):
+        self.model = model
+        self.locations = locations
+        self.stages = collections.OrderedDict()
+        self.stage = 'Start'
+        self.location = (None, None)
+        self.has_tip = False
+        self.last = None
+        self.n_disp = 0
+
+    def _add(self, tips=0, asp=0, disp=0, seconds=0.0):
+        try:
+            x = self.stages[self.stage]
+        except KeyError:
+            x = self.stages[self.stage] = [0, 0, 0, 0, 0.0]
+        x[0] += 1
+        x[1] += tips
+        x[2] += asp
+        x[3] += disp
+        x[4] += seconds
+
+    def _move(self, RackLabel):
+        """Arm travel time to the labware
+        """
+        loc = self.locations.get(RackLabel)
+        travel = self.model['travel']
+        if RackLabel == self.location[0]:
+            seconds = travel['same_labware']
+        elif loc is not None and loc == self.location[1]:
+            seconds = travel['same_location']
+        else:
+            seconds = travel['default']
+        self.location = (RackLabel, loc)
+        return seconds
+
+    def _liq_cls_time(self, key, liquid_class):
+        times = self.model[key]
+        for x in str(liquid_class).split(' '):
+            if x != 'default' and x in times:
+                return times[x]
+        return times['default']
+
+    def _parallel(self, cmd):
+        """Is the command conducted in parallel with the last command
+        (same command type, different channel)?
+        """
+        return (type(cmd) is type(self.last) and
+                getattr(cmd, 'TipMask', None) is not None and
+                getattr(self.last, 'TipMask', None) is not None and
+                cmd.TipMask != self.last.TipMask)
+
+    def _pickup(self, TipType):
+        self.has_tip = True
+        return self._move(('_tips', TipType)) + self.model['tip_pickup']
+
+    def _eject(self):
+        self.has_tip = False
+        self.location = (None, None)
+        return self.model['tip_eject']
+
+    def add(self, cmd):
+        """Adding the time of a gwl command
+        """
+        model = self.model
+        seconds = 0.0
+        if isinstance(cmd, Fluent.Comment):
+            if cmd.comment.startswith('MCA96 step'):
+                # the MCA96 step is its own stage; the next commands are
+                # counted under the previous stage
+                stage = self.stage
+                self.stage = cmd.comment
+                self._add(seconds=model['mca_transfer'])
+                self.stage = stage
+            else:
+                self.stage = cmd.comment
+                self._add()
+            return None
+        parallel = self._parallel(cmd)
+        if isinstance(cmd, Fluent.Aspirate):
+            tips = 0
+            if self.has_tip is False:
+                tips = 1
+                if not parallel:
+                    seconds += self._pickup(cmd.TipType)
+            if not parallel:
+                seconds += self._move(cmd.RackLabel)
+                seconds += self._liq_cls_time('aspirate', cmd.LiquidClass)
+                seconds += float(cmd.Volume) * model['aspirate_per_ul']
+            self.n_disp = 0
+            self._add(tips=tips, asp=1, seconds=seconds)
+            # next aspirate of a parallel block uses a new channel
+            self.has_tip = cmd.TipMask is None
+        elif isinstance(cmd, Fluent.Dispense):
+            if not parallel:
+                seconds += self._move(cmd.RackLabel)
+                seconds += self._liq_cls_time('dispense', cmd.LiquidClass)
+                seconds += float(cmd.Volume) * model['dispense_per_ul']
+                if self.n_disp > 0:
+                    seconds += model['multi_dispense']
+            self.n_disp += 1
+            self._add(disp=1, seconds=seconds)
+        elif isinstance(cmd, Fluent.Waste):
+            self._add(seconds=self._eject())
+        elif isinstance(cmd, Fluent.Flush):
+            self._add(seconds=model['flush'])
+        elif isinstance(cmd, Fluent.Reagent_distribution):
+            self._add_reagent_distribution(cmd)
+        else:
+            self._add()
+        self.last = cmd
+
+    def _add_reagent_distribution(self, cmd):
+        """Adding the time of a "R;" command (expanded to aspirates & dispenses)
+        """
+        model = self.model
+        n_disp = len(cmd.dest_positions())
+        n_asp = cmd.aspirate_count()
+        n_tips = cmd.tip_count()
+        travel = model['travel']
+        seconds = n_tips * (model['tip_pickup'] + model['tip_eject'] + 2 * travel['default'])
+        seconds += n_asp * (travel['default'] +
+                            self._liq_cls_time('aspirate', cmd.LiquidClass) +
+                            float(cmd.volume_per_aspirate()) * model['aspirate_per_ul'])
+        seconds += n_disp * (travel['same_labware'] +
+                             self._liq_cls_time('dispense', cmd.LiquidClass) +
+                             float(cmd.Volume) * model['dispense_per_ul'])
+        seconds += (n_disp - n_asp) * model['multi_dispense']
+        self.has_tip = False
+        self.location = (None, None)
+        self._add(tips=n_tips, asp=n_asp, disp=n_disp, seconds=seconds)
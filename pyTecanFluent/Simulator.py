@@ -0,0 +1,404 @@
+from __future__ import print_function
+
+# import
+## batteries
+import collections
+## 3rd party
+import numpy as np
+import pandas as pd
+## package
+from pyTecanFluent import Fluent
+from pyTecanFluent import Labware
+
+# volume tolerance (ul) for capacity/depletion checks
+TOLERANCE = 1e-6
+
+# classes
+class deck(object):
+    """Deck model: the labware & tip boxes on the worktable.
+    labware_table : table of labware (see `Labware.labware.table`)
+    The labware_name of labware on adapters is the RackLabel in the gwl
+    (eg., "Destination plate 1"), and the labware_type is the plate type.
+    """
+    def __init__(self, labware_table):
+        self.db = Fluent.get_db()
+        self.labware = collections.OrderedDict()    # RackLabel => labware info
+        self.tip_boxes = collections.OrderedDict()  # tip box RackType => no. of boxes
+        for name,RackType in zip(labware_table['labware_name'],
+                                 labware_table['labware_type']):
+            try:
+                labware = self.db.get_labware(RackType)
+            except KeyError:
+                # eg., plate adapters
+                continue
+            if labware.get('category') == 'tip':
+                try:
+                    self.tip_boxes[RackType] += 1
+                except KeyError:
+                    self.tip_boxes[RackType] = 1
+            else:
+                self.labware[name] = labware
+
+    def max_volume(self, RackLabel):
+        """Max well volume of the labware; None if the labware is not on the deck
+        """
+        try:
+            return self.labware[RackLabel]['max_volume']
+        except KeyError:
+            return None
+
+    def tip_capacity(self, tip_box):
+        """Number of tips available for the tip box RackType
+        """
+        return self.tip_boxes.get(tip_box, 0) * self.db.get_labware_wells(tip_box)
+
+
+class simulation(object):
+    """Results of replaying a worklist on a deck model (see `simulate`)
+    wells : table of the per-well volumes (1 row per well used):
+            labware_name, position, max_volume,
+            initial_volume (provided or the min. needed), final_volume,
+            min_volume & peak_volume (during the run)
+    tips : table of tip usage per tip box type: tip_box, used, available
+    errors : list of (command number, message); command number = gwl line number
+    """
+    def __init__(self, wells, tips, errors):
+        self.wells = wells
+        self.tips = tips
+        self.errors = sorted(errors, key=lambda x: x[0])
+
+    @property
+    def ok(self):
+        return len(self.errors) == 0
+
+    def sources(self):
+        """Wells that are aspirated below their initial volume during the run
+        (eg., reagent troughs), with the initial volume (provided or min. needed)
+        """
+        x = self.wells['min_volume'] < self.wells['initial_volume'] - TOLERANCE
+        return self.wells.loc[x, ['labware_name', 'position', 'initial_volume', 'max_volume']]
+
+
+# functions
+def simulate(gwl, labware_table=None, initial_volumes=None):
+    """Replaying a worklist on a deck model, tracking the volume of each well,
+    source depletion, and tip consumption.
+    The replay is vectorized: all volume changes (well, delta) are collected
+    in arrays, and the volume of each well over the run is calculated
+    via cumulative sums (grouped by well).
+    Reagent_distribution ("R;") commands are expanded to the dispenses
+    of each destination position (see `Fluent.Reagent_distribution.dest_positions`),
+    with the volume aspirated evenly from the source positions.
+    MCA96 steps (see `Fluent.gwl.add_mca`) are included for gwl objects.
+    gwl : gwl object or gwl file (see `Fluent.read_gwl`)
+    labware_table : labware table of the deck (see `Labware.labware.table`);
+                    if None, the table is created from the gwl
+    initial_volumes : dict of initial well volumes (ul);
+                      keys: RackLabel (all wells) or (RackLabel, Position).
+                      Wells without an initial volume start with the minimum
+                      volume needed (0 for destinations).
+    Errors (see `simulation`):
+      * labware not on the deck
+      * well volume > max_volume (per labware type in the database)
+      * well volume < 0 (depleted), for wells with an initial volume
+      * not enough tips in the tip boxes
+    Returns: simulation object
+    """
+    if not isinstance(gwl, Fluent.gwl):
+        gwl = Fluent.read_gwl(gwl)
+    if gwl._outF is not None:
+        raise ValueError('A streamed gwl cannot be simulated')
+    if labware_table is None:
+        lw = Labware.labware()
+        lw.add_gwl(gwl)
+        labware_table = lw.table()
+    deck_model = deck(labware_table)
+    cmds = _command_arrays(gwl)
+    errors = []
+    wells = _simulate_wells(cmds, deck_model, initial_volumes or {}, errors)
+    tips = _simulate_tips(cmds, deck_model, errors)
+    return simulation(wells, tips, errors)
+
+def composition(gwl):
+    """Final composition of each well: the volume dispensed into each well
+    from each source well. Each dispense is attributed to the source of the
+    preceding aspirate of the same channel (TipMask), so parallel channel
+    blocks (see `Fluent.gwl.schedule_channels`) are attributed correctly.
+    Reagent_distribution & MCA96 commands are included (see `simulate`). Two worklists with the same composition produce the
+    same final wells, regardless of the command order or tip usage.
+    gwl : gwl object or gwl file (see `Fluent.read_gwl`)
+    Returns: pandas dataframe: labware_name, position,
+             src_labware_name, src_position, volume
+    """
+    if not isinstance(gwl, Fluent.gwl):
+        gwl = Fluent.read_gwl(gwl)
+    if gwl._outF is not None:
+        raise ValueError('A streamed gwl cannot be simulated')
+    cmds = _command_arrays(gwl)
+    strings = cmds['strings']
+    ID = cmds['ID']
+    # asp/disp: source = last aspirate of the same channel (TipMask)
+    ad = np.flatnonzero((ID == ord('A')) | (ID == ord('D')))
+    ad = ad[np.lexsort((ad, cmds['TipMask'][ad]))]
+    mask = cmds['TipMask'][ad]
+    pos = np.arange(len(ad))
+    start = np.r_[True, mask[1:] != mask[:-1]] if len(ad) > 0 else np.zeros(0, dtype=bool)
+    group_start = pos[start][np.cumsum(start) - 1]
+    last_asp = np.maximum.accumulate(np.where(ID[ad] == ord('A'), pos, group_start - 1))
+    is_disp = (ID[ad] == ord('D')) & (last_asp >= group_start)
+    disp = ad[is_disp]
+    src = ad[last_asp[is_disp]]
+    label = cmds['RackLabel']
+    rows = [pd.DataFrame({'labware_name' : [strings[x] for x in label[disp]],
+                          'position' : cmds['Position'][disp],
+                          'src_labware_name' : [strings[x] for x in label[src]],
+                          'src_position' : cmds['Position'][src],
+                          'volume' : cmds['Volume'][disp]})]
+    # other commands: reagent distribution (evenly from each source) & MCA96
+    for i,obj in sorted(cmds['objects'].items()):
+        if isinstance(obj, Fluent.Reagent_distribution):
+            dest = obj.dest_positions()
+            src_pos = np.arange(int(obj.SrcPosStart), int(obj.SrcPosEnd) + 1)
+            rows.append(pd.DataFrame({'labware_name' : obj.DestRackLabel,
+                                      'position' : np.repeat(dest, len(src_pos)),
+                                      'src_labware_name' : obj.SrcRackLabel,
+                                      'src_position' : np.tile(src_pos, len(dest)),
+                                      'volume' : float(obj.Volume) / len(src_pos)}))
+        elif i in cmds['mca']:
+            obj = cmds['mca'][i]
+            src_pos,dest = _mca_positions(obj)
+            rows.append(pd.DataFrame({'labware_name' : obj.DestRackLabel,
+                                      'position' : dest,
+                                      'src_labware_name' : obj.SrcRackLabel,
+                                      'src_position' : src_pos,
+                                      'volume' : float(obj.Volume)}))
+    df = pd.concat(rows, ignore_index=True)
+    df['position'] = df['position'].astype(np.int64)
+    df['src_position'] = df['src_position'].astype(np.int64)
+    cols = ['labware_name', 'position', 'src_labware_name', 'src_position']
+    return df.groupby(cols, as_index=False)['volume'].sum()
+
+def _command_arrays(gwl):
+    """Converting the commands to arrays:
+    ID, RackLabel, Position, Volume, TipType & TipMask (asp/disp),
+    plus a dict of the other commands (eg., Reagent_distribution; index => command)
+    String values are coded as indexes of `strings` (-1 = None).
+    """
+    commands = gwl.commands
+    if isinstance(commands, Fluent.command_store):
+        x = {'ID' : np.frombuffer(commands.ID, dtype=np.int8).astype(np.int32),
+             'Position' : np.frombuffer(commands.Position, dtype=np.int32),
+             'Volume' : np.frombuffer(commands.Volume, dtype=np.float64)}
+        for k in ('RackLabel', 'TipType', 'TipMask'):
+            x[k] = np.frombuffer(getattr(commands, k), dtype=np.int32)
+        x['strings'] = list(commands.strings)
+        x['objects'] = dict(commands.objects)
+    else:
+        strings = {}
+        def intern(value):
+            if value is None:
+                return -1
+            try:
+                return strings[value]
+            except KeyError:
+                strings[value] = len(strings)
+                return strings[value]
+        n = len(commands)
+        ID = np.zeros(n, dtype=np.int32)
+        Position = np.zeros(n, dtype=np.int32)
+        Volume = np.zeros(n, dtype=np.float64)
+        RackLabel,TipType,TipMask = [np.full(n, -1, dtype=np.int32) for i in range(3)]
+        objects = {}
+        for i,cmd in enumerate(commands):
+            if isinstance(cmd, Fluent.asp_disp):
+                ID[i] = ord(cmd._ID)
+                Position[i] = int(cmd.Position)
+                Volume[i] = float(cmd.Volume)
+                RackLabel[i] = intern(cmd.RackLabel)
+                TipType[i] = intern(cmd.TipType)
+                TipMask[i] = intern(cmd.TipMask)
+            elif isinstance(cmd, (Fluent.Waste, Fluent.Flush, Fluent.Break)):
+                ID[i] = ord(cmd.cmd()[0])
+            else:
+                objects[i] = cmd
+        x = {'ID' : ID, 'Position' : Position, 'Volume' : Volume,
+             'RackLabel' : RackLabel, 'TipType' : TipType, 'TipMask' : TipMask,
+             'strings' : sorted(strings, key=strings.get), 'objects' : objects}
+    # MCA96 steps
+    x['mca'] = {}
+    mca_commands = getattr(gwl, 'mca_commands', [])
+    for i,obj in x['objects'].items():
+        if isinstance(obj, Fluent.Comment) and obj.comment.startswith('MCA96 step '):
+            step = int(obj.comment.split(':')[0].split(' ')[-1])
+            if step <= len(mca_commands):
+                x['mca'][i] = mca_commands[step - 1]
+    return x
+
+def _mca_positions(cmd):
+    """Source & destination positions of a MCA96 transfer
+    """
+    src = np.arange(96)
+    row,col = src % 8, src // 8
+    if Fluent.get_db().get_labware_wells(cmd.DestRackType) == 384:
+        q = cmd.DestQuadrant - 1
+        dest = (col * 2 + q % 2) * 16 + row * 2 + q // 2
+    else:
+        dest = src
+    return src + 1, dest + 1
+
+def _simulate_wells(cmds, deck_model, initial_volumes, errors):
+    """Per-well volume tracking (see `simulate`)
+    Returns: pandas dataframe of well volumes
+    """
+    strings = cmds['strings']
+    # asp/disp volume changes
+    ID = cmds['ID']
+    is_ad = (ID == ord('A')) | (ID == ord('D'))
+    idx = np.flatnonzero(is_ad)
+    labels = [cmds['RackLabel'][idx]]
+    positions = [cmds['Position'][idx]]
+    deltas = [np.where(ID[idx] == ord('A'), -1.0, 1.0) * cmds['Volume'][idx]]
+    indexes = [idx]
+    # other commands: reagent distribution & MCA96
+    strings = list(strings)
+    string_idx = {x:i for i,x in enumerate(strings)}
+    def code(value):
+        try:
+            return string_idx[value]
+        except KeyError:
+            string_idx[value] = len(strings)
+            strings.append(value)
+            return string_idx[value]
+    def add(i, label, pos, delta):
+        pos = np.asarray(pos, dtype=np.int32)
+        labels.append(np.full(len(pos), code(label), dtype=np.int32))
+        positions.append(pos)
+        deltas.append(np.broadcast_to(np.asarray(delta, dtype=np.float64), pos.shape))
+        indexes.append(np.full(len(pos), i, dtype=np.int64))
+    for i,obj in sorted(cmds['objects'].items()):
+        if isinstance(obj, Fluent.Reagent_distribution):
+            dest = obj.dest_positions()
+            src = np.arange(int(obj.SrcPosStart), int(obj.SrcPosEnd) + 1)
+            add(i, obj.SrcRackLabel, src, -float(obj.Volume) * len(dest) / len(src))
+            add(i, obj.DestRackLabel, dest, float(obj.Volume))
+        elif i in cmds['mca']:
+            obj = cmds['mca'][i]
+            src,dest = _mca_positions(obj)
+            add(i, obj.SrcRackLabel, src, -float(obj.Volume))
+            add(i, obj.DestRackLabel, dest, float(obj.Volume))
+    label = np.concatenate(labels)
+    pos = np.concatenate(positions).astype(np.int64)
+    delta = np.concatenate(deltas)
+    index = np.concatenate(indexes).astype(np.int64)
+    cols = ['labware_name', 'position', 'max_volume', 'initial_volume',
+            'final_volume', 'min_volume', 'peak_volume']
+    if len(index) == 0:
+        return pd.DataFrame(columns=cols)
+
+    # labware on the deck
+    max_volumes = np.full(len(strings), np.nan)
+    for j,x in enumerate(strings):
+        max_volumes[j] = np.nan if deck_model.max_volume(x) is None else deck_model.max_volume(x)
+    missing = np.isnan(max_volumes[label])
+    for j in np.unique(label[missing]):
+        msg = 'Labware "{}" is not on the deck'
+        errors.append((index[missing & (label == j)].min() + 1, msg.format(strings[j])))
+
+    # volume of each well after each change (grouped by well; in command order)
+    order = np.lexsort((index, pos, label))
+    label,pos,delta,index = label[order],pos[order],delta[order],index[order]
+    start = np.r_[True, (label[1:] != label[:-1]) | (pos[1:] != pos[:-1])]
+    starts = np.flatnonzero(start)
+    group = np.cumsum(start) - 1
+    cumsum = np.cumsum(delta)
+    volume = cumsum - (cumsum[starts] - delta[starts])[group]
+    min_volume = np.minimum.reduceat(volume, starts)
+    # initial volumes (provided or min. needed)
+    well_label = [strings[x] for x in label[starts]]
+    well_pos = pos[starts]
+    initial = np.full(len(starts), np.nan)
+    for j,(x,y) in enumerate(zip(well_label, well_pos)):
+        v = initial_volumes.get((x, int(y)), initial_volumes.get(x))
+        if v is not None:
+            initial[j] = v
+    has_initial = ~np.isnan(initial)
+    initial = np.where(has_initial, initial, np.maximum(-min_volume, 0))
+    volume += initial[group]
+    peak_volume = np.maximum(np.maximum.reduceat(volume, starts), initial)
+    final_volume = volume[np.r_[starts[1:] - 1, len(volume) - 1]]
+    max_volume = max_volumes[label[starts]]
+
+    # depletion
+    depleted = (volume < -TOLERANCE) & has_initial[group]
+    for j,k in zip(*np.unique(group[depleted], return_index=True)):
+        msg = 'Well {} of "{}" is depleted: {} ul short'
+        errors.append((index[depleted][k] + 1,
+                       msg.format(well_pos[j], well_label[j], round(-volume[depleted][k], 3))))
+    # capacity
+    over = volume > max_volume[group] + TOLERANCE
+    for j,k in zip(*np.unique(group[over], return_index=True)):
+        msg = 'Well {} of "{}" exceeds the max volume: {} > {} ul'
+        errors.append((index[over][k] + 1,
+                       msg.format(well_pos[j], well_label[j],
+                                  round(volume[over][k], 3), max_volume[j])))
+    # table
+    df = pd.DataFrame({'labware_name' : well_label,
+                       'position' : well_pos,
+                       'max_volume' : max_volume,
+                       'initial_volume' : initial,
+                       'final_volume' : final_volume,
+                       'min_volume' : np.minimum(min_volume, 0) + initial,
+                       'peak_volume' : peak_volume}, columns=cols)
+    return df
+
+def _simulate_tips(cmds, deck_model, errors):
+    """Tip consumption (see `simulate`).
+    1 tip is picked up per channel (TipMask) used between tip wastes ("W;").
+    Returns: pandas dataframe of tip usage per tip box type
+    """
+    db = Fluent.get_db()
+    strings = cmds['strings']
+    ID = cmds['ID']
+    # asp/disp "tip segments" (between wastes)
+    segment = np.cumsum(ID == ord('W'))
+    asp = np.flatnonzero(ID == ord('A'))
+    if len(asp) == 0:
+        asp = np.zeros(0, dtype=np.int64)
+    seg_mask = np.stack([segment[asp], cmds['TipMask'][asp]])
+    _,first,inverse = np.unique(seg_mask, axis=1, return_index=True, return_inverse=True)
+    inverse = np.asarray(inverse).ravel()
+    # TipType of the last aspirate of each segment & channel
+    last = np.zeros(len(first), dtype=np.int64)
+    last[inverse] = np.arange(len(asp))
+    pickups = asp[first]
+    tip_types = cmds['TipType'][asp[last]]
+    tip_boxes = [db.get_tip_box(strings[x]) if x >= 0 else None for x in tip_types]
+    n_tips = np.ones(len(pickups), dtype=np.int64)
+    # reagent distribution & MCA96
+    extra = []
+    for i,obj in sorted(cmds['objects'].items()):
+        if isinstance(obj, Fluent.Reagent_distribution):
+            extra.append((i, obj.TipType, obj.tip_count()))
+        elif i in cmds['mca']:
+            extra.append((i, cmds['mca'][i].TipType, 96))
+    if len(extra) > 0:
+        pickups = np.r_[pickups, [x[0] for x in extra]]
+        tip_boxes += [db.get_tip_box(x[1]) if x[1] is not None else None for x in extra]
+        n_tips = np.r_[n_tips, [x[2] for x in extra]]
+    # cumulative tips per tip box type
+    rows = []
+    order = np.argsort(pickups, kind='stable')
+    tip_boxes = np.array(tip_boxes, dtype=object)[order]
+    pickups,n_tips = pickups[order],n_tips[order]
+    for tip_box in pd.unique(tip_boxes):
+        if tip_box is None:
+            continue
+        x = tip_boxes == tip_box
+        used = np.cumsum(n_tips[x])
+        available = deck_model.tip_capacity(tip_box)
+        rows.append([tip_box, int(used[-1]), available])
+        short = np.flatnonzero(used > available)
+        if len(short) > 0:
+            msg = 'Not enough "{}" tips: {} tips on the deck'
+            errors.append((pickups[x][short[0]] + 1, msg.format(tip_box, available)))
+    return pd.DataFrame(rows, columns=['tip_box', 'used', 'available'])
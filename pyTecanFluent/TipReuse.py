@@ -0,0 +1,71 @@
+from __future__ import print_function
+
+# import
+## 3rd party
+import numpy as np
+
+
+# functions
+def channel_order(n, n_channels=8):
+    """Channel (0-indexed) of each of n asp/disp, cycling through the channels
+    n : number of asp/disp
+    n_channels : number of channels
+    Returns: numpy array
+    """
+    return np.arange(n) % n_channels
+
+def tip_batch(x, n_tip_reuse=1):
+    """Grouping asp/disp into tip-reuse batches.
+    A new channel cycle starts each time the channel order decreases,
+    and a new batch starts every n_tip_reuse channel cycles.
+    x : channel order (see `channel_order`)
+    n_tip_reuse : number of tip reuses
+    Returns: numpy array of batch IDs
+    """
+    x = np.asarray(x)
+    if x.shape[0] == 0:
+        return np.zeros(0, dtype=np.int64)
+    last = np.concatenate([[0], x[:-1]])
+    cycles = np.cumsum(x < last)
+    return cycles // n_tip_reuse
+
+def channel_batches(n, n_tip_reuse=1, n_channels=8):
+    """Channel order & tip-reuse batch of each of n asp/disp
+    n : number of asp/disp
+    n_tip_reuse : number of tip reuses
+    n_channels : number of channels
+    Returns: (channel order, batch IDs) numpy arrays
+    """
+    x = channel_order(n, n_channels)
+    return x, tip_batch(x, n_tip_reuse)
+
+def plate_tip_reuse_order(n, n_tip_reuse, n_channels=8):
+    """Order of n asp/disp so that each channel re-uses its tip n_tip_reuse times.
+    The channels used are capped by the number of tip-reuse groups
+    (ceiling of n / n_tip_reuse).
+    n : number of asp/disp
+    n_tip_reuse : number of tip reuses
+    n_channels : max number of channels
+    Returns: numpy array of row indices (a stable ordering)
+    """
+    idx = np.arange(n)
+    if n_tip_reuse <= 1 or n == 0:
+        return idx
+    n_chan = int(round(n / float(n_tip_reuse) + 0.4999, 0))
+    n_chan = min(n_chan, n_channels)
+    channel = idx % n_chan
+    reuse = idx // (n_chan * n_tip_reuse)
+    return np.lexsort((channel, reuse))
+
+def reorder_plate_n_tip_reuse(df, n_tip_reuse, n_channels=8):
+    """Reordering mapping dataframe to account for n_tip_reuse
+    (see `plate_tip_reuse_order`)
+    df : pandas.DataFrame
+    n_tip_reuse : number of tip reuses
+    n_channels : max number of channels
+    Returns: pandas.DataFrame
+    """
+    if n_tip_reuse > 1:
+        order = plate_tip_reuse_order(df.shape[0], n_tip_reuse, n_channels)
+        df = df.iloc[order].reset_index(drop=True)
+    return df
@@ -13,6 +13,7 @@ import pandas as pd
 from pyTecanFluent import Utils
 from pyTecanFluent import Fluent
 from pyTecanFluent import Labware
+from pyTecanFluent import Runtime
 from pyTecanFluent import Tn5_onBead_pip
 
 
@@ -71,6 +72,12 @@ def parse_args(test_args=None, subparsers=None):
                          help='Which rows of the sample file to use (eg., "all"=all rows; "1-48"=rows1-48; "1,3,5-6"=rows1+3+5+6), (default: %(default)s)')
     groupIO.add_argument('--prefix', type=str, default='TECAN_Tn5-on-Bead',
                          help='Output file name prefix (default: %(default)s)')
+    groupIO.add_argument('--win', action='store_true', default=False,
+                         help='Write output files with Windows line breaks (CRLF)')
+    groupIO.add_argument('--runtime', action='store_true', default=False,
+                         help='Write an estimate of the robot run time (per stage & total)')
+    groupIO.add_argument('--time-model', type=str, default=None,
+                         help='JSON file of per-command times (seconds) for --runtime (default: the package time model)')
     
     ## Reagents
     pcr_rgnt = parser.add_argument_group('PCR Reagents')
@@ -156,11 +163,16 @@ def main_PCR(df_map, args):
     
     ## writing out worklist (gwl) file
     gwl_file = args.prefix + '_pcr.gwl'
-    gwl.write(gwl_file)
+    gwl.write(gwl_file, line_ending=Utils.line_ending(args.win))
+    if args.runtime:
+        runtime_file = os.path.splitext(gwl_file)[0] + '_runtime.txt'
+        Runtime.write_estimate(gwl, runtime_file, time_model=args.time_model,
+                               line_ending=Utils.line_ending(args.win))
+        Utils.file_written(runtime_file)
     
     # Report (total volumes; sample truncation; samples)
     report_file = args.prefix + '_pcr_report.txt'
-    with open(report_file, 'w') as repFH:
+    with open(report_file, 'w', newline=Utils.line_ending(args.win)) as repFH:
         write_pcr_report(df_map, outFH=repFH,
                          mm_volume=args.mm_volume,
                          prm_volume=args.primer_volume,
@@ -171,15 +183,16 @@ def main_PCR(df_map, args):
     lw.add_gwl(gwl)
     lw_df = lw.table()
     lw_file = args.prefix + '_pcr_labware.txt'
-    lw_df.to_csv(lw_file, sep='\t', index=False)
+    Utils.write_table(lw_df, lw_file, line_ending=Utils.line_ending(args.win))
         
     # Mapping file with destinations
     df_file = args.prefix + '_pcr_map.txt'
     df_map['TECAN_dest_target_position'] = df_map['TECAN_dest_target_position'].astype(int)
-    df_map.to_csv(df_file, sep='\t', index=False, na_rep='NA')
+    Utils.write_table(df_map, df_file, line_ending=Utils.line_ending(args.win), na_rep='NA')
 
     # Plate map file for Bio-Rad PrimePCR software (designates: sampleID <--> wellID)
-    biorad_files = PrimerPCR_plate_map(df_map, prefix=args.prefix)
+    biorad_files = PrimerPCR_plate_map(df_map, prefix=args.prefix,
+                                       line_ending=Utils.line_ending(args.win))
     
     # status on files written
     Utils.file_written(gwl_file)
@@ -337,19 +350,7 @@ def add_dest(df_map):#, dest_labware, dest_type='384 Well Biorad PCR', dest_star
     df_map['TECAN_dest_target_position'] = df_map['TECAN_sample_target_position']
     return df_map
         
-def reorder_384well(df, reorder_col):
-    """Reorder values so that the odd, then the even locations are
-    transferred. This is faster for a 384-well plate
-    df: pandas.DataFrame
-    reorder_col: column name to reorder
-    """
-    df['TECAN_sort_IS_EVEN'] = [x % 2 == 0 for x in df[reorder_col]]
-    df.sort_values(by=['TECAN_sort_IS_EVEN', reorder_col], inplace=True)
-    df = df.drop('TECAN_sort_IS_EVEN', 1)
-    df.index = range(df.shape[0])
-    return df
-
-def PrimerPCR_plate_map(df_map, prefix='PrimerPCR', sep=','):
+def PrimerPCR_plate_map(df_map, prefix='PrimerPCR', sep=',', line_ending=None):
     """Create a PrimerPCR plate map table.
     This table is imported by PrimerPCR to designate: sampleID <--> wellID
     Table columns: Row     Column  *Target Name    *Sample Name
@@ -357,6 +358,7 @@ def PrimerPCR_plate_map(df_map, prefix='PrimerPCR', sep=','):
       "Column" : plate column
       "*Target Name" : Not needed (NA)
       "*Sample Name" : Sample in well
+    line_ending : line break for the files (see `Utils.line_ending`)
     Return: list of pandas dataframes (1 dataframe per file)
     """
     # Plate import file for Bio-Rad PrimePCR software
@@ -367,11 +369,13 @@ def PrimerPCR_plate_map(df_map, prefix='PrimerPCR', sep=','):
     if isinstance(df_biorad.index, pd.MultiIndex):
         for labware in df_biorad.index.get_level_values(0).unique():
             biorad_file = prefix + '_BIORAD-{}.txt'.format(labware.replace(' ', '_'))
-            df_biorad.loc[labware].to_csv(biorad_file, sep=sep, index=False, na_rep='')
+            Utils.write_table(df_biorad.loc[labware], biorad_file, sep=sep,
+                              line_ending=line_ending, na_rep='')
             biorad_files.append(biorad_file)
     else:
         biorad_file = prefix + '_BIORAD.txt'
-        df_biorad.to_csv(biorad_file, sep=sep, index=False, na_rep='')
+        Utils.write_table(df_biorad, biorad_file, sep=sep,
+                          line_ending=line_ending, na_rep='')
         biorad_files.append(biorad_file)
     
     return biorad_files
@@ -388,11 +392,10 @@ def map2biorad(df_map, positions):
     df_biorad = df_biorad[['SampleID', 'TECAN_dest_target_position']]
     df_biorad.columns = ['*Sample Name', 'TECAN_dest_target_position']
     lw_utils = Labware.utils()
-    f = functools.partial(lw_utils.position2well, wells = positions)
-    x = df_map['TECAN_dest_target_position'].apply(f)
-    x = pd.DataFrame([y for y in x], columns=['Row', 'Column'])
-    df_biorad['Row'] = x.iloc[:,0].tolist()
-    df_biorad['Column'] = x.iloc[:,1].tolist()
+    rows,cols = lw_utils.positions2wells(df_map['TECAN_dest_target_position'],
+                                         wells=positions)
+    df_biorad['Row'] = rows
+    df_biorad['Column'] = cols
 
     df_biorad['*Target Name'] = np.nan
     df_biorad = df_biorad[['Row', 'Column', '*Target Name', '*Sample Name']]
@@ -75,68 +75,33 @@ def pip_mastermix(df_map, gwl,  mm_labware_type='25ml_1 waste',
                 else:
                     gwl.add(Fluent.Flush())
         gwl.add(Fluent.Break())
-        for i in x:    
-            # aliquoting mastermix
-            ## aspiration
-            asp = Fluent.Aspirate()
-            asp.RackLabel = 'Mastermix[{0:0>3}]'.format(1)
-            asp.RackType = mm_labware_type
-            asp.Position = 1
-            asp.Volume = mm_volume
-            asp.LiquidClass = liq_cls
-            gwl.add(asp)
-            ## dispensing
-            disp = Fluent.Dispense()
-            disp.RackLabel = df.loc[i,'TECAN_dest_labware_name']
-            disp.RackType = df.loc[i,'TECAN_dest_labware_type']
-            disp.Position = df.loc[i,'TECAN_dest_target_position']
-            disp.Volume = mm_volume
-            disp.LiquidClass = liq_cls
-            gwl.add(disp)
-            ## tip waste
-            gwl.add(Fluent.Waste())
+        # aliquoting mastermix
+        gwl.add_transfers(df.iloc[x],
+                          src_labware_name='Mastermix[{0:0>3}]'.format(1),
+                          src_labware_type=mm_labware_type,
+                          src_target_position=1,
+                          dest_labware_name='TECAN_dest_labware_name',
+                          dest_labware_type='TECAN_dest_labware_type',
+                          dest_target_position='TECAN_dest_target_position',
+                          volume=mm_volume,
+                          liq_cls=liq_cls)
     gwl.add(Fluent.Break())
                 
-def pip_primer(i, gwl, df_map, primer_labware_name, 
-               primer_labware_type, primer_target_position,
-               primer_volume, liq_cls):
-    """
-    Pipetting a single primer
-    """
-    # aspiration
-    asp = Fluent.Aspirate()
-    asp.RackLabel = df_map.loc[i, primer_labware_name]
-    asp.RackType = df_map.loc[i, primer_labware_type]
-    asp.Position = df_map.loc[i, primer_target_position]
-    asp.Volume = primer_volume
-    asp.LiquidClass = liq_cls
-    gwl.add(asp)
-
-    # dispensing
-    disp = Fluent.Dispense()
-    disp.RackLabel = df_map.loc[i,'TECAN_dest_labware_name']
-    disp.RackType = df_map.loc[i,'TECAN_dest_labware_type']
-    disp.Position = df_map.loc[i,'TECAN_dest_target_position']
-    disp.Volume = primer_volume
-    asp.LiquidClass = liq_cls
-    gwl.add(disp)
-
-    # waste
-    gwl.add(Fluent.Waste())
-    
 def pip_primers(df_map, gwl, prm_volume=0, liq_cls='Water Free Single'):
     """
     Commands for aliquoting primers
     """
     gwl.add(Fluent.Comment('Primers'))    
-    for i in range(df_map.shape[0]):
-        if prm_volume <= 0:
-            continue
-        pip_primer(i, gwl, df_map,
-                   'TECAN_primer_labware_name', 
-                   'TECAN_primer_labware_type',
-                   'TECAN_primer_target_position',
-                   prm_volume, liq_cls)
+    if prm_volume > 0:
+        gwl.add_transfers(df_map,
+                          src_labware_name='TECAN_primer_labware_name',
+                          src_labware_type='TECAN_primer_labware_type',
+                          src_target_position='TECAN_primer_target_position',
+                          dest_labware_name='TECAN_dest_labware_name',
+                          dest_labware_type='TECAN_dest_labware_type',
+                          dest_target_position='TECAN_dest_target_position',
+                          volume=prm_volume,
+                          liq_cls=liq_cls)
         
     # adding break
     gwl.add(Fluent.Break())
@@ -1,11 +1,11 @@
 from __future__ import print_function
 # import
 ## batteries
-from itertools import product,cycle
+from itertools import product
 ## 3rd party
 import numpy as np
 ## package
-from pyTecanFluent import Utils
+from pyTecanFluent import TipReuse
 from pyTecanFluent import Fluent
 from pyTecanFluent import Labware
 
@@ -20,32 +20,20 @@ def pip_Tn5_mastermix(df_map, gwl, mm_volume,
         return None
 
     # reordering to account for n_tip_reuse
-    df_map = Utils.reorder_plate_n_tip_reuse(df_map, n_tip_reuse)
+    df_map = TipReuse.reorder_plate_n_tip_reuse(df_map, n_tip_reuse)
 
     # for each Sample, write out asp/dispense commands
     gwl.add(Fluent.Comment('Tn5 mastermix (Tn5 + buffer + water)'))
-    for i in range(df_map.shape[0]):        
-        # aspiration
-        asp = Fluent.Aspirate()
-        asp.RackLabel = 'Tn5_mastermix'
-        asp.RackType = src_labware_type
-        asp.Position = 1
-        asp.Volume = mm_volume
-        asp.LiquidClass = liq_cls
-        gwl.add(asp)
-
-        # dispensing
-        disp = Fluent.Dispense()
-        disp.RackLabel = df_map.loc[i,'TECAN_dest_labware_name']
-        disp.RackType = df_map.loc[i,'TECAN_dest_labware_type']
-        disp.Position = df_map.loc[i,'TECAN_dest_target_position']
-        disp.Volume = mm_volume
-        disp.LiquidClass = liq_cls
-        gwl.add(disp)
-
-        # waste
-        if (i + 1) % n_tip_reuse == 0 or i + 1 == df_map.shape[0]:
-            gwl.add(Fluent.Waste())
+    gwl.add_transfers(df_map,
+                      src_labware_name='Tn5_mastermix',
+                      src_labware_type=src_labware_type,
+                      src_target_position=1,
+                      dest_labware_name='TECAN_dest_labware_name',
+                      dest_labware_type='TECAN_dest_labware_type',
+                      dest_target_position='TECAN_dest_target_position',
+                      volume=mm_volume,
+                      liq_cls=liq_cls,
+                      n_tip_reuse=n_tip_reuse)
         
     # adding break
     gwl.add(Fluent.Break())
@@ -55,28 +43,15 @@ def pip_samples(df_map,  gwl, DNA_volume=1, liq_cls='Water Free Single', n_tip_r
     """
     gwl.add(Fluent.Comment('Samples'))
     # for each Sample-PCR, write out asp/dispense commands
-    for i in range(df_map.shape[0]):
-        
-        # aspiration
-        asp = Fluent.Aspirate()
-        asp.RackLabel = df_map.loc[i,'TECAN_sample_labware_name']
-        asp.RackType = df_map.loc[i,'TECAN_sample_labware_type']
-        asp.Position = df_map.loc[i,'TECAN_sample_target_position']
-        asp.Volume = DNA_volume
-        asp.LiquidClass = liq_cls
-        gwl.add(asp)
-
-        # dispensing
-        disp = Fluent.Dispense()
-        disp.RackLabel = df_map.loc[i,'TECAN_dest_labware_name']
-        disp.RackType = df_map.loc[i,'TECAN_dest_labware_type']
-        disp.Position = df_map.loc[i,'TECAN_dest_target_position']
-        disp.Volume = DNA_volume
-        disp.LiquidClass = liq_cls
-        gwl.add(disp)
-
-        # waste
-        gwl.add(Fluent.Waste())
+    gwl.add_transfers(df_map,
+                      src_labware_name='TECAN_sample_labware_name',
+                      src_labware_type='TECAN_sample_labware_type',
+                      src_target_position='TECAN_sample_target_position',
+                      dest_labware_name='TECAN_dest_labware_name',
+                      dest_labware_type='TECAN_dest_labware_type',
+                      dest_target_position='TECAN_dest_target_position',
+                      volume=DNA_volume,
+                      liq_cls=liq_cls)
         
     # adding break
     gwl.add(Fluent.Break())
@@ -99,80 +74,42 @@ def pip_mastermix(df_map, gwl,  mm_labware_type='25ml_1 waste',
 
     # copying df
     df = df_map.copy()
-    x = cycle(range(8))
-    df['CHANNEL_ORDER'] = [next(x) for y in range(df.shape[0])]
-    x = cycle(range(n_tip_reuse))
-    df['TIP_BATCH'] = Utils.tip_batch(df['CHANNEL_ORDER'], n_tip_reuse)
+    x = TipReuse.channel_batches(df.shape[0], n_tip_reuse)
+    df['CHANNEL_ORDER'],df['TIP_BATCH'] = x
     df.sort_values(by=['TIP_BATCH',
                        'CHANNEL_ORDER',
                        'TECAN_dest_target_position'], inplace=True)
     df.reset_index(inplace=True)
     
     # for each Sample-PCR, write out asp/dispense commands
-    for i in range(df.shape[0]):
-        # aspiration
-        asp = Fluent.Aspirate()
-        asp.RackLabel = 'Mastermix[{0:0>3}]'.format(1)
-        asp.RackType = mm_labware_type
-        asp.Position = 1
-        asp.Volume = mm_volume
-        asp.LiquidClass = liq_cls
-        gwl.add(asp)
-
-        # dispensing
-        disp = Fluent.Dispense()
-        disp.RackLabel = df.loc[i,'TECAN_dest_labware_name']
-        disp.RackType = df.loc[i,'TECAN_dest_labware_type']
-        disp.Position = df.loc[i,'TECAN_dest_target_position']
-        disp.Volume = mm_volume
-        disp.LiquidClass = liq_cls
-        gwl.add(disp)
-
-        # tip waste
-        if (i + 1) % n_tip_reuse == 0 or i + 1 == df.shape[0]:
-            gwl.add(Fluent.Waste())
+    gwl.add_transfers(df,
+                      src_labware_name='Mastermix[{0:0>3}]'.format(1),
+                      src_labware_type=mm_labware_type,
+                      src_target_position=1,
+                      dest_labware_name='TECAN_dest_labware_name',
+                      dest_labware_type='TECAN_dest_labware_type',
+                      dest_target_position='TECAN_dest_target_position',
+                      volume=mm_volume,
+                      liq_cls=liq_cls,
+                      n_tip_reuse=n_tip_reuse)
             
     # adding break
     gwl.add(Fluent.Break())
 
-def pip_primer(i, gwl, df_map, primer_labware_name, 
-               primer_labware_type, primer_target_position,
-               primer_volume, liq_cls):
-    """Pipetting a single primer
-    """
-    # aspiration
-    asp = Fluent.Aspirate()
-    asp.RackLabel = df_map.loc[i, primer_labware_name]
-    asp.RackType = df_map.loc[i, primer_labware_type]
-    asp.Position = df_map.loc[i, primer_target_position]
-    asp.Volume = primer_volume
-    asp.LiquidClass = liq_cls
-    gwl.add(asp)
-
-    # dispensing
-    disp = Fluent.Dispense()
-    disp.RackLabel = df_map.loc[i,'TECAN_dest_labware_name']
-    disp.RackType = df_map.loc[i,'TECAN_dest_labware_type']
-    disp.Position = df_map.loc[i,'TECAN_dest_target_position']
-    disp.Volume = primer_volume
-    asp.LiquidClass = liq_cls
-    gwl.add(disp)
-
-    # waste
-    gwl.add(Fluent.Waste())
-    
 def pip_primers(df_map, gwl, prm_volume=0, liq_cls='Water Free Single'):
     """Commands for aliquoting primers
     """
     gwl.add(Fluent.Comment('Primers'))    
-    for i in range(df_map.shape[0]):
-        if prm_volume <= 0:
-            continue
-        pip_primer(i, gwl, df_map,
-                   'TECAN_primer_labware_name', 
-                   'TECAN_primer_labware_type',
-                   'TECAN_primer_target_position',
-                   prm_volume, liq_cls)
+    if prm_volume > 0:
+        gwl.add_transfers(df_map,
+                          src_labware_name='TECAN_primer_labware_name',
+                          src_labware_type='TECAN_primer_labware_type',
+                          src_target_position='TECAN_primer_target_position',
+                          dest_labware_name='TECAN_dest_labware_name',
+                          dest_labware_type='TECAN_dest_labware_type',
+                          dest_target_position='TECAN_dest_target_position',
+                          volume=prm_volume,
+                          liq_cls=liq_cls)
         
     # adding break
     gwl.add(Fluent.Break())
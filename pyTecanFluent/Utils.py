@@ -4,11 +4,20 @@ from __future__ import print_function
 import os
 import sys
 import re
+import inspect
 import logging
-import itertools
-from functools import partial
 import numpy as np
 import pandas as pd
+## package
+from pyTecanFluent import Fluent
+from pyTecanFluent import Labware
+from pyTecanFluent import TipReuse
+
+# pandas renamed "line_terminator" to "lineterminator" (v1.5)
+if 'lineterminator' in inspect.signature(pd.DataFrame.to_csv).parameters:
+    LINETERMINATOR_KW = 'lineterminator'
+else:
+    LINETERMINATOR_KW = 'line_terminator'
 
 # functions
 def rm_special_chars(x, colname=None):
@@ -71,38 +80,51 @@ def make_range(x, set_zero_index=False):
 
 
 def check_gwl(gwl_file):
-    """Checking that gwl in correct format
+    """Checking that gwl in correct format (see `Fluent.validate_gwl`)
     gwl_file : input file name or file handle
+    Raises ValueError listing all errors (with line numbers) found
     """
-    # file read
-    try:
-        gwl_file = open(gwl_file, 'r')
-    except ValueError:
-        pass
-    # checks
-    for line in gwl_file:
-        line = line.rstrip()
-        if line is '':
-            msg = 'Empty lines not allowed in gwl files'
-            raise ValueError(msg)
-        if not line[0] in ('A', 'D', 'R', 'W', 'F', 'C', 'B'):
-            msg = '"{}" not a valid command ID'
-            raise ValueError(msg.format(line[0]))
-    # file close
-    gwl_file.close()
-
+    errors = []
+    records = Fluent.parse_gwl(gwl_file)
+    for line_num,msg in Fluent.validate_gwl(records):
+        errors.append('Line {}: {}'.format(line_num, msg))
+    if len(errors) > 0:
+        msg = 'Errors found in gwl file:\n' + '\n'.join(errors)
+        raise ValueError(msg)
+
+
+def line_ending(win=False):
+    """Line ending for output files
+    win : bool, use Windows line breaks (CRLF)?
+    Returns : '\\r\\n' if win, else None (the platform default)
+    """
+    if win is True:
+        return '\r\n'
+    return None
+
+def write_table(df, file_name, sep='\t', line_ending=None, **kwargs):
+    """Writing a pandas data.frame as a table (no index)
+    df : pandas data.frame
+    file_name : str, output file name
+    line_ending : str, line break used for the table (None = default)
+    kwargs : passed to pandas.DataFrame.to_csv
+    """
+    if line_ending is not None:
+        kwargs[LINETERMINATOR_KW] = line_ending
+    df.to_csv(file_name, sep=sep, index=False, **kwargs)
 
 def to_win(file_name, suffix='_win'):
     """Create a copy of a file but with windows line breakds
     file_name : str, name of file
     suffix : added to file name of copy
     Returns : name of new file
+    Note: output files can be written with windows line breaks directly
+    (see `line_ending`), which avoids this extra read/write of the file.
     """
     x = os.path.splitext(file_name)
     out_file = x[0] + suffix + x[1]
-    with open(file_name) as inFH, open(out_file, 'w') as outFH:
+    with open(file_name) as inFH, open(out_file, 'w', newline='\r\n') as outFH:
         for line in inFH:
-            line = line.replace('\n', '\r\n')
             outFH.write(line)
     return out_file
 
@@ -129,78 +151,103 @@ def backup_file(f):
         logging.warning('{0} doesn\'t exist'.format(f))
 
         
-def _reorder_384well(df, gwl, labware_type_col, position_col):
+def _plate_rows_cols(positions, n_wells):
+    n_rows = Labware.get_geometry(n_wells).n_rows
+    idx = np.asarray(positions, dtype=np.int64) - 1
+    return idx % n_rows, idx // n_rows, n_rows
+
+def channel_pitch_offsets(positions, n_wells, n_channels=8):
+    """Channel-pitch offset of each (column-wise) position on a plate.
+    The FCA channels are spaced for a 96-well plate, so on denser plates
+    adjacent channels are n_rows/8 rows apart (2 rows for 384 wells,
+    4 rows for 1536 wells). Wells with the same offset can be reached by
+    all channels in one pass.
+    positions : array of plate positions
+    n_wells : number of wells in the plate
+    n_channels : number of channels
+    Return: array of offsets (all 0 for 96-well or smaller plates)
+    """
+    rows,_,n_rows = _plate_rows_cols(positions, n_wells)
+    pitch = max(n_rows // n_channels, 1)
+    return rows % pitch
+
+def odd_even_offsets(positions, n_wells, n_channels=8):
+    """Odd (0) or even (1) position; all odd positions are pipetted first
+    """
+    return (np.asarray(positions, dtype=np.int64) - 1) % 2
+
+def quadrant_offsets(positions, n_wells, n_channels=8):
+    """Quadrant (0-indexed) of each position on a plate, with the quadrants
+    ordered as for the MCA96 (A1, A2, B1, B2). 1536-well plates have 16
+    "quadrants" (every 4th row & column).
+    """
+    rows,cols,n_rows = _plate_rows_cols(positions, n_wells)
+    pitch = max(n_rows // n_channels, 1)
+    return cols % pitch + pitch * (rows % pitch)
+
+# destination ordering strategies: name => function(positions, n_wells, n_channels)
+REORDER_STRATEGIES = {'pitch' : channel_pitch_offsets,
+                      'odd_even' : odd_even_offsets,
+                      'quadrant' : quadrant_offsets}
+
+def reorder_384well(df, gwl, labware_name_col, labware_type_col, position_col,
+                    strategy='pitch', n_channels=8):
+    """Reordering target positions of any 384-well (or 1536-well) labware types in df.
+    Reordering to account for channel offset (reordering speeds up asp/disp).
+    The order is computed as one (stable) sort key across all labware:
+      [labware, strategy offset, position]
+    If no positions are reordered, the input order is kept; otherwise
+    the rows are grouped by labware (sorted by name & type).
+    df : pandas.DataFrame
+    gwl : gwl object (for the labware database)
+    strategy : ordering strategy; see `REORDER_STRATEGIES`, or a function(positions, n_wells, n_channels)
+    n_channels : number of channels
+    Return: reordered pandas.DataFrame (reset index)
+    """
+    if not callable(strategy):
+        try:
+            strategy = REORDER_STRATEGIES[strategy]
+        except KeyError:
+            msg = 'Reorder strategy not recognized: "{}"'
+            raise ValueError(msg.format(strategy))
     df[position_col] = pd.to_numeric(df[position_col])
-    
-    odd_even = lambda x: (x % 2, x)
-
-    # n-wells for labware type
-    labware_type = df[labware_type_col].unique()[0]
-    n_wells = gwl.db.get_labware_wells(labware_type)
-    if n_wells == 384:
-        df = pd.concat([df.loc[df[position_col] % 2 != 0].sort_values(by=position_col),
-                        df.loc[df[position_col] % 2 == 0].sort_values(by=position_col)])
-    return df
-
-def reorder_384well(df, gwl, labware_name_col, labware_type_col, position_col):
-    """Reordering target positions of any 384-well labware types in df.
-    Reordering to all odd-even in order to account for channel offset (reordering speeds up asp/disp)
-    Method:
-    # group by labware name and iter by groups
-    ## if labware type is 384 well `n_wells = gwl.db.get_labware_wells(labware_type)`
-    ### reorder by odd-even
-    """
-    f = partial(_reorder_384well, gwl=gwl,
-                labware_type_col=labware_type_col,
-                position_col=position_col)
-    df = df.groupby([labware_name_col, labware_type_col]).apply(f).reset_index(drop=True)
-    return df
-
-def reorder_plate_n_tip_reuse(df, n_tip_reuse):
-    """Reordering mapping dataframe to account for n_tip_reuse  
-    """
-    # determine the number of channels that will be used
-    new_cols = ['CHANNEL_IDX', 'TIP_REUSE_IDX']
-    if n_tip_reuse > 1:
-        n_channels = df.shape[0] / float(n_tip_reuse)
-        n_channels = int(round(n_channels+ 0.4999, 0))
-        n_channels = 8 if n_channels >= 8 else n_channels
-        # Add channel cycle
-        x = itertools.islice(itertools.cycle(range(n_channels)), df.shape[0])
-        df[new_cols[0]] =  [y + 1 for y in x]        
-        # Add channel repeat
-        x = [[y] * n_channels * n_tip_reuse for y in range(int(df.shape[0] / n_channels))]
-        x = [item for sublist in x for item in sublist]
-        df[new_cols[1]] = x[:df.shape[0]]        
-        # sorting
-        df = df.sort_values(by=new_cols[::-1])
-        #cols = ['SampleID', 'TECAN_sample_labware_name', 'TECAN_sample_target_position',
-        #        'TECAN_dest_target_position'] + new_cols
-        #df[cols].to_csv(sys.stdout, sep='\t'); exit()
-        
-        # clean up df
-        df.drop(new_cols, axis=1, inplace=True)
-        df.reset_index(drop=True, inplace=True)
-        
-    return df
+    positions = df[position_col].values
+    n_rows = df.shape[0]
+    # number of wells for each labware type
+    labware_types = df[labware_type_col].values
+    n_wells = np.zeros(n_rows, dtype=np.int64)
+    for labware_type in pd.unique(labware_types):
+        wells = gwl.db.get_labware_wells(labware_type)
+        if wells in Labware.PLATE_FORMATS and wells > 96:
+            n_wells[labware_types == labware_type] = wells
+    # sort key: labware, offset, position (original order if not reordered)
+    to_reorder = n_wells > 0
+    offsets = np.zeros(n_rows, dtype=np.int64)
+    pos_key = np.arange(n_rows, dtype=np.float64)
+    for wells in np.unique(n_wells[to_reorder]):
+        idx = n_wells == wells
+        offsets[idx] = strategy(positions[idx], wells, n_channels)
+        pos_key[idx] = positions[idx]
+    labware = pd.MultiIndex.from_arrays([df[labware_name_col], df[labware_type_col]])
+    labware = pd.factorize(labware, sort=True)[0]
+    order = np.lexsort((np.arange(n_rows), pos_key, offsets, labware))
+    # no change in order within any labware => keeping the input order
+    if (order == np.lexsort((np.arange(n_rows), labware))).all():
+        return df.reset_index(drop=True)
+    return df.iloc[order].reset_index(drop=True)
+
+def reorder_plate_n_tip_reuse(df, n_tip_reuse, n_channels=8):
+    """Reordering mapping dataframe to account for n_tip_reuse
+    (see `TipReuse.reorder_plate_n_tip_reuse`)
+    """
+    return TipReuse.reorder_plate_n_tip_reuse(df, n_tip_reuse, n_channels)
 
 
 def tip_batch(x, n_tip_reuse=1):
     """Grouping asp/disp into tip-reuse batches
+    (see `TipReuse.tip_batch`)
     """
-    x = list(x)
-    batchID = 0
-    channel_cycles = 1
-    last_value = 0
-    y = []
-    for xx in x:
-        if xx < last_value:
-            if channel_cycles % n_tip_reuse == 0:
-                batchID += 1
-            channel_cycles += 1
-        y.append(batchID)
-        last_value = xx
-    return y
+    return TipReuse.tip_batch(x, n_tip_reuse).tolist()
 
     
 # main
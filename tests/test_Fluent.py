@@ -26,6 +26,17 @@ def test_db():
     v = db.get_labware(RackType)
     assert isinstance(v, dict)
     
+def test_db_shared():
+    db1 = Fluent.db()
+    db2 = Fluent.db()
+    assert db1.labware is db2.labware
+    assert Fluent.get_db() is Fluent.get_db()
+    # read-only tables
+    RackType = db1.RackTypes()[0]
+    with pytest.raises(TypeError):
+        db1.get_labware(RackType)['wells'] = 1
+    assert db1.get_labware(RackType)['RackType'] == RackType
+    
 def test_aspirate():
     asp = Fluent.Aspirate()
     asp.RackLabel = 'test'
@@ -56,4 +67,464 @@ def test_labware():
     gwl = Fluent.gwl()
     ret = lw.add_gwl(gwl)
     assert ret is None
-        
+
+def _add_commands(gwl):
+    gwl.add(Fluent.Comment('test'))
+    for i,vol in enumerate([5, 10.5, 150]):
+        asp = Fluent.Aspirate()
+        asp.RackLabel = 'source'
+        asp.RackType = '96 Well Eppendorf TwinTec PCR'
+        asp.Position = i + 1
+        asp.Volume = vol
+        gwl.add(asp)
+        disp = Fluent.Dispense()
+        disp.RackLabel = 'dest'
+        disp.RackType = '96 Well Eppendorf TwinTec PCR'
+        disp.Position = i + 1
+        disp.Volume = vol
+        gwl.add(disp)
+        gwl.add(Fluent.Waste())
+    gwl.add(Fluent.Break())
+    
+def test_gwl_columnar(tmp_path):
+    TipTypes = ['FCA, 1000ul SBS', 'FCA, 200ul SBS',
+                'FCA, 50ul SBS', 'FCA, 10ul SBS']
+    gwl_obj = Fluent.gwl(TipTypes)
+    gwl_col = Fluent.gwl(TipTypes, columnar=True)
+    _add_commands(gwl_obj)
+    _add_commands(gwl_col)
+    assert isinstance(gwl_col.commands, Fluent.command_store)
+    assert len(gwl_col.list_commands()) == len(gwl_obj.list_commands())
+    assert [x.cmd() for x in gwl_col.commands] == [x.cmd() for x in gwl_obj.commands]
+    assert gwl_col.commands[-1].cmd() == 'B;'
+    # same labware
+    lw_obj = Labware.labware()
+    lw_obj.add_gwl(gwl_obj)
+    lw_col = Labware.labware()
+    lw_col.add_gwl(gwl_col)
+    assert lw_obj.table().equals(lw_col.table())
+    # same file
+    f_obj = os.path.join(str(tmp_path), 'obj.gwl')
+    f_col = os.path.join(str(tmp_path), 'col.gwl')
+    gwl_obj.write(f_obj)
+    gwl_col.write(f_col)
+    with open(f_obj) as inF1, open(f_col) as inF2:
+        assert inF1.read() == inF2.read()
+
+def test_render_commands():
+    TipTypes = ['FCA, 1000ul SBS', 'FCA, 200ul SBS',
+                'FCA, 50ul SBS', 'FCA, 10ul SBS']
+    gwl_obj = Fluent.gwl(TipTypes)
+    gwl_col = Fluent.gwl(TipTypes, columnar=True)
+    _add_commands(gwl_obj)
+    _add_commands(gwl_col)
+    txt = ''.join([x.cmd() + '\n' for x in gwl_obj.commands])
+    assert Fluent.render_commands(gwl_obj.commands) == txt
+    assert Fluent.render_commands(gwl_col.commands) == txt
+    assert Fluent.render_commands(gwl_col.commands, 1, 3) == \
+        Fluent.render_commands(gwl_obj.commands, 1, 3)
+    assert Fluent.render_commands([]) == ''
+
+def test_gwl_stream(tmp_path):
+    TipTypes = ['FCA, 1000ul SBS', 'FCA, 200ul SBS',
+                'FCA, 50ul SBS', 'FCA, 10ul SBS']
+    f_obj = os.path.join(str(tmp_path), 'obj.gwl')
+    f_str = os.path.join(str(tmp_path), 'stream.gwl')
+    gwl_obj = Fluent.gwl(TipTypes)
+    gwl_str = Fluent.gwl(TipTypes, stream=f_str, buffer_size=2)
+    _add_commands(gwl_obj)
+    _add_commands(gwl_str)
+    # commands are not stored when streaming
+    assert len(gwl_str.commands) == 0
+    # same labware
+    lw_obj = Labware.labware()
+    lw_obj.add_gwl(gwl_obj)
+    lw_str = Labware.labware()
+    lw_str.add_gwl(gwl_str)
+    assert lw_obj.table().equals(lw_str.table())
+    # same file
+    gwl_obj.write(f_obj)
+    gwl_str.write()
+    with open(f_obj) as inF1, open(f_str) as inF2:
+        assert inF1.read() == inF2.read()
+
+def test_gwl_write_crlf(tmp_path):
+    gwl = Fluent.gwl(['FCA, 1000ul SBS', 'FCA, 200ul SBS',
+                      'FCA, 50ul SBS', 'FCA, 10ul SBS'])
+    _add_commands(gwl)
+    f_unix = os.path.join(str(tmp_path), 'unix.gwl')
+    f_win = os.path.join(str(tmp_path), 'win.gwl')
+    gwl.write(f_unix)
+    gwl.write(f_win, line_ending='\r\n')
+    with open(f_unix, 'rb') as inF1, open(f_win, 'rb') as inF2:
+        assert inF1.read().replace(b'\n', b'\r\n') == inF2.read()
+
+def test_parse_gwl(tmp_path):
+    gwl_file = os.path.join(str(tmp_path), 'test.gwl')
+    gwl = Fluent.gwl(['FCA, 1000ul SBS', 'FCA, 200ul SBS',
+                      'FCA, 50ul SBS', 'FCA, 10ul SBS'])
+    _add_commands(gwl)
+    gwl.write(gwl_file)
+    records = list(Fluent.parse_gwl(gwl_file))
+    assert [x.ID for x in records] == [x.cmd()[0] for x in gwl.commands]
+    assert records[1].line_num == 2
+    assert records[1].values['RackLabel'] == 'source'
+    assert records[1].values['Volume'] == '5'
+    assert all([x.error is None for x in records])
+    assert list(Fluent.validate_gwl(records)) == []
+
+def test_read_gwl(tmp_path):
+    gwl_file = os.path.join(str(tmp_path), 'test.gwl')
+    gwl = Fluent.gwl(['FCA, 1000ul SBS', 'FCA, 200ul SBS',
+                      'FCA, 50ul SBS', 'FCA, 10ul SBS'])
+    _add_commands(gwl)
+    gwl.write(gwl_file)
+    gwl_new = Fluent.read_gwl(gwl_file)
+    assert [x.cmd() for x in gwl_new.commands] == [x.cmd() for x in gwl.commands]
+    lw = Labware.labware()
+    lw.add_gwl(gwl)
+    lw_new = Labware.labware()
+    lw_new.add_gwl(gwl_new)
+    assert lw.table().equals(lw_new.table())
+    # TipType re-derived
+    gwl_new = Fluent.read_gwl(gwl_file, TipTypes=['FCA, 1000ul SBS'])
+    assert gwl_new.commands[1].TipType == 'FCA, 1000ul SBS'
+    with pytest.raises(ValueError):
+        Fluent.read_gwl(['A;src;;;1;;5'])
+    # blank labware types (eg., legacy 10-field files)
+    for x,field in [('basic_96well.gwl', 'Line 2: RackType is blank'),
+                    ('multi_dispense.gwl', 'Line 1: RackType is blank'),
+                    ('reagent_dispense.gwl', 'Line 1: SrcRackType is blank')]:
+        f = os.path.join(data_dir, x)
+        assert list(Fluent.validate_gwl(Fluent.parse_gwl(f))) == []
+        with pytest.raises(ValueError, match=field):
+            Fluent.read_gwl(f)
+    lines = ['A;src;;96 Well Eppendorf TwinTec PCR;1;;5;;;',
+             'D;dest;;96 Well Eppendorf TwinTec PCR;1;;5;;;']
+    gwl_new = Fluent.read_gwl(lines)
+    assert gwl_new.commands[1].ForceRackType is None
+
+def test_validate_gwl():
+    lines = ['A;src;;96 Well Eppendorf TwinTec PCR;1;;150;Water Free Single;FCA, 50ul SBS;;',
+             'D;dest;;96 Well Eppendorf TwinTec PCR;1;;160;Not a class;;;',
+             'W;',
+             'A;src;;96 Well Eppendorf TwinTec PCR;1;;5',
+             'D;dest;;96 Well Eppendorf TwinTec PCR;1;;5;;;;']
+    errors = list(Fluent.validate_gwl(Fluent.parse_gwl(lines)))
+    errors = [(x[0], x[1].split(' (')[0].split(':')[0]) for x in errors]
+    assert errors == [(1, 'Volume in tip'),
+                      (2, 'Liquid class not in database'),
+                      (2, 'Dispensed volume'),
+                      (4, 'Aspirate/dispense commands must have 10 or 11 fields; found 7'),
+                      (5, 'Dispense without a preceding aspirate')]
+
+def test_gwl_RackType_index():
+    gwl = Fluent.gwl(['FCA, 1000ul SBS', 'FCA, 200ul SBS',
+                      'FCA, 50ul SBS', 'FCA, 10ul SBS'])
+    _add_commands(gwl)
+    RackType = '96 Well Eppendorf TwinTec PCR'
+    assert gwl.RackType_count(RackType) == 2
+    assert gwl.RackType_count('384 Well Biorad PCR') == 0
+    assert gwl.RackLabels(RackType) == ['source', 'dest']
+    offsets = gwl.RackLabel_offsets('dest')
+    assert offsets == [2, 5, 8]
+    assert all([gwl.commands[i].RackLabel == 'dest' for i in offsets])
+    assert gwl.is_tube('1.5ml Eppendorf') is True
+    assert gwl.is_tube(RackType) is False
+
+def test_add_transfers():
+    TipTypes = ['FCA, 1000ul SBS', 'FCA, 200ul SBS',
+                'FCA, 50ul SBS', 'FCA, 10ul SBS']
+    df = pd.DataFrame({'dest_position' : [1, 2, 3],
+                       'volume' : [5.0, 10.5, 150.0]})
+    gwl = Fluent.gwl(TipTypes)
+    gwl.add_transfers(df,
+                      src_labware_name='source',
+                      src_labware_type='100ml_1',
+                      src_target_position=1,
+                      dest_labware_name='dest',
+                      dest_labware_type='96 Well Eppendorf TwinTec PCR',
+                      dest_target_position='dest_position',
+                      volume='volume',
+                      n_tip_reuse=2)
+    cmds = [x.cmd()[0] for x in gwl.commands]
+    assert cmds == ['A', 'D', 'A', 'D', 'W', 'A', 'D', 'W']
+    asp = gwl.commands[5]
+    assert asp.Volume == 150.0
+    assert asp.TipType == 'FCA, 200ul SBS'
+    assert gwl.commands[6].Position == 3
+    # labware types checked
+    with pytest.raises(KeyError):
+        gwl.add_transfers(df, 'source', 'NOT_LABWARE', 1,
+                          'dest', '96 Well Eppendorf TwinTec PCR',
+                          'dest_position', 'volume')
+
+def test_add_transfers_columnar(tmp_path):
+    TipTypes = ['FCA, 1000ul SBS', 'FCA, 200ul SBS',
+                'FCA, 50ul SBS', 'FCA, 10ul SBS']
+    # int & float volumes
+    df = pd.DataFrame({'dest_position' : [1, 2, 3, 4, 5],
+                       'volume' : pd.Series([5, 10.5, 150.0, 20, 7], dtype=object)})
+    f_str = os.path.join(str(tmp_path), 'stream.gwl')
+    gwls = [Fluent.gwl(TipTypes), Fluent.gwl(TipTypes, columnar=True),
+            Fluent.gwl(TipTypes, stream=f_str, buffer_size=3)]
+    for gwl in gwls:
+        gwl.add(Fluent.Comment('Transfers'))
+        gwl.add_transfers(df, 'source', '100ml_1', 1, 'dest',
+                          '96 Well Eppendorf TwinTec PCR', 'dest_position',
+                          'volume', n_tip_reuse=2, flush=True)
+    gwl_obj,gwl_col,gwl_str = gwls
+    txt = Fluent.render_commands(gwl_obj.commands)
+    assert Fluent.render_commands(gwl_col.commands) == txt
+    assert 'A;source;;100ml_1;1;;5;' in txt
+    gwl_str.write()
+    with open(f_str) as inF:
+        assert inF.read() == txt
+    for gwl in gwls[1:]:
+        assert gwl.labware.tip_count == gwl_obj.labware.tip_count
+        assert gwl.last_asp.cmd() == gwl_obj.last_asp.cmd()
+    assert gwl_col.RackLabel_offsets('dest') == gwl_obj.RackLabel_offsets('dest')
+    # offsets are not indexed when streaming
+    assert gwl_str._RackLabel_offsets == {}
+    with pytest.raises(ValueError):
+        gwl_str.RackLabel_offsets('dest')
+
+def _water_transfers(gwl, volumes):
+    df = pd.DataFrame({'dest_position' : list(range(1, len(volumes) + 1)),
+                       'volume' : volumes})
+    gwl.add_transfers(df,
+                      src_labware_name='water',
+                      src_labware_type='25ml_1 waste',
+                      src_target_position=1,
+                      dest_labware_name='dest',
+                      dest_labware_type='96 Well Eppendorf TwinTec PCR',
+                      dest_target_position='dest_position',
+                      volume='volume',
+                      liq_cls='Water Free Single')
+
+def test_optimize_multi_disp():
+    gwl = Fluent.gwl(['FCA, 200ul SBS', 'FCA, 50ul SBS'])
+    gwl.add(Fluent.Comment('Water'))
+    _water_transfers(gwl, [10.0, 20.0, 30.0, 150.0, 100.0])
+    assert gwl.optimize_multi_disp(n_multi_disp=3) == 1
+    cmds = [x.cmd() for x in gwl.commands]
+    assert [x[0] for x in cmds] == ['C', 'A', 'D', 'D', 'D', 'W',
+                                    'A', 'D', 'W', 'A', 'D', 'W']
+    # 10% excess per aspirate (disp_frac=0.9)
+    assert gwl.commands[1].Volume == 66.0
+    assert sum([x.Volume for x in gwl.commands[2:5]]) == 60.0
+    assert gwl.commands[1].TipType == 'FCA, 200ul SBS'
+    assert gwl.commands[1].LiquidClass == 'Water Free Multi'
+    assert gwl.commands[2].LiquidClass == 'Water Free Multi'
+    assert gwl.labware.tip_count == {'FCA, 200ul SBS' : 3}
+    assert gwl.RackLabel_offsets('water') == [1, 6, 9]
+    assert list(Fluent.validate_gwl(Fluent.parse_gwl(cmds))) == []
+
+def test_optimize_multi_disp_max_volume():
+    # aspirate volume == max DTH volume (170 ul) => not in 1 aspirate
+    gwl = Fluent.gwl(['FCA, 200ul SBS', 'FCA, 50ul SBS'])
+    _water_transfers(gwl, [85.0, 85.0])
+    assert gwl.optimize_multi_disp() == 1
+    assert [x.cmd()[0] for x in gwl.commands] == ['A', 'D', 'W', 'A', 'D', 'W']
+    assert [x.TipType for x in gwl.commands if isinstance(x, Fluent.Aspirate)] == \
+        ['FCA, 200ul SBS', 'FCA, 200ul SBS']
+    gwl = Fluent.gwl(['FCA, 200ul SBS', 'FCA, 50ul SBS'])
+    _water_transfers(gwl, [85.0] * 4)
+    assert gwl.optimize_multi_disp(reagent_distribution=True) == 1
+    assert gwl.commands[0].NoOfMultiDisp == 1
+    gwl = Fluent.gwl(['FCA, 1000ul SBS'])
+    _water_transfers(gwl, [250.0] * 4)
+    assert gwl.optimize_multi_disp() == 1
+    assert [x.Volume for x in gwl.commands if isinstance(x, Fluent.Aspirate)] == [825.0, 275.0]
+    # no excess
+    gwl_nx = Fluent.gwl(['FCA, 1000ul SBS'])
+    _water_transfers(gwl_nx, [250.0] * 4)
+    assert gwl_nx.optimize_multi_disp(disp_frac=1) == 1
+    assert [x.Volume for x in gwl_nx.commands if isinstance(x, Fluent.Aspirate)] == [750.0, 250.0]
+    # the excess counts towards the max DTH volume: 2 x 80 ul * 1.1 > 170 ul
+    gwl_nx = Fluent.gwl(['FCA, 200ul SBS', 'FCA, 50ul SBS'])
+    _water_transfers(gwl_nx, [80.0, 80.0])
+    assert gwl_nx.optimize_multi_disp() == 1
+    assert [x.Volume for x in gwl_nx.commands if isinstance(x, Fluent.Aspirate)] == [88.0, 88.0]
+    # commands are kept if the rebuild fails
+    cmds = list(gwl.commands)
+    asp = Fluent.Aspirate()
+    asp.RackLabel = 'water'
+    asp.RackType = '25ml_1 waste'
+    asp.Volume = 1000.0
+    with pytest.raises(ValueError):
+        gwl._rebuild(cmds + [asp])
+    assert list(gwl.commands) == cmds
+    assert gwl.labware.tip_count == {'FCA, 1000ul SBS' : 2}
+
+def test_optimize_reagent_distribution():
+    TipTypes = ['FCA, 1000ul SBS', 'FCA, 200ul SBS',
+                'FCA, 50ul SBS', 'FCA, 10ul SBS']
+    gwl = Fluent.gwl(TipTypes)
+    _water_transfers(gwl, [10.0] * 94)
+    assert gwl.optimize_multi_disp(reagent_distribution=True) == 1
+    assert len(gwl.commands) == 1
+    cmd = gwl.commands[0].cmd()
+    assert cmd.startswith('R;water;;25ml_1 waste;1;1;dest;;96 Well Eppendorf TwinTec PCR;1;96;10.0;Water Free Multi;1;6;0;')
+    assert cmd.endswith(';95;96')
+    # contact liquid classes are not rewritten
+    gwl = Fluent.gwl(TipTypes)
+    df = pd.DataFrame({'dest_position' : [1, 2], 'volume' : [5.0, 5.0]})
+    gwl.add_transfers(df, 'water', '25ml_1 waste', 1, 'dest',
+                      '96 Well Eppendorf TwinTec PCR', 'dest_position',
+                      'volume', liq_cls='Water Contact Wet Single')
+    assert gwl.optimize_multi_disp() == 0
+    assert len(gwl.commands) == 6
+
+def test_multi_disp():
+    md = Fluent.multi_disp()
+    md.SrcRackLabel = 'water'
+    md.SrcRackType = '25ml_1 waste'
+    md.DestRackLabel = 'dest'
+    md.DestRackType = '96 Well Eppendorf TwinTec PCR'
+    md.DestPositions = list(range(1, 8))
+    md.Volume = [10, 0, 10, 30, 10, 10.004, 0.001]
+    md.NoOfMultiDisp = 3
+    gwl = Fluent.gwl(['FCA, 200ul SBS', 'FCA, 50ul SBS'])
+    assert md.add(gwl, 0.95) == 2
+    cmds = [x.cmd().split(';') for x in gwl.commands]
+    assert [x[0] for x in cmds] == ['A', 'D', 'D', 'D', 'W', 'A', 'D', 'D', 'W']
+    # 0-volumes skipped
+    assert [int(x[4]) for x in cmds if x[0] == 'D'] == [1, 3, 4, 5, 6]
+    assert [float(x[6]) for x in cmds if x[0] == 'A'] == [52.5, 21.0]
+    assert cmds[0][8] == 'FCA, 200ul SBS'
+    # max DTH volume (42 ul) => <= 3 x 10 ul per aspirate
+    md.Volume = 10
+    md.NoOfMultiDisp = 6
+    gwl = Fluent.gwl(['FCA, 50ul SBS'])
+    assert md.add(gwl, 0.95) == 3
+    cmds = [x.cmd().split(';') for x in gwl.commands]
+    assert [x[0] for x in cmds].count('D') == 7
+    assert [float(x[6]) for x in cmds if x[0] == 'A'] == [31.5, 31.5, 10.5]
+
+def test_reagent_distribution_tips():
+    rd = Fluent.Reagent_distribution()
+    rd.SrcRackLabel = 'mastermix'
+    rd.SrcRackType = '25ml_1 waste'
+    rd.DestRackLabel = 'dest'
+    rd.DestRackType = '96 Well Eppendorf TwinTec PCR'
+    rd.DestPosEnd = 96
+    rd.Volume = 5
+    rd.NoOfMultiDisp = 5
+    rd.NoOfDiTiReuses = 2
+    # 12 wells per channel => 3 aspirates => 2 tips
+    assert rd.channel_counts().tolist() == [12] * 8
+    assert rd.aspirate_count() == 24
+    assert rd.tip_count() == 16
+    assert rd.tip_count(n_channels=4) == 4 * 3
+    # excluding row A (channel 1)
+    rd.ExcludedDestWell = ';'.join([str(x * 8 + 1) for x in range(12)])
+    assert rd.tip_count() == 14
+    # 384-well: 2 rows (48 wells) per channel => 10 aspirates => 5 tips
+    rd.ExcludedDestWell = None
+    rd.DestRackType = '384 Well Biorad PCR'
+    rd.DestPosEnd = 384
+    assert rd.tip_count() == 40
+    gwl = Fluent.gwl(['FCA, 200ul SBS', 'FCA, 50ul SBS'])
+    gwl.add(rd)
+    assert gwl.labware.tip_count == {'FCA, 50ul SBS' : 40}
+
+def test_schedule_channels():
+    TipTypes = ['FCA, 1000ul SBS', 'FCA, 200ul SBS',
+                'FCA, 50ul SBS', 'FCA, 10ul SBS']
+    # 96-well: 1 row per channel
+    gwl = Fluent.gwl(TipTypes)
+    _water_transfers(gwl, [10.0] * 10)
+    assert gwl.schedule_channels() == 2
+    cmds = [x.cmd().split(';') for x in gwl.commands]
+    assert [x[0] for x in cmds[:17]] == ['A'] * 8 + ['D'] * 8 + ['W']
+    assert [int(x[9]) for x in cmds[:8]] == [1, 2, 4, 8, 16, 32, 64, 128]
+    assert [x[9] for x in cmds[8:16]] == [x[9] for x in cmds[:8]]
+    assert [int(x[4]) for x in cmds[8:16]] == list(range(1, 9))
+    assert [x[0] for x in cmds[17:]] == ['A', 'A', 'D', 'D', 'W']
+    assert gwl.labware.tip_count == {'FCA, 50ul SBS' : 10}
+    assert list(Fluent.validate_gwl(Fluent.parse_gwl([x.cmd() for x in gwl.commands]))) == []
+    # 384-well: every other row per channel
+    gwl = Fluent.gwl(TipTypes)
+    df = pd.DataFrame({'dest_position' : list(range(1, 17)),
+                       'volume' : [10.0] * 16})
+    gwl.add_transfers(df, 'water', '25ml_1 waste', 1, 'dest', '384 Well Biorad PCR',
+                      'dest_position', 'volume')
+    assert gwl.schedule_channels() == 2
+    positions = [x.Position for x in gwl.commands if isinstance(x, Fluent.Dispense)]
+    assert positions == list(range(1, 17, 2)) + list(range(2, 17, 2))
+    # tubes: no parallel transfers
+    gwl = Fluent.gwl(TipTypes)
+    gwl.add_transfers(df.iloc[:3], 'water', '25ml_1 waste', 1, 'dest',
+                      '1.5ml Eppendorf', 'dest_position', 'volume')
+    assert gwl.schedule_channels() == 0
+    assert all([x.TipMask is None for x in gwl.commands if isinstance(x, Fluent.Aspirate)])
+
+def test_add_transfers_stamp():
+    # column 2 => column 1 (aligned) + 1 irregular well
+    df = pd.DataFrame({'src_position' : list(range(9, 17)) + [20],
+                       'dest_position' : list(range(1, 9)) + [50]})
+    gwl = Fluent.gwl(['FCA, 200ul SBS', 'FCA, 50ul SBS'])
+    gwl.add_transfers(df, 'samples', '96 Well Eppendorf TwinTec PCR',
+                      'src_position', 'dest', '96 Well Eppendorf TwinTec PCR',
+                      'dest_position', 5.0, n_channels=8)
+    cmds = [x.cmd().split(';') for x in gwl.commands]
+    assert [x[0] for x in cmds] == ['A'] * 8 + ['D'] * 8 + ['W'] + ['A', 'D', 'W']
+    assert [int(x[9]) for x in cmds[:8]] == [1 << i for i in range(8)]
+    assert cmds[-2][9] == ''
+    assert gwl.labware.tip_count == {'FCA, 50ul SBS' : 9}
+    with pytest.raises(ValueError):
+        gwl.add_transfers(df, 'samples', '96 Well Eppendorf TwinTec PCR',
+                          'src_position', 'dest', '96 Well Eppendorf TwinTec PCR',
+                          'dest_position', 5.0, n_tip_reuse=2, n_channels=8)
+
+def test_add_transfers_mca():
+    # whole plate => 96-well plate + 1 extra well
+    df = pd.DataFrame({'position' : list(range(1, 97)) + [1]})
+    gwl = Fluent.gwl(['FCA, 200ul SBS', 'FCA, 50ul SBS'], mca=True)
+    gwl.add_transfers(df, 'samples', '96 Well Eppendorf TwinTec PCR',
+                      'position', 'dest', '96 Well Eppendorf TwinTec PCR',
+                      'position', 5.0, liq_cls='Water Free Single')
+    assert [x.cmd()[0] for x in gwl.commands] == ['C', 'A', 'D', 'W']
+    assert len(gwl.mca_commands) == 1
+    assert gwl.mca_commands[0].DestQuadrant == 1
+    assert gwl.mca_commands[0].TipType == 'MCA96, 50ul SBS'
+    assert gwl.labware.tip_count == {'MCA96, 50ul SBS' : 96, 'FCA, 50ul SBS' : 1}
+    # whole plate => 384-well quadrant B2
+    df = pd.DataFrame({'src_position' : list(range(1, 97))})
+    df['dest_position'] = [(x - 1) // 8 * 32 + (x - 1) % 8 * 2 + 18
+                           for x in df['src_position']]
+    gwl.add_transfers(df, 'samples', '96 Well Eppendorf TwinTec PCR',
+                      'src_position', 'dest384', '384 Well Biorad PCR',
+                      'dest_position', 100, liq_cls='Water Free Single')
+    df_mca = gwl.mca_table()
+    assert df_mca['Step'].tolist() == [1, 2]
+    assert df_mca['DestQuadrant'].tolist() == [1, 4]
+    assert df_mca['TipType'].tolist() == ['MCA96, 50ul SBS', 'MCA96, 150ul SBS']
+    lw = Labware.labware()
+    lw.add_gwl(gwl)
+    assert 'MCA96, 150ul SBS[001]' in lw.table()['labware_name'].tolist()
+    # partial plate => FCA only
+    gwl = Fluent.gwl(['FCA, 200ul SBS', 'FCA, 50ul SBS'], mca=True)
+    gwl.add_transfers(df.iloc[1:], 'samples', '96 Well Eppendorf TwinTec PCR',
+                      'src_position', 'dest384', '384 Well Biorad PCR',
+                      'dest_position', 5.0)
+    assert len(gwl.mca_commands) == 0
+    assert len(gwl.commands) == 95 * 3
+
+def test_set_TipTypes():
+    TipTypes = ['FCA, 1000ul SBS', 'FCA, 200ul SBS',
+                'FCA, 50ul SBS', 'FCA, 10ul SBS']
+    gwl = Fluent.gwl(TipTypes)
+    volumes = [0.5, 8, 8.1, 41.9, 42, 169.9, 170, 999]
+    RackTypes = ['100ml_1', '10ml Falcon'] * 4
+    x = [gwl.set_TipType(v, r) for v,r in zip(volumes, RackTypes)]
+    assert x[0] == 'FCA, 10ul SBS'
+    assert x[1] == 'FCA, 50ul SBS'    # min. tip for Falcon tube
+    assert list(gwl.set_TipTypes(volumes, RackTypes)) == x
+    x = [gwl.set_TipType(v) for v in volumes]
+    assert list(gwl.set_TipTypes(volumes)) == x
+    with pytest.raises(ValueError):
+        gwl.set_TipType(1000)
+    with pytest.raises(ValueError):
+        gwl.set_TipTypes([5, 1000])
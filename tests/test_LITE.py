@@ -32,6 +32,17 @@ def test_basic(script_runner, tmp_path):
                             output_prefix, conc_file)
     assert ret.success
     
+def test_win(script_runner, tmp_path):
+    output_prefix = os.path.join(str(tmp_path), 'win')
+    conc_file = os.path.join(data_dir, 'basic_96well.txt')
+    ret = script_runner.run('pyTecanFluent', 'LITE', '--prefix',
+                            output_prefix, '--win', conc_file)
+    assert ret.success
+    for x in ['_tag.gwl', '_pcr_map.txt', '_pcr_report.txt', '_BIORAD.txt']:
+        with open(output_prefix + x, 'rb') as inF:
+            txt = inF.read()
+        assert txt.count(b'\r\n') == txt.count(b'\n')
+
 def test_onePlate(script_runner, tmp_path):
     output_prefix = os.path.join(str(tmp_path), 'onePlate')
     conc_file = os.path.join(data_dir, 'LITE_1plate.xlsx')
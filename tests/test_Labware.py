@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# import
+## batteries
+import os
+import sys
+import pytest
+## 3rd party
+import numpy as np
+import pandas as pd
+## package
+from pyTecanFluent import Fluent
+from pyTecanFluent import Labware
+
+
+# tests
+def test_geometry():
+    for wells,(n_rows,n_cols) in Labware.PLATE_FORMATS.items():
+        geom = Labware.get_geometry(wells)
+        assert Labware.get_geometry(str(wells)) is geom
+        assert len(geom.well_ids) == wells == n_rows * n_cols
+        pos = np.arange(1, wells + 1)
+        assert (geom.well2position(geom.well_ids) == pos).all()
+        rows,cols = geom.position2well(pos)
+        assert cols[-1] == n_cols
+        assert rows[-1] == geom.row_ids[-1]
+    geom = Labware.get_geometry(1536)
+    assert geom.row_ids[26:].tolist() == ['AA', 'AB', 'AC', 'AD', 'AE', 'AF']
+    assert geom.well2position(['AF48', 'AA1']).tolist() == [1536, 27]
+    with pytest.raises(ValueError):
+        Labware.get_geometry(100)
+
+def test_utils():
+    lw_utils = Labware.utils()
+    assert lw_utils.position2well(1) == ['A', 1]
+    assert lw_utils.position2well(384, wells=384) == ['P', 24]
+    assert lw_utils.position2well(10, just_row=True) == 'B'
+    with pytest.raises(KeyError):
+        lw_utils.position2well(97)
+    assert lw_utils.well2position('B02') == 10
+    assert lw_utils.well2position('B2') == 10
+    assert lw_utils.well2position(12) == 12
+    with pytest.raises(KeyError):
+        lw_utils.well2position('I01')
+    # vectorized
+    rows,cols = lw_utils.positions2wells([1, 10, 96])
+    assert rows.tolist() == ['A', 'B', 'H']
+    assert cols.tolist() == [1, 2, 12]
+    RackTypes = ['96 Well Eppendorf TwinTec PCR', '384 Well Biorad PCR', '96 Well Eppendorf TwinTec PCR']
+    pos = lw_utils.wells2positions(['H12', 'P24', 5], RackTypes=RackTypes)
+    assert pos.tolist() == [96, 384, 5]
+    with pytest.raises(KeyError):
+        lw_utils.wells2positions(['A01'], RackTypes='not a RackType')
+
+def test_labware_n_channels():
+    gwl = Fluent.gwl(['FCA, 200ul SBS', 'FCA, 50ul SBS'])
+    rd = Fluent.Reagent_distribution()
+    rd.SrcRackLabel = 'water'
+    rd.SrcRackType = '25ml_1 waste'
+    rd.DestRackLabel = 'dest'
+    rd.DestRackType = '96 Well Eppendorf TwinTec PCR'
+    rd.DestPosEnd = 96
+    rd.Volume = 5
+    rd.NoOfMultiDisp = 5
+    rd.NoOfDiTiReuses = 2
+    gwl.add(rd)
+    TipType = gwl.commands[0].TipType
+    for n_channels in (8, 4):
+        lw = Labware.labware(n_channels=n_channels)
+        lw.add_gwl(gwl)
+        assert lw.tip_count == {TipType : rd.tip_count(n_channels)}
+    assert rd.tip_count(4) != rd.tip_count(8)
+
+def test_labware_tip_boxes():
+    # 96 tips => 1 tip box (no extra empty box)
+    for n,n_boxes in [(95, 1), (96, 1), (97, 2)]:
+        gwl = Fluent.gwl(['FCA, 200ul SBS', 'FCA, 50ul SBS'])
+        for i in range(n):
+            gwl.add_transfers(pd.DataFrame({'x' : [1]}), 'water', '100ml_1', 1,
+                              'dest', '96 Well Eppendorf TwinTec PCR', 1, 10)
+        lw = Labware.labware()
+        lw.add_gwl(gwl)
+        assert lw.tip_count == {'FCA, 50ul SBS' : n}
+        assert len(lw.tip_boxes) == n_boxes
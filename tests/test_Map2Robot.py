@@ -13,6 +13,7 @@ import pandas as pd
 ## package
 from pyTecanFluent import Fluent
 from pyTecanFluent import Map2Robot
+from pyTecanFluent import Simulator
 from pyTecanFluent import Utils
 
 
@@ -33,6 +34,114 @@ def test_basic(script_runner, tmp_path):
                             output_prefix, map_file)
     assert ret.success
 
+def test_win(script_runner, tmp_path):
+    output_prefix = os.path.join(str(tmp_path), 'win')
+    map_file = os.path.join(data_dir, 'basic_96well.txt')
+    ret = script_runner.run('pyTecanFluent', 'map2robot', '--prefix',
+                            output_prefix, '--win', map_file)
+    assert ret.success
+    for x in ['.gwl', '_labware.txt', '_map.txt', '_report.txt', '_BIORAD.csv']:
+        with open(output_prefix + x, 'rb') as inF:
+            txt = inF.read()
+        assert txt.count(b'\r\n') == txt.count(b'\n')
+
+def test_stamp(script_runner, tmp_path):
+    output_prefix = os.path.join(str(tmp_path), 'stamp')
+    map_file = os.path.join(data_dir, 'mapping_file_fecal_stability.txt')
+    ret = script_runner.run('pyTecanFluent', 'map2robot', '--prefix',
+                            output_prefix, '--rxns', '1', '--stamp', map_file)
+    assert ret.success
+    Utils.check_gwl(output_prefix + '.gwl')
+
+def test_runtime(script_runner, tmp_path):
+    output_prefix = os.path.join(str(tmp_path), 'runtime')
+    map_file = os.path.join(data_dir, 'mapping_file_fecal_stability.txt')
+    ret = script_runner.run('pyTecanFluent', 'map2robot', '--prefix',
+                            output_prefix, '--rxns', '1', '--runtime', map_file)
+    assert ret.success
+    df = pd.read_csv(output_prefix + '_runtime.txt', sep='\t')
+    assert df['stage'].tolist() == ['MasterMix', 'Primers', 'Samples', 'Water', 'Total']
+
+def test_mca(script_runner, tmp_path):
+    # whole primer plate (96 wells) => MCA96 stamp
+    output_prefix = os.path.join(str(tmp_path), 'mca')
+    df = pd.read_csv(os.path.join(data_dir, 'mapping_file_fecal_stability.txt'), sep='\t')
+    df = pd.concat([df, df.iloc[:96 - df.shape[0]]])
+    df['#SampleID'] = ['S{}'.format(i + 1) for i in range(96)]
+    df['TECAN_primer_target_position'] = list(range(1, 97))
+    map_file = os.path.join(str(tmp_path), 'map96.txt')
+    df.to_csv(map_file, sep='\t', index=False)
+    ret = script_runner.run('pyTecanFluent', 'map2robot', '--prefix',
+                            output_prefix, '--rxns', '1', '--mca', map_file)
+    assert ret.success
+    Utils.check_gwl(output_prefix + '.gwl')
+    df_mca = pd.read_csv(output_prefix + '_MCA.txt', sep='\t')
+    assert df_mca['SrcRackLabel'].tolist() == ['515F_806R']
+    df_lw = pd.read_csv(output_prefix + '_labware.txt', sep='\t')
+    assert 'MCA96, 50ul SBS[001]' in df_lw['labware_name'].tolist()
+
+def test_1536well(script_runner, tmp_path):
+    output_prefix = os.path.join(str(tmp_path), '1536well')
+    map_file = os.path.join(data_dir, 'mapping_file_fecal_stability.txt')
+    ret = script_runner.run('pyTecanFluent', 'map2robot', '--prefix',
+                            output_prefix, '--dest-type', '1536 Well Greiner PCR',
+                            '--pcr-volume', '5', '--mm-volume', '2.5',
+                            '--prm-volume', '0.5', map_file)
+    assert ret.success
+    Utils.check_gwl(output_prefix + '.gwl')
+    # default volumes => wells overfilled (10 ul max)
+    ret = script_runner.run('pyTecanFluent', 'map2robot', '--prefix',
+                            output_prefix, '--dest-type', '1536 Well Greiner PCR',
+                            map_file)
+    assert not ret.success
+    assert 'max well volume of the destination labware' in ret.stderr
+    # sample volumes also count
+    ret = script_runner.run('pyTecanFluent', 'map2robot', '--prefix',
+                            output_prefix, '--dest-type', '1536 Well Greiner PCR',
+                            '--pcr-volume', '8', '--mm-volume', '5',
+                            '--prm-volume', '0.5', map_file)
+    assert not ret.success
+    assert 'max well volume of the destination labware' in ret.stderr
+
+def test_water_first(script_runner, tmp_path):
+    map_file = os.path.join(data_dir, 'mapping_file_fecal_stability.txt')
+    gwls = {}
+    for x in ['', '--water-first', '--n-multi-disp 6 --water-first']:
+        output_prefix = os.path.join(str(tmp_path), 'water' + x.replace(' ', ''))
+        ret = script_runner.run('pyTecanFluent', 'map2robot', '--prefix',
+                                output_prefix, *x.split(), map_file)
+        assert ret.success
+        Utils.check_gwl(output_prefix + '.gwl')
+        gwls[x] = Fluent.read_gwl(output_prefix + '.gwl')
+    # same final well composition
+    comp = Simulator.composition(gwls[''])
+    for x in ['--water-first', '--n-multi-disp 6 --water-first']:
+        pd.testing.assert_frame_equal(Simulator.composition(gwls[x]), comp)
+    # fewer water tips
+    def n_water_tips(gwl):
+        txt = '\n'.join([x.cmd() for x in gwl.commands])
+        return txt.split('C;Water')[1].split('B;')[0].count('W;')
+    assert n_water_tips(gwls['']) == 273
+    assert n_water_tips(gwls['--water-first']) == 69
+    assert n_water_tips(gwls['--n-multi-disp 6 --water-first']) == 46
+    # multi-dispense aspirates include a 10% excess
+    asp,disp = None,0
+    for x in gwls['--n-multi-disp 6 --water-first'].commands:
+        if isinstance(x, Fluent.Aspirate) and x.RackLabel == '25ml_1[001]':
+            asp,disp = x.Volume,0
+        elif isinstance(x, Fluent.Dispense) and asp is not None:
+            disp += x.Volume
+        elif isinstance(x, Fluent.Waste) and asp is not None:
+            assert asp == pytest.approx(disp * 1.1, abs=0.01)
+            asp = None
+
+def test_add_dest():
+    df = pd.read_csv(os.path.join(data_dir, 'mapping_file_fecal_stability.txt'), sep='\t')
+    df = Map2Robot.add_dest(df, 'Dest', dest_start=90, rxn_reps=2)
+    assert df['TECAN_pcr_rxn_rep'].tolist()[:4] == [1, 2, 1, 2]
+    assert df['TECAN_dest_target_position'].tolist()[:8] == [90, 91, 92, 93, 94, 95, 96, 1]
+    assert df['TECAN_dest_labware_name'].tolist()[6:8] == ['Dest 1', 'Dest 2']
+
 def test_single_barcode(script_runner, tmp_path):
     output_prefix = os.path.join(str(tmp_path), 'single-barcode')
     map_file = os.path.join(data_dir, 'mapping_file_fecal_stability.txt')
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# import
+## batteries
+import os
+import sys
+import pytest
+## 3rd party
+import pandas as pd
+## package
+from pyTecanFluent import Fluent
+from pyTecanFluent import Runtime
+
+
+# data dir
+test_dir = os.path.join(os.path.dirname(__file__))
+data_dir = os.path.join(test_dir, 'data')
+
+# tests
+def _transfers(gwl, n, **kwargs):
+    df = pd.DataFrame({'position' : list(range(1, n + 1))})
+    gwl.add_transfers(df, 'samples', '96 Well Eppendorf TwinTec PCR',
+                      'position', 'dest', '96 Well Eppendorf TwinTec PCR',
+                      'position', 5.0, **kwargs)
+
+def test_estimate(tmp_path):
+    TipTypes = ['FCA, 200ul SBS', 'FCA, 50ul SBS']
+    gwl = Fluent.gwl(TipTypes)
+    gwl.add(Fluent.Comment('Samples'))
+    _transfers(gwl, 8)
+    df = Runtime.estimate(gwl)
+    assert df['stage'].tolist() == ['Samples', 'Total']
+    assert df['tips'].tolist() == [8, 8]
+    assert df['dispenses'].tolist() == [8, 8]
+    total = df['seconds'].iloc[-1]
+    assert total > 0
+    # parsed gwl file
+    gwl_file = os.path.join(str(tmp_path), 'samples.gwl')
+    gwl.write(gwl_file)
+    assert Runtime.estimate(gwl_file)['seconds'].iloc[-1] == total
+    # time model
+    df = Runtime.estimate(gwl, time_model={'tip_pickup' : 17.0})
+    assert df['seconds'].iloc[-1] == pytest.approx(total + 8 * 10)
+    with pytest.raises(KeyError):
+        Runtime.estimate(gwl, time_model={'tip_pick' : 17.0})
+    # parallel channels
+    gwl = Fluent.gwl(TipTypes)
+    _transfers(gwl, 8, n_channels=8)
+    df = Runtime.estimate(gwl)
+    assert df['tips'].iloc[-1] == 8
+    assert df['seconds'].iloc[-1] < total
+
+def test_estimate_mca_step():
+    # FCA transfers after a MCA96 step are counted under the previous stage
+    gwl = Fluent.gwl(['FCA, 200ul SBS', 'FCA, 50ul SBS'])
+    gwl.add(Fluent.Comment('Primers'))
+    gwl.add(Fluent.Comment('MCA96 step 1: primers => dest (quadrant 1)'))
+    _transfers(gwl, 2)
+    df = Runtime.estimate(gwl)
+    assert df['stage'].tolist() == ['Primers', 'MCA96 step 1: primers => dest (quadrant 1)', 'Total']
+    assert df['dispenses'].tolist() == [2, 0, 2]
+    assert df['seconds'].iloc[1] > 0
+
+def test_target_locations():
+    # 1 tip box location per tip type
+    gwl = Fluent.gwl(['FCA, 200ul SBS', 'FCA, 50ul SBS'])
+    _transfers(gwl, 2)
+    gwl.add_transfers(pd.DataFrame({'x' : [1]}), 'water', '100ml_1', 1,
+                      'dest', '96 Well Eppendorf TwinTec PCR', 1, 100)
+    locs = Runtime._target_locations(gwl)
+    assert locs['_tips', 'FCA, 50ul SBS'] == 'Nest7mm_Pos'
+    assert locs['_tips', 'FCA, 200ul SBS'] == 'Nest7mm_Pos'
+    assert '_tips' not in locs
+
+def test_format_time():
+    assert Runtime.format_time(0) == '0:00:00'
+    assert Runtime.format_time(3723.4) == '1:02:03'
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# import
+## batteries
+import os
+import sys
+import pytest
+## 3rd party
+import pandas as pd
+## package
+from pyTecanFluent import Fluent
+from pyTecanFluent import Simulator
+
+
+# data dir
+test_dir = os.path.join(os.path.dirname(__file__))
+data_dir = os.path.join(test_dir, 'data')
+
+# tests
+def _water_gwl(volumes, columnar=False):
+    df = pd.DataFrame({'position' : list(range(1, len(volumes) + 1)),
+                       'volume' : volumes})
+    gwl = Fluent.gwl(['FCA, 200ul SBS', 'FCA, 50ul SBS'], columnar=columnar)
+    gwl.add_transfers(df, 'water', '100ml_1', 1,
+                      'dest', '96 Well Eppendorf TwinTec PCR', 'position',
+                      'volume')
+    return gwl
+
+def test_simulate(tmp_path):
+    for columnar in (False, True):
+        gwl = _water_gwl([100, 150, 20], columnar=columnar)
+        gwl.add_transfers(pd.DataFrame({'x' : [1]}), 'water', '100ml_1', 1,
+                          'dest', '96 Well Eppendorf TwinTec PCR', 2, 100)
+        sim = Simulator.simulate(gwl)
+        assert not sim.ok
+        # 150 + 100 ul => 200 ul wells
+        assert sim.errors == [(11, 'Well 2 of "dest" exceeds the max volume: 250.0 > 200.0 ul')]
+        sources = sim.sources()
+        assert sources['labware_name'].tolist() == ['water']
+        assert sources['initial_volume'].tolist() == [370]
+        wells = sim.wells.loc[sim.wells['labware_name'] == 'dest']
+        assert wells['final_volume'].tolist() == [100, 250, 20]
+        assert sim.tips.values.tolist() == [['FCA, 200ul SBS High', 3, 96],
+                                            ['FCA, 50ul SBS High', 1, 96]]
+    # parsed gwl file & initial volumes
+    gwl = _water_gwl([10] * 3)
+    gwl_file = os.path.join(str(tmp_path), 'water.gwl')
+    gwl.write(gwl_file)
+    sim = Simulator.simulate(gwl_file, initial_volumes={'water' : 25})
+    assert sim.errors == [(7, 'Well 1 of "water" is depleted: 5.0 ul short')]
+
+def test_simulate_deck():
+    gwl = _water_gwl([10] * 96 + [10] * 96)
+    table = pd.DataFrame({'labware_name' : ['water', 'FCA, 50ul SBS High[001]'],
+                          'labware_type' : ['100ml_1', 'FCA, 50ul SBS High']})
+    sim = Simulator.simulate(gwl, labware_table=table)
+    assert sim.errors == [(2, 'Labware "dest" is not on the deck'),
+                          (97 * 3 - 2, 'Not enough "FCA, 50ul SBS High" tips: 96 tips on the deck')]
+
+def test_simulate_reagent_distribution():
+    gwl = Fluent.gwl(['FCA, 200ul SBS', 'FCA, 50ul SBS'])
+    rd = Fluent.Reagent_distribution()
+    rd.SrcRackLabel = 'mastermix'
+    rd.SrcRackType = '25ml_1 waste'
+    rd.DestRackLabel = 'dest'
+    rd.DestRackType = '96 Well Eppendorf TwinTec PCR'
+    rd.DestPosStart = 1
+    rd.DestPosEnd = 10
+    rd.ExcludedDestWell = '2;3'
+    rd.Volume = 20
+    gwl.add(rd)
+    sim = Simulator.simulate(gwl)
+    assert sim.ok
+    wells = sim.wells.loc[sim.wells['labware_name'] == 'dest']
+    assert wells['position'].tolist() == [1, 4, 5, 6, 7, 8, 9, 10]
+    assert sim.sources()['initial_volume'].tolist() == [160]
+
+def test_composition():
+    # same transfers, in a different order & with tip reuse
+    gwl1 = _water_gwl([10, 20, 30])
+    gwl1.add_transfers(pd.DataFrame({'x' : [1]}), 'sample', '1.5ml Eppendorf', 1,
+                       'dest', '96 Well Eppendorf TwinTec PCR', 2, 5)
+    gwl2 = Fluent.gwl(['FCA, 200ul SBS', 'FCA, 50ul SBS'])
+    gwl2.add_transfers(pd.DataFrame({'x' : [1]}), 'sample', '1.5ml Eppendorf', 1,
+                       'dest', '96 Well Eppendorf TwinTec PCR', 2, 5)
+    gwl2.add_transfers(pd.DataFrame({'position' : [3, 2, 1], 'volume' : [30, 20, 10]}),
+                       'water', '100ml_1', 1, 'dest', '96 Well Eppendorf TwinTec PCR',
+                       'position', 'volume', n_tip_reuse=3)
+    comp = Simulator.composition(gwl1)
+    pd.testing.assert_frame_equal(Simulator.composition(gwl2), comp)
+    x = comp.loc[comp['position'] == 2]
+    assert x['src_labware_name'].tolist() == ['sample', 'water']
+    assert x['volume'].tolist() == [5, 20]
+
+def test_composition_channels():
+    # parallel channel blocks (A x n, D x n, W) => same composition
+    def _samples_gwl():
+        gwl = Fluent.gwl(['FCA, 200ul SBS', 'FCA, 50ul SBS'])
+        df = pd.DataFrame({'position' : list(range(1, 17)),
+                           'volume' : [float(x) for x in range(1, 17)]})
+        gwl.add_transfers(df, 'samples', '96 Well Eppendorf TwinTec PCR', 'position',
+                          'dest', '96 Well Eppendorf TwinTec PCR', 'position', 'volume')
+        return gwl
+    gwl = _samples_gwl()
+    comp = Simulator.composition(gwl)
+    assert comp['src_position'].tolist() == comp['position'].tolist()
+    gwl_sch = _samples_gwl()
+    assert gwl_sch.schedule_channels() == 2
+    assert [x.cmd()[0] for x in gwl_sch.commands][:3] == ['A', 'A', 'A']
+    pd.testing.assert_frame_equal(Simulator.composition(gwl_sch), comp)
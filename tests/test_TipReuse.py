@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# import
+## batteries
+import os
+import sys
+import pytest
+## 3rd party
+import pandas as pd
+## package
+from pyTecanFluent import TipReuse
+
+
+# tests
+def test_tip_batch():
+    x = TipReuse.channel_order(20)
+    assert x.tolist() == list(range(8)) * 2 + [0, 1, 2, 3]
+    assert TipReuse.tip_batch(x, 1).tolist() == [0] * 8 + [1] * 8 + [2] * 4
+    assert TipReuse.tip_batch(x, 2).tolist() == [0] * 16 + [1] * 4
+    x,batch = TipReuse.channel_batches(10, n_tip_reuse=2, n_channels=4)
+    assert x.tolist() == [0, 1, 2, 3, 0, 1, 2, 3, 0, 1]
+    assert batch.tolist() == [0] * 8 + [1] * 2
+    assert TipReuse.tip_batch([]).tolist() == []
+
+def test_reorder_plate_n_tip_reuse():
+    df = pd.DataFrame({'position' : list(range(1, 11))})
+    # 10 dispenses, 2 reuses => 5 channels
+    x = TipReuse.reorder_plate_n_tip_reuse(df, 2)
+    assert x['position'].tolist() == [1, 6, 2, 7, 3, 8, 4, 9, 5, 10]
+    x = TipReuse.reorder_plate_n_tip_reuse(df, 2, n_channels=4)
+    assert x['position'].tolist() == [1, 5, 2, 6, 3, 7, 4, 8, 9, 10]
+    x = TipReuse.reorder_plate_n_tip_reuse(df, 1)
+    assert x['position'].tolist() == list(range(1, 11))
@@ -9,6 +9,7 @@ import pytest
 ## 3rd party
 import pandas as pd
 ## package
+from pyTecanFluent import Fluent
 from pyTecanFluent import Utils
 
 
@@ -51,3 +52,61 @@ def test_check_gwl():
     ret = Utils.check_gwl(gwl_file)
     assert ret is None
 
+def test_check_gwl_handle():
+    gwl_file = os.path.join(data_dir, 'multi_dispense.gwl')
+    with open(gwl_file) as inF:
+        ret = Utils.check_gwl(inF)
+    assert ret is None
+
+def test_check_gwl_errors(tmp_path):
+    gwl_file = os.path.join(str(tmp_path), 'bad.gwl')
+    with open(gwl_file, 'w') as outF:
+        outF.write('D;plate;;96 Well Eppendorf TwinTec PCR;1;;5;;;;\n')
+        outF.write('A;plate;;96 Well Eppendorf TwinTec PCR;97;;5;;;;\n')
+        outF.write('X;\n')
+    with pytest.raises(ValueError) as e:
+        Utils.check_gwl(gwl_file)
+    assert 'Line 1: Dispense without a preceding aspirate' in str(e.value)
+    assert 'Line 2: Position 97' in str(e.value)
+    assert 'Line 3: "X" not a valid command ID' in str(e.value)
+
+def test_reorder_384well():
+    gwl = Fluent.gwl(['FCA, 200ul SBS'])
+    for RackType,n_wells,pitch in [('384 Well Biorad PCR', 384, 2),
+                                   ('1536 Well Greiner PCR', 1536, 4),
+                                   ('96 Well Eppendorf TwinTec PCR', 96, 1)]:
+        df = pd.DataFrame({'name' : 'dest', 'type' : RackType,
+                           'position' : list(range(n_wells, 0, -1))})
+        df = Utils.reorder_384well(df, gwl, 'name', 'type', 'position')
+        pos = df['position'].values
+        if pitch == 1:
+            assert pos.tolist() == list(range(n_wells, 0, -1))
+            continue
+        # first pass: every pitch-th row
+        assert pos[:8].tolist() == [1 + pitch * i for i in range(8)]
+        offsets = Utils.channel_pitch_offsets(pos, n_wells)
+        assert (offsets[:-1] <= offsets[1:]).all()
+
+def test_reorder_strategies():
+    gwl = Fluent.gwl(['FCA, 200ul SBS'])
+    df = pd.DataFrame({'name' : ['p2'] * 4 + ['p1'] * 4,
+                       'type' : '384 Well Biorad PCR',
+                       'position' : [18, 17, 2, 1] * 2})
+    # odd/even
+    x = Utils.reorder_384well(df.copy(), gwl, 'name', 'type', 'position',
+                              strategy='odd_even')
+    assert x['name'].tolist() == ['p1'] * 4 + ['p2'] * 4
+    assert x['position'].tolist() == [1, 17, 2, 18] * 2
+    # quadrants: A1 (1), A2 (17), B1 (2), B2 (18)
+    x = Utils.reorder_384well(df.copy(), gwl, 'name', 'type', 'position',
+                              strategy='quadrant')
+    assert x['position'].tolist() == [1, 17, 2, 18] * 2
+    assert Utils.quadrant_offsets([1, 17, 2, 18], 384).tolist() == [0, 1, 2, 3]
+    assert Utils.quadrant_offsets([1, 5, 2, 33], 1536).tolist() == [0, 0, 4, 1]
+    # custom strategy
+    f = lambda positions, n_wells, n_channels: -positions
+    x = Utils.reorder_384well(df.copy(), gwl, 'name', 'type', 'position',
+                              strategy=f)
+    assert x['position'].tolist() == [18, 17, 2, 1] * 2
+    with pytest.raises(ValueError):
+        Utils.reorder_384well(df, gwl, 'name', 'type', 'position', strategy='x')